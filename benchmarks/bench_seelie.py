@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for seelie.
+
+Generates synthetic seelie configs with chains of nested references, whose
+paths are clones of local bare git repositories and local rsync directories,
+so that no network is needed. Times config parsing, xml_to_projects and
+Seelie construction, then Seelie.update and Seelie.push end to end, at
+several scales. The results are stored as JSON so that runs of different
+versions can be compared with --compare.
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as etree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import seelie
+
+# default directory for the results of each benchmark run
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        'results')
+
+# environment for the git commands, so that commits work without a user
+GIT_ENV = {
+        'GIT_AUTHOR_NAME': 'seelie bench',
+        'GIT_AUTHOR_EMAIL': 'bench@seelie.invalid',
+        'GIT_COMMITTER_NAME': 'seelie bench',
+        'GIT_COMMITTER_EMAIL': 'bench@seelie.invalid',
+        'GIT_CONFIG_NOSYSTEM': '1',
+        }
+
+def git(*args, cwd=None):
+    """
+    Runs a git command quietly and returns its output.
+    """
+    return subprocess.check_output(('git',) + args, cwd=cwd,
+            stderr=subprocess.DEVNULL).decode().strip()
+
+def parse_scale(text):
+    """
+    Parses a scale like "50x2" into the number of projects and the number of
+    paths in each.
+    """
+    projects, _, paths = text.lower().partition('x')
+    try:
+        return (int(projects), int(paths or 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError("bad scale: '%s'" % (text))
+
+def make_config(root, projects, paths, depth=4, rsync_every=0):
+    """
+    Returns a synthetic seelie XML config as a string. Projects are split
+    into chains of depth projects, where every project references the next
+    one and only the first is automatic. The paths are placed under root,
+    without creating anything.
+
+    Keyword arguments:
+    root -- directory of the working copies and rsync directories
+    projects -- number of projects
+    paths -- number of paths in each project
+    depth -- length of the chains of references
+    rsync_every -- makes every rsync_every-th path an rsync path, or none if 0
+    """
+    lines = ['<seelie>']
+    n = 0
+    for i in range(projects):
+        auto = 'true' if(i % depth == 0) else 'false'
+        lines.append('<project auto="%s"><name>p%d</name>' % (auto, i))
+        for j in range(paths):
+            if(rsync_every and n % rsync_every == rsync_every - 1):
+                lines.append('<path tool="rsync" origin="%s/">%s</path>' % (
+                    os.path.join(root, 'remote', 'r%d' % (n)),
+                    os.path.join(root, 'rsync', 'r%d' % (n))))
+            else:
+                lines.append('<path tool="git">%s</path>' % (
+                    os.path.join(root, 'wc', 'g%d' % (n))))
+            n += 1
+        if((i + 1) % depth and i + 1 < projects):
+            lines.append('<reference>p%d</reference>' % (i + 1))
+        lines.append('</project>')
+    lines.append('</seelie>')
+    return '\n'.join(lines) + '\n'
+
+def make_targets(root, projects, paths, rsync_every=0, files=4):
+    """
+    Creates the bare repositories, working copies and rsync directories used
+    by a config made by make_config with the same arguments. Returns the
+    list of bare repositories.
+    """
+    seed = os.path.join(root, 'seed')
+    os.makedirs(seed)
+    git('init', '-q', seed)
+    git('checkout', '-q', '-b', 'master', cwd=seed)
+    for k in range(files):
+        with open(os.path.join(seed, 'file%d' % (k)), 'w') as f:
+            f.write('seelie benchmark file %d\n' % (k) * 64)
+    git('add', '--all', cwd=seed)
+    git('commit', '-q', '-m', 'seed', cwd=seed)
+    bares = []
+    for n in range(projects * paths):
+        if(rsync_every and n % rsync_every == rsync_every - 1):
+            remote = os.path.join(root, 'remote', 'r%d' % (n))
+            shutil.copytree(seed, remote, ignore=shutil.ignore_patterns(
+                '.git'))
+            os.makedirs(os.path.join(root, 'rsync', 'r%d' % (n)))
+            continue
+        bare = os.path.join(root, 'bare', 'g%d.git' % (n))
+        git('clone', '-q', '--bare', seed, bare)
+        git('clone', '-q', bare, os.path.join(root, 'wc', 'g%d' % (n)))
+        bares.append(bare)
+    return bares
+
+def advance(bares):
+    """
+    Adds an empty commit on top of master in each bare repository, so that
+    the next update has something to pull.
+    """
+    for bare in bares:
+        sha = git('commit-tree', 'master^{tree}', '-p', 'master', '-m',
+                'bench', cwd=bare)
+        git('update-ref', 'refs/heads/master', sha, cwd=bare)
+
+def touch(root, stamp):
+    """
+    Changes a file in every working copy and rsync directory, so that the
+    next push has something to send.
+    """
+    for path in glob.glob(os.path.join(root, 'wc', '*')) + glob.glob(
+            os.path.join(root, 'rsync', '*')):
+        with open(os.path.join(path, 'file0'), 'a') as f:
+            f.write('%s\n' % (stamp))
+
+def last_report(directory):
+    """
+    Returns the newest JSON report written by seelie in directory, or None.
+    """
+    reports = sorted(glob.glob(os.path.join(directory, '*.json')))
+    if(not reports):
+        return None
+    with open(reports[-1]) as f:
+        return json.load(f)
+
+def timed(function, repeat):
+    """
+    Calls function repeat times and returns the statistics of the wall times.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {
+            'repeat': repeat,
+            'min': min(times),
+            'median': statistics.median(times),
+            'mean': statistics.mean(times),
+            }
+
+def bench_parse(projects, paths, depth, repeat):
+    """
+    Times parsing a synthetic config, xml_to_projects and constructing a
+    Seelie object, without creating any paths.
+    """
+    root = tempfile.mkdtemp(prefix='seelie-bench-')
+    try:
+        filename = os.path.join(root, 'config.xml')
+        with open(filename, 'w') as f:
+            f.write(make_config(root, projects, paths, depth))
+        tree = etree.parse(filename)
+        return {
+                'parse': timed(lambda: etree.parse(filename), repeat),
+                'xml_to_projects': timed(lambda: seelie.Seelie.xml_to_projects(
+                    tree), repeat),
+                'construct': timed(lambda: seelie.Seelie(tree,
+                    multiplex=False, state_file=None, report_dir=None,
+                    log_dir=None, manifest_dir=None),
+                    repeat),
+                }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def bench_sync(projects, paths, depth, repeat, jobs, rsync_every):
+    """
+    Times Seelie.update with nothing to pull and with a new commit in every
+    repository, and Seelie.push with a changed file in every path.
+    """
+    root = tempfile.mkdtemp(prefix='seelie-bench-')
+    try:
+        filename = os.path.join(root, 'config.xml')
+        with open(filename, 'w') as f:
+            f.write(make_config(root, projects, paths, depth, rsync_every))
+        start = time.perf_counter()
+        bares = make_targets(root, projects, paths, rsync_every)
+        setup = time.perf_counter() - start
+        reports = os.path.join(root, 'reports')
+
+        def make_seelie():
+            return seelie.Seelie(etree.parse(filename), multiplex=False,
+                    state_file=os.path.join(root, 'state.json'),
+                    report_dir=reports, log_dir=os.path.join(root, 'logs'),
+                    journal_dir=os.path.join(root, 'journal'),
+                    manifest_dir=os.path.join(root, 'manifests'))
+
+        results = {'setup': setup}
+        for name, prepare, run in (
+                ('update_unchanged', None,
+                    lambda s: s.update(verbose=False, jobs=jobs)),
+                ('update', lambda i: advance(bares),
+                    lambda s: s.update(verbose=False, jobs=jobs)),
+                ('push', lambda i: touch(root, i),
+                    lambda s: s.push(verbose=False, jobs=jobs)),
+                ):
+            times = []
+            errors = 0
+            for i in range(repeat):
+                s = make_seelie()
+                if prepare is not None:
+                    prepare(i)
+                start = time.perf_counter()
+                run(s)
+                times.append(time.perf_counter() - start)
+                report = last_report(reports)
+                if report is not None:
+                    errors += report['errors']
+            results[name] = {
+                    'repeat': repeat,
+                    'min': min(times),
+                    'median': statistics.median(times),
+                    'mean': statistics.mean(times),
+                    'errors': errors,
+                    }
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def version():
+    """
+    Returns the git revision of the seelie being benchmarked, or None.
+    """
+    try:
+        return git('describe', '--always', '--dirty',
+                cwd=os.path.dirname(os.path.abspath(seelie.__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old, new, file=sys.stdout):
+    """
+    Prints the median times of new next to those of old, with their ratios.
+    """
+    print('%-28s %12s %12s %8s' % ('benchmark', 'old', 'new', 'ratio'),
+            file=file)
+    for kind in ('parse', 'sync'):
+        for scale, results in sorted(new.get(kind, {}).items()):
+            for name, result in sorted(results.items()):
+                if(not isinstance(result, dict)):
+                    continue
+                before = old.get(kind, {}).get(scale, {}).get(name)
+                key = '%s %s' % (scale, name)
+                if(not before):
+                    print('%-28s %12s %12.4f' % (key, '-', result['median']),
+                            file=file)
+                    continue
+                ratio = result['median'] / before['median'] \
+                        if before['median'] else float('inf')
+                print('%-28s %12.4f %12.4f %8.2f' % (key, before['median'],
+                    result['median'], ratio), file=file)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks seelie on "
+            "synthetic configs with local repositories")
+    parser.add_argument("-s", "--scale", metavar="PxM", type=parse_scale,
+            action="append", help="number of projects and paths in each "
+            "for the update and push benchmarks. Defaults to 10x1, 25x2 "
+            "and 50x4.")
+    parser.add_argument("--parse-scale", metavar="PxM", type=parse_scale,
+            action="append", help="scales for the parsing benchmarks, which "
+            "create no paths. Defaults to 100x4, 1000x4 and 10000x4.")
+    parser.add_argument("-d", "--depth", type=int, default=4,
+            help="length of the chains of references. Defaults to 4.")
+    parser.add_argument("-n", "--repeat", type=int, default=3,
+            help="times to repeat each benchmark. Defaults to 3.")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+            help="jobs passed to update and push. Defaults to 1.")
+    parser.add_argument("--rsync-every", metavar="N", type=int, default=4,
+            help="makes every Nth path an rsync path, or none if 0. Defaults "
+            "to 4, and to 0 if rsync isn't installed.")
+    parser.add_argument("--no-sync", dest="sync", action="store_false",
+            help="only run the parsing benchmarks")
+    parser.add_argument("-o", "--output", metavar="DIR", default=RESULTS_DIR,
+            help="directory for the results. Default is '%s'" % (
+                RESULTS_DIR))
+    parser.add_argument("--compare", metavar="FILE",
+            help="earlier results to compare with, or 'last' for the newest "
+            "results in the output directory")
+    args = parser.parse_args()
+
+    scales = args.scale or [(10, 1), (25, 2), (50, 4)]
+    parse_scales = args.parse_scale or [(100, 4), (1000, 4), (10000, 4)]
+    rsync_every = args.rsync_every
+    if(rsync_every and shutil.which('rsync') is None):
+        print('rsync not found, benchmarking git paths only',
+                file=sys.stderr)
+        rsync_every = 0
+    os.environ.update(GIT_ENV)
+
+    # find the results to compare with before writing the new ones
+    old = None
+    if(args.compare == 'last'):
+        files = sorted(glob.glob(os.path.join(args.output, '*.json')))
+        args.compare = files[-1] if files else None
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+
+    results = {
+            'version': version(),
+            'time': time.strftime('%FT%T%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'depth': args.depth,
+            'jobs': args.jobs,
+            'rsync_every': rsync_every,
+            'parse': {},
+            'sync': {},
+            }
+    for projects, paths in parse_scales:
+        scale = '%dx%d' % (projects, paths)
+        print('parse %s...' % (scale), file=sys.stderr)
+        results['parse'][scale] = bench_parse(projects, paths, args.depth,
+                args.repeat)
+    if args.sync:
+        for projects, paths in scales:
+            scale = '%dx%d' % (projects, paths)
+            print('sync %s...' % (scale), file=sys.stderr)
+            results['sync'][scale] = bench_sync(projects, paths, args.depth,
+                    args.repeat, args.jobs, rsync_every)
+
+    os.makedirs(args.output, exist_ok=True)
+    base = os.path.join(args.output, '%s-%s' % (
+        time.strftime('%Y%m%dT%H%M%S'), results['version'] or 'unknown'))
+    filename = base + '.json'
+    n = 1
+    while os.path.exists(filename):
+        n += 1
+        filename = '%s-%d.json' % (base, n)
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    print('results written to %s' % (filename), file=sys.stderr)
+    compare(old or {}, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,90 @@ import os
 import subprocess
 import socket
 import time
+import concurrent.futures
+import functools
+import asyncio
+import threading
+import tempfile
+import hashlib
+import shlex
+import shutil
+import urllib.parse
+import json
+import ctypes
+import ctypes.util
+import select
+import selectors
+import struct
+import errno
+import marshal
+import heapq
+import signal
+import random
+import contextvars
+import re
+import queue
+
+# default file with information kept between runs
+STATE_FILE = '~/.seelie/state.json'
+# default directory for caches of parsed config files
+CACHE_DIR = '~/.seelie/cache'
+# default directory for the reports of each run
+REPORT_DIR = '~/.seelie/reports'
+# default directory for the logs of each run
+LOG_DIR = '~/.seelie/logs'
+# default directory for the journals of finished paths, for resuming runs
+JOURNAL_DIR = '~/.seelie/journal'
+# default directory for the manifests of the files last pushed by rsync
+MANIFEST_DIR = '~/.seelie/manifests'
+# default directory for the bare mirrors that working copies borrow objects from
+MIRROR_DIR = '~/.seelie/mirrors'
+
+
+class Writer(object):
+
+    """
+    Writes everything shown on the terminal, one whole message at a time so
+    that messages from concurrent paths don't get mixed up. Colors are left
+    out of files that aren't terminals.
+    """
+
+    # control sequences, like colors and the line erasing of progress
+    escape_re = re.compile('\033\\[[0-9;?]*[A-Za-z]')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # dict of files to whether they're terminals
+        self.ttys = {}
+
+    def isatty(self, file):
+        """
+        Returns True if file is a terminal.
+        """
+        tty = self.ttys.get(file)
+        if tty is None:
+            try:
+                tty = file.isatty()
+            except (AttributeError, ValueError):
+                tty = False
+            self.ttys[file] = tty
+        return tty
+
+    def write(self, file, text, flush=False):
+        """
+        Writes text to file, flushing it if flush is True.
+        """
+        if file is None:
+            file = sys.stdout
+        if(not self.isatty(file)):
+            text = Writer.escape_re.sub('', text)
+        with self.lock:
+            file.write(text)
+            if flush:
+                file.flush()
+
+# writer of all terminal output
+WRITER = Writer()
 
 def color_print(*values, color=None, sep=' ', end='\n', file=sys.stdout,
         flush=False):
@@ -42,9 +126,8 @@ def color_print(*values, color=None, sep=' ', end='\n', file=sys.stdout,
         color = '\033[97m'
     else:
         raise ValueError("Unknown color '%s'" % (color))
-    print(color, sep='', end='', file=file, flush=flush)
-    print(*values, sep=sep, end=end, file=file, flush=flush)
-    print('\033[0m', sep='', end='', file=file, flush=flush)
+    WRITER.write(file, '%s%s%s\033[0m' % (color,
+        sep.join(str(v) for v in values), end), flush)
 
 def project_print(*args, **kwargs):
     """
@@ -82,441 +165,5628 @@ def error_print(*args, **kwargs):
     """
     color_print(*args, color='red', **kwargs)
 
-class Seelie(object):
+def git_dirs(path):
+    """
+    Returns a tuple of the git directory of the repository at path and its
+    common directory (they differ for linked worktrees), or None if path isn't
+    the top of a repository.
+    """
+    gitdir = os.path.join(path, '.git')
+    if(os.path.isfile(gitdir)):
+        # worktrees and submodules point to their git directory
+        try:
+            with open(gitdir) as f:
+                line = f.readline().strip()
+        except OSError:
+            return None
+        if(not line.startswith('gitdir:')):
+            return None
+        gitdir = os.path.join(path, line[len('gitdir:'):].strip())
+    if(not os.path.isdir(gitdir)):
+        return None
+    commondir = gitdir
+    try:
+        with open(os.path.join(gitdir, 'commondir')) as f:
+            commondir = os.path.join(gitdir, f.readline().strip())
+    except OSError:
+        pass
+    return (os.path.normpath(gitdir), os.path.normpath(commondir))
 
+def file_stamp(filename):
     """
-    Abstract base class for Seelie syncing objects
+    Returns a list with the modification time and size of a file, or None if
+    it doesn't exist.
+    """
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def save_atomic(filename, write, mode='wb', prefix='.tmp-',
+        permissions=None):
+    """
+    Replaces a file in one step, so that it's never read half written. The
+    new contents go to a temporary file next to it first, which is removed
+    if anything goes wrong, and the error is raised.
+
+    Keyword arguments:
+    filename -- the file to replace
+    write -- a function that writes the new contents to the open temporary
+        file
+    mode -- the mode the temporary file is opened with, "wb" or "w"
+    prefix -- the start of the name of the temporary file
+    permissions -- the mode bits of the new file, or None for those of
+        mkstemp, which only the owner can read
+    """
+    directory = os.path.dirname(filename) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=prefix)
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        if permissions is not None:
+            os.chmod(tmp, permissions)
+        os.replace(tmp, filename)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def save_marshal(filename, data, prefix='.marshal-'):
+    """
+    Replaces a file with data stored with marshal, with save_atomic.
+
+    Keyword arguments:
+    filename -- the file to replace
+    data -- the data to store
+    prefix -- the start of the name of the temporary file
+    """
+    save_atomic(filename, lambda f: marshal.dump(data, f), 'wb', prefix)
+
+def size_text(size):
+    """
+    Returns a number of bytes in the largest binary unit that keeps it above
+    one, like "1.5 MiB".
+    """
+    for unit in ('bytes', 'KiB', 'MiB', 'GiB'):
+        if(abs(size) < 1024 or unit == 'GiB'):
+            break
+        size /= 1024.0
+    if(unit == 'bytes'):
+        return '%d bytes' % (size)
+    return '%.1f %s' % (size, unit)
+
+def git_fingerprint(path):
+    """
+    Returns a list describing the repository metadata at path without running
+    git: the contents of HEAD, the ref it points to, and the stamps of the
+    packed refs and the index. Returns None if path isn't a repository.
+    """
+    dirs = git_dirs(path)
+    if dirs is None:
+        return None
+    gitdir, commondir = dirs
+    try:
+        with open(os.path.join(gitdir, 'HEAD')) as f:
+            head = f.read().strip()
+    except OSError:
+        return None
+    ref = None
+    if(head.startswith('ref:')):
+        try:
+            with open(os.path.join(commondir, head[4:].strip())) as f:
+                ref = f.read().strip()
+        except OSError:
+            pass
+    return [head, ref, file_stamp(os.path.join(commondir, 'packed-refs')),
+            file_stamp(os.path.join(gitdir, 'index'))]
+
+def tree_fingerprint(path, skip=('.git',)):
+    """
+    Returns a list with the number of entries below path and their latest
+    modification and change times. Any change to a file changes its change
+    time, and adding, removing or renaming entries changes the change time of
+    their directory, so the fingerprint changes whenever the tree does.
+
+    Keyword arguments:
+    path -- the directory to scan
+    skip -- names of entries to leave out
+    """
+    count = 0
+    mtime = 0
+    ctime = 0
+    try:
+        st = os.stat(path)
+        mtime, ctime = st.st_mtime_ns, st.st_ctime_ns
+    except OSError:
+        return None
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if(entry.name in skip):
+                continue
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            count += 1
+            mtime = max(mtime, st.st_mtime_ns)
+            ctime = max(ctime, st.st_ctime_ns)
+            if(entry.is_dir(follow_symlinks=False)):
+                stack.append(entry.path)
+    return [count, mtime, ctime]
+
+def push_fingerprint(path, tree):
     """
+    Returns the fingerprint that GitSync records after pushing a repository,
+    from its current metadata and the given tree_fingerprint.
+    """
+    return {'git': git_fingerprint(path), 'tree': tree}
+
+
+class GitInspector(object):
+
+    """
+    Reads the state of repositories straight from their git directories,
+    without running git: HEAD, loose and packed refs, remote URLs, and
+    whether the working tree matches the index. Every method returns None
+    when the answer isn't certain, such as for repositories using features
+    it doesn't read, so that callers can fall back to running git.
+    """
+
+    # config keys that change what the config of a repository means
+    config_re = re.compile(r'^\s*\[\s*include|^\s*worktree\s*=|insteadof|'
+            r'worktreeconfig|objectformat|refstorage', re.I | re.M)
+    # index extensions that leave entries out of the index
+    index_extensions = (b'link', b'sdir')
+    # index entry flags: assume valid, extended, and the merge stage
+    assume_valid = 0x8000
+    extended = 0x4000
+    stage = 0x3000
+    # extended entry flags: skip worktree and intent to add
+    extended_skip = 0x6000
+
+    def __init__(self):
+        # dict of filenames to their stamp and parsed contents
+        self.files = {}
+        self.lock = threading.Lock()
 
-    def __init__(self, tree, sync=None, verbose=False):
+    def clear(self):
         """
-        Initializes the Seelie object.
+        Forgets all files read so far.
+        """
+        with self.lock:
+            self.files = {}
 
-        Keyword arguments:
-        tree -- the root of a seelie XML tree
-        sync -- a dictionary mapping syncing tool strings (e.g., "git", "rsync")
-            to Sync objects, or None for the default dictionary
-        verbose -- warns the user of potential errors if True
+    def parsed(self, filename, parse):
         """
-        # dictionary of synchronizers
-        if sync is None:
-            sync = {
-                    'git': GitSync(),
-                    'rsync': RSync(),
-                    None: GitSync(),
-                    }
-        self.sync = sync
-        # XML tree
-        self.tree = tree
-        if(self.tree.getroot().tag.lower() != 'seelie'):
-            raise TypeError('XML tree root is not seelie')
-        # list of projects
-        self.projects = self.xml_to_projects(self.tree, verbose=verbose)
-        # dict of project names to indices
-        self.names = dict(zip([p.name for p in self.projects],
-            range(0, len(self.projects))))
-        if(None in self.names):
-            self.names.pop(None)
-        # list of automatic projects (the default list to use)
-        self.auto = [p.name for p in self.projects if p.auto]
+        Returns the result of parse on the contents of a file, reusing the
+        last result while the file keeps the same stamp, or None if the file
+        can't be read. A missing file is parsed as empty.
+        """
+        stamp = file_stamp(filename)
+        with self.lock:
+            cached = self.files.get(filename)
+        if(cached is not None and cached[0] == stamp):
+            return cached[1]
+        if stamp is None:
+            result = parse(b'')
+        else:
+            try:
+                with open(filename, 'rb') as f:
+                    result = parse(f.read())
+            except OSError:
+                return None
+        with self.lock:
+            self.files[filename] = (stamp, result)
+        return result
 
     @staticmethod
-    def xml_to_projects(tree, verbose=False):
+    def parse_packed_refs(data):
         """
-        Reads the seelie projects from the given xml tree and returns a list of
-        SeelieProject objects.
-
-        Keyword arguments:
-        tree -- the root of a seelie XML tree
-        verbose -- warns the user of potential errors if True
+        Returns a dict of ref names to SHAs from the contents of packed-refs.
         """
-        i = 0
-        projs = []
-        for proj in tree.getroot():
-            i = i+1
-            if(proj.tag.lower() != 'project'):
-                if(verbose):
-                    print("Ignored seelie child %i, tag='%s'" % (i, proj.tag),
-                            file=sys.stderr)
+        refs = {}
+        for line in data.decode(errors='replace').splitlines():
+            if(not line or line[0] in '#^'):
                 continue
-            # get the list of objects for it
-            cur = SeelieProject(proj, verbose=verbose, i=i)
-            projs.append(cur)
-        return projs
-    
-    def apply(self, mode, names=None, verbose=False, *args, **kwargs):
-        """
-        Depending on the mode either updates, pushes, or resolves the projects
-        specified by names (all by default).
-        Further arguments are passed to the synchronizer.
+            fields = line.split(' ', 1)
+            if(len(fields) == 2):
+                refs[fields[1]] = fields[0]
+        return refs
 
-        Keyword arguments:
-        mode -- a string, one of "update", "push", or "resolve"
-        names -- a list of project names or indices, or None for all automatic
-            projects (default)
-        verbose -- printing level
+    @staticmethod
+    def parse_config(data):
         """
-        # already visited paths and projects
-        visited_paths = set()
-        visited_projects = [False] * len(self.projects)
-        # paths and projects with errors
-        error_paths = set()
-        error_projects = [False] * len(self.projects)
-        unknown_projects = set()
-        # list of project indices to deal with
-        if(names is None):
-            projects = [self.names[n] for n in self.auto]
-        else:
-            projects = [self.names[n] for n in names if n in self.names]
-            unknown_projects |= set([n for n in names if(not n in self.names)])
+        Returns a dict of (section, subsection, key) to the list of values in
+        the contents of a config file, or None if it uses anything that isn't
+        read here: includes, URL rewriting, quoted or continued values, or
+        repository extensions for other ref or object formats.
+        """
+        text = data.decode(errors='replace')
+        if(GitInspector.config_re.search(text)):
+            return None
+        values = {}
+        section = None
+        for line in text.splitlines():
+            line = line.strip()
+            if(not line or line[0] in '#;'):
+                continue
+            if(line.startswith('[')):
+                header = re.match(r'\[\s*([\w.-]+)(?:\s+"([^"\\]*)")?\s*\]$',
+                        line)
+                if header is None:
+                    return None
+                section = (header.group(1).lower(), header.group(2))
+                continue
+            key, equals, value = line.partition('=')
+            value = value.strip()
+            if(section is None or any(c in value for c in '"\\#;')):
+                return None
+            key = key.strip().lower()
+            values.setdefault(section + (key,), []).append(
+                    value if equals else 'true')
+        return values
 
-        def apply_project(i, *args, **kwargs):
-            """
-            Helper function to iterate over all paths and references in a
-            single project. Takes the appropriate action based on the mode (as
-            set in the parent function), and updates the error and visitied
-            project information.
-            Further arguments are passed to the synchronizer.
-
-            Keyword arguments:
-            i -- index of the project
-            """
-            # check that it hasn't already been dealt with
-            if(visited_projects[i]):
-                return error_projects[i]
-            visited_projects[i] = True
-            # handle all items in the project
-            any_error = False
-            if(verbose):
-                name = self.projects[i].name or ('project #%d' % (i+1))
-                project_print(name)
-            # iterate over paths/references in the project
-            for item in self.projects[i]:
-                error = False
-                if(isinstance(item, SeeliePath)):
-                    # check if already visited, otherwise apply the function
-                    if(item.path in visited_paths):
-                        error = (item.path in error_paths)
-                    else:
-                        # print the name
-                        if(verbose == 1):
-                            path_print('\t', item.path, sep='', end='')
-                            project_print('... ', sep='', end='', flush=True)
-                        # apply the appropriate function and tool
-                        visited_paths.add(item.path)
-                        sync = self.sync[item.tool]
-                        if(mode == 'update'):
-                            error = sync.update(item.path, src=item.origin,
-                                    verbose=(verbose > 1), *args, **kwargs)
-                        elif(mode == 'push'):
-                            error = sync.push(item.path, dest=item.origin,
-                                    verbose=(verbose > 1), *args, **kwargs)
-                        elif(mode == 'resolve'):
-                            error = sync.resolve(item.path,
-                                    verbose=(verbose > 1), *args, **kwargs)
-                        else:
-                            raise ValueError("unknown mode: '%s'" % (mode))
-                        # print the name if needed
-                        if(verbose > 1):
-                            path_print('\t', item, " ", sep='', end='')
-                        if(error):
-                            error_paths.add(item)
-                            # print the status
-                            if(verbose):
-                                error_print('failed!')
-                        elif(verbose):
-                            success_print('ok')
-                elif(isinstance(item, SeelieRef)):
-                    if(item.name in self.names):
-                        error = apply_project(self.names[item.name], *args,
-                                **kwargs)
-                    else:
-                        unknown_projects.add(item.name)
-                        error = True
-                else:
-                    TypeError("Unknown project type '%s'" % type(item).__name__)
-                any_error = any_error or error
-            error_projects[i] = any_error
-            return any_error
-
-        # iterate over the projects
-        for i in projects:
-            apply_project(i, *args, **kwargs)
-        if(verbose):
-            # list the unknown projects and references
-            if(unknown_projects):
-                unknown_print("unknown projects or references:")
-                for name in sorted(unknown_projects):
-                    unknown_print("\t%s" % (name), file=sys.stderr)
-            # projects with errors
-            if(names is None):
-                errors = [(self.projects[i].name or
-                    ('seelie project #%d' % (i+1)))
-                        for i in projects if error_projects[i]]
-            else:
-                errors = []
-                for n in names:
-                    if (n in self.projects) and error_projects[self.names[n]]:
-                        errors.append(n)
-            if(errors):
-                error_print("projects with errors:", file=sys.stderr)
-                for name in errors:
-                    error_print("\t%s" % (name), file=sys.stderr)
-            # paths with errors
-            if(error_paths):
-                error_print("repositories with errors:", file=sys.stderr)
-                for path in sorted([x.path for x in error_paths]):
-                    error_print("\t%s" % (path), file=sys.stderr)
+    def config(self, path):
+        """
+        Returns the parsed config of the repository at path, merged over the
+        system and global configs, or None if any of them can't be read here.
+        """
+        dirs = git_dirs(path)
+        if(dirs is None or any(k.startswith('GIT_CONFIG') for k in
+                os.environ)):
+            return None
+        home = os.path.expanduser('~')
+        xdg = os.environ.get('XDG_CONFIG_HOME') or os.path.join(home,
+                '.config')
+        merged = {}
+        for filename in ('/etc/gitconfig', os.path.join(xdg, 'git', 'config'),
+                os.path.join(home, '.gitconfig'),
+                os.path.join(dirs[1], 'config')):
+            values = self.parsed(filename, GitInspector.parse_config)
+            if values is None:
+                return None
+            merged.update(values)
+        return merged
 
-    def update(self, names=None, verbose=False, merge=False):
+    def remote_url(self, path, remote, push=False):
         """
-        Updates the projects given in names (all by default).
+        Returns the URL of a remote of the repository at path, or None if it
+        isn't certain.
 
         Keyword arguments:
-        names -- a list of project names or indices, or None for all projects
-            (default)
-        verbose -- printing level
-        merge -- attempts to merge branches if true, rebases otherwise (default)
+        path -- the repository path
+        remote -- the remote name
+        push -- returns the push URL if True
         """
-        self.apply(mode='update', names=names, verbose=verbose, merge=merge)
+        config = self.config(path)
+        if config is None:
+            return None
+        urls = None
+        if push:
+            urls = config.get(('remote', remote, 'pushurl'))
+        urls = urls or config.get(('remote', remote, 'url'))
+        return urls[0] if urls else None
 
-    def push(self, names=None, verbose=False):
+    def resolve(self, path, ref='HEAD'):
         """
-        Commits changes and pushes the projects given in names (all by default).
+        Returns the SHA a ref of the repository at path points to, following
+        symbolic refs, or None if it isn't certain.
 
         Keyword arguments:
-        names -- a list of project names or indices, or None for all projects
-            (default)
-        verbose -- printing level
+        path -- the repository path
+        ref -- "HEAD" or the full name of a ref
         """
-        self.apply(mode='push', names=names, verbose=verbose)
+        dirs = git_dirs(path)
+        if dirs is None:
+            return None
+        gitdir, commondir = dirs
+        for _ in range(5):
+            # HEAD and the refs of each worktree are kept in its git directory
+            base = gitdir if(ref == 'HEAD' or ref.startswith(
+                ('refs/worktree/', 'refs/bisect/'))) else commondir
+            try:
+                with open(os.path.join(base, ref)) as f:
+                    value = f.read().strip()
+            except IsADirectoryError:
+                return None
+            except OSError:
+                packed = self.parsed(os.path.join(commondir, 'packed-refs'),
+                        GitInspector.parse_packed_refs)
+                return None if packed is None else packed.get(ref)
+            if(not value.startswith('ref:')):
+                return value if re.match(r'^[0-9a-f]{40}$', value) else None
+            ref = value[4:].strip()
+            if(not ref.startswith('refs/')):
+                return None
+        return None
 
-    def resolve(self, names=None, verbose=False):
+    @staticmethod
+    def parse_index(data):
         """
-        Resolves conflicts in the projects specified by names (all by default).
+        Returns a tuple of the version and the list of entries of an index,
+        each a tuple of its path, mode, size, mtime seconds, mtime
+        nanoseconds and inode, or None if it uses anything that isn't read
+        here: versions other than 2 and 3, split or sparse indexes, and
+        entries that are conflicted, assumed valid, outside the sparse
+        checkout or only intended to be added.
+        """
+        if(len(data) < 32 or data[:4] != b'DIRC'):
+            return None
+        version, count = struct.unpack('>II', data[4:12])
+        if(not version in (2, 3)):
+            return None
+        entries = []
+        offset = 12
+        end = len(data) - 20
+        for _ in range(count):
+            if(offset + 62 > end):
+                return None
+            (ctime, ctime_ns, mtime, mtime_ns, dev, ino, mode, uid, gid,
+                    size) = struct.unpack('>10I', data[offset:offset + 40])
+            flags, = struct.unpack('>H', data[offset + 60:offset + 62])
+            if(flags & (GitInspector.assume_valid | GitInspector.stage)):
+                return None
+            start = offset + 62
+            if(flags & GitInspector.extended):
+                extra, = struct.unpack('>H', data[start:start + 2])
+                if(extra & GitInspector.extended_skip):
+                    return None
+                start += 2
+            stop = data.find(b'\0', start)
+            if(stop < 0 or stop > end):
+                return None
+            entries.append((data[start:stop].decode('utf-8', 'surrogateescape'),
+                mode, size, mtime, mtime_ns, ino))
+            # entries are padded with NULs to a multiple of eight bytes
+            offset += (stop - offset + 8) & ~7
+        while(offset + 8 <= end):
+            signature = data[offset:offset + 4]
+            size, = struct.unpack('>I', data[offset + 4:offset + 8])
+            if(signature in GitInspector.index_extensions):
+                return None
+            offset += 8 + size
+        return (version, entries)
 
-        Keyword arguments:
-        names -- a list of project names or indices, or None for all projects
-            (default)
-        verbose -- printing level
+    def clean(self, path):
         """
-        self.apply(mode='resolve', names=names, verbose=verbose)
+        Returns True if the working tree of the repository at path certainly
+        matches its index, with no untracked files, False if a tracked file
+        is certainly missing, or None if it isn't certain. Files whose stat
+        data differ from the index, untracked files that might be ignored,
+        files changed too close to the index to tell (racy files) and
+        submodules are all uncertain.
+        """
+        dirs = git_dirs(path)
+        if dirs is None:
+            return None
+        index = os.path.join(dirs[0], 'index')
+        stamp = file_stamp(index)
+        parsed = self.parsed(index, GitInspector.parse_index)
+        if(stamp is None or parsed is None):
+            return None
+        tracked = set()
+        for name, mode, size, mtime, mtime_ns, ino in parsed[1]:
+            # submodules are checked with git
+            if(mode & 0o170000 == 0o160000):
+                return None
+            try:
+                st = os.lstat(os.path.join(path, name))
+            except FileNotFoundError:
+                return False
+            except OSError:
+                return None
+            if(st.st_size & 0xffffffff != size or
+                    int(st.st_mtime) != mtime or
+                    (mtime_ns and st.st_mtime_ns % 1000000000 != mtime_ns) or
+                    (ino and st.st_ino & 0xffffffff != ino) or
+                    (st.st_mode & 0o170000) != (mode & 0o170000) or
+                    bool(st.st_mode & 0o100) != bool(mode & 0o100)):
+                return None
+            # files changed in the same second as the index might have
+            # changed again after it was written
+            if(mtime >= stamp[0] // 1000000000):
+                return None
+            tracked.add(name)
+        # anything else in the tree is untracked, unless it's ignored
+        stack = ['']
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(os.path.join(path, directory)))
+            except OSError:
+                return None
+            for entry in entries:
+                if(not directory and entry.name == '.git'):
+                    continue
+                name = directory + entry.name
+                if(entry.is_dir(follow_symlinks=False)):
+                    stack.append(name + '/')
+                elif(not name in tracked):
+                    return None
+        return True
 
 
-class Sync(object):
+# reads repositories for every synchronizer
+INSPECTOR = GitInspector()
+
+
+class ConfigCache(object):
 
     """
-    Abstract base class for synchronizers.
+    A cache of the projects parsed from a config file, stored as plain data
+    with marshal and valid for as long as the file keeps the same modification
+    time and size.
     """
 
-    @staticmethod
-    def update(path, merge=False, verbose=False):
-        raise NotImplementedError("abstract class")
+    # bump this whenever the cached data changes
+    VERSION = 5
+
+    def __init__(self, filename, cache_dir=CACHE_DIR):
+        """
+        Initializes the cache.
+
+        Keyword arguments:
+        filename -- the absolute path of the config file
+        cache_dir -- directory the cache files are kept in
+        """
+        self.filename = filename
+        name = hashlib.sha1(filename.encode()).hexdigest()[:16]
+        self.cache_file = os.path.join(os.path.expanduser(cache_dir),
+                'config-%s.marshal' % (name))
+        # the key when the file was last checked, before it's parsed
+        self.current = None
+        # dict of host names to the SeelieHost objects of the config, once
+        # it's loaded
+        self.hosts = None
+
+    def stamp(self):
+        """
+        Returns the key the cache is valid for.
+        """
+        return [self.VERSION, list(sys.version_info[:2]), self.filename,
+                file_stamp(self.filename)]
 
     @staticmethod
-    def push(path, verbose=False):
-        raise NotImplementedError("abstract class")
+    def pack(projects):
+        """
+        Returns a list of SeelieProject objects as plain data.
+        """
+        return [(p.name, p.auto, p.priority, p.after,
+            [(x.key, x.tool, x.origin, x.options) if isinstance(x, SeeliePath)
+                else (x.name,) for x in p]) for p in projects]
 
     @staticmethod
-    def resolve(path):
-        raise NotImplementedError("abstract class")
+    def unpack(data):
+        """
+        Returns the list of SeelieProject objects packed into data.
+        """
+        return [SeelieProject.from_items(name, [SeeliePath.from_key(*x)
+            if len(x) == 4 else SeelieRef(*x) for x in items], auto, priority,
+            after) for name, auto, priority, after, items in data]
+
+    def load(self):
+        """
+        Returns the cached list of SeelieProject objects, or None if there's
+        no valid cache. The cached hosts are then in self.hosts.
+        """
+        self.current = self.stamp()
+        try:
+            with open(self.cache_file, 'rb') as f:
+                stamp, data, hosts = marshal.loads(f.read())
+            if(stamp != self.current):
+                return None
+            self.hosts = dict((x[0], SeelieHost.from_values(*x))
+                    for x in hosts)
+            return ConfigCache.unpack(data)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def save(self, projects, hosts=None):
+        """
+        Caches a list of SeelieProject objects, and a dict of host names to
+        SeelieHost objects. Errors are ignored, since the config file can
+        always be parsed again.
+        """
+        hosts = [(x.name, x.jobs, x.bandwidth)
+                for x in (hosts or {}).values()]
+        try:
+            save_marshal(self.cache_file, (self.current or self.stamp(),
+                ConfigCache.pack(projects), hosts), prefix='.config-')
+        except (OSError, ValueError):
+            pass
 
 
-class GitSync(object):
+class ConfigIndex(object):
 
     """
-    Synchronizes paths using git.
+    The files of a config split into shards with <include> elements, and the
+    names of the projects each of them defines, read without building the
+    projects, so that a run only parses the shards of the projects it needs.
+    The index is cached for as long as none of its files change.
     """
 
-    @staticmethod
-    def update(path, src=None, merge=False, verbose=False):
+    # bump this whenever the cached data changes
+    VERSION = 1
+
+    def __init__(self, filename, cache_dir=CACHE_DIR):
         """
-        Update a path, pulling any changes. Returns False if no errors.
+        Initializes an empty index.
 
         Keyword arguments:
-        path -- the path to update
-        src -- where to pull from, set to "origin" if src is None
-        merge -- attempts to merge branches if true, rebases otherwise (default)
-        verbose -- printing level
+        filename -- the absolute path of the config file
+        cache_dir -- directory the index and the parsed shards are cached in,
+            or None to always read the files
         """
-        if src is None:
-            src = "origin"
-        # change to the repository path
-        error = False
-        here = os.getcwd()
-        try:
-            os.chdir(os.path.expanduser(path))
-        except IOError:
-            error = True
-        # set the pipes and printing color
-        if verbose:
-            out = sys.stdout
-            err = sys.stderr
-            print('\033[97m', sep='', end='', file=out, flush=True)
-        else:
-            out = subprocess.DEVNULL
-            err = subprocess.DEVNULL
-        # update the repository and check the results
-        # TODO: log the output using the stdout and stderr arguments
-        if merge:
-            error = error or subprocess.call(('git', 'pull', src, 'master'),
-                    stdout=out, stderr=err)
-        else:
-            error = error or subprocess.call(('git', 'pull', '--rebase', src,
-                'master'), stdout=out, stderr=err)
-        # reset the printing color
-        if verbose:
-            print('\033[0m', sep='', end='', file=out, flush=True)
-        # change back to the current path
-        os.chdir(here)
-        return error
+        self.filename = filename
+        self.cache_dir = cache_dir
+        self.cache_file = None
+        if cache_dir is not None:
+            name = hashlib.sha1(filename.encode()).hexdigest()[:16]
+            self.cache_file = os.path.join(os.path.expanduser(cache_dir),
+                    'index-%s.marshal' % (name))
+        # list of [filename, stamp] of the config and its shards, in the
+        # order they're included
+        self.files = []
+        # dict of project names to the file defining them
+        self.shards = {}
+        # files with automatic projects
+        self.auto = []
 
-    @staticmethod
-    def push(path, dest="origin", verbose=False):
+    def load(self):
         """
-        Adds and commits all changes, then pushes the commit.
+        Reads the index from its cache if none of its files changed, and
+        from the files otherwise. Returns the index.
+        """
+        if self.cache_file is not None:
+            try:
+                with open(self.cache_file, 'rb') as f:
+                    version, files, shards, auto = marshal.loads(f.read())
+                if(version == ConfigIndex.VERSION and files and
+                        files[0][0] == self.filename and
+                        all(file_stamp(x) == stamp for x, stamp in files)):
+                    self.files, self.shards, self.auto = files, shards, auto
+                    return self
+            except (OSError, EOFError, ValueError, TypeError):
+                pass
+        self.scan()
+        if self.cache_file is not None:
+            try:
+                save_marshal(self.cache_file, (ConfigIndex.VERSION,
+                    self.files, self.shards, self.auto), prefix='.index-')
+            except (OSError, ValueError):
+                pass
+        return self
 
-        Keyword arguments:
-        path -- the path to push
-        dest -- where to push to, set to "origin" if dest is None
-        verbose -- printing level
+    def scan(self):
         """
-        if dest is None:
-            dest = "origin"
-        # change to the repository path
-        error = False
-        here = os.getcwd()
-        try:
-            os.chdir(os.path.expanduser(path))
-        except IOError:
-            error = True
-        # set the pipes and printing color
-        if verbose:
-            out = sys.stdout
-            err = sys.stderr
-            print('\033[97m', sep='', end='', file=out, flush=True)
-        else:
-            out = subprocess.DEVNULL
-            err = subprocess.DEVNULL
-        # add all changes to the repository
-        error = error or subprocess.call(('git', 'add', '--all'),
-                stdout=out, stderr=err)
-        # see if there are any changes
-        status = 'changes?'
-        try:
-            if(not error):
-                status = subprocess.check_output(('git', 'status',
-                    '--porcelain'), stderr=err)
-        except subprocess.CalledProcessError:
-            error = True
-        # only continue if there are changes to commit
-        if(status):
-            # commit to the repository
-            error = error or subprocess.call(('git', 'commit', '-m',
-                'seelie commit from %s at %s' % (
-                    socket.gethostname(), time.strftime('%F %T %Z'))),
-                stdout=out, stderr=err)
-            # push the changes
-            # TODO: log the output using the stdout and stderr arguments
-            error = error or subprocess.call(('git', 'push', dest, 'master'),
-                    stdout=out, stderr=err)
-        # reset the printing color
-        if verbose:
-            print('\033[0m', sep='', end='', file=out, flush=True)
-        # change back to the current path
-        os.chdir(here)
-        return error
+        Reads the names of the projects in the config and in the shards it
+        includes, following includes in shards, and including each file
+        once.
+        """
+        self.files = []
+        self.shards = {}
+        self.auto = []
+        seen = set()
+        stack = [self.filename]
+        while stack:
+            filename = stack.pop()
+            if(filename in seen):
+                continue
+            seen.add(filename)
+            stamp = file_stamp(filename)
+            projects, includes = ConfigIndex.read(filename)
+            self.files.append([filename, stamp])
+            for name, auto in projects:
+                if(name is not None):
+                    self.shards[name] = filename
+                if(auto and not filename in self.auto):
+                    self.auto.append(filename)
+            stack.extend(reversed(includes))
 
     @staticmethod
-    def resolve(path, verbose=False):
+    def read(filename):
         """
-        Resolves changes 
-
-        Keyword arguments:
-        path -- the path to push
-        verbose -- printing level
+        Returns a list of the name, or None, and whether it's automatic of
+        each project in a config file, and the list of the absolute paths of
+        the files it includes, without building the projects.
+        """
+        projects = []
+        includes = []
+        depth = 0
+        name = None
+        for event, node in etree.iterparse(filename, events=('start', 'end')):
+            if(event == 'start'):
+                depth += 1
+                if(depth == 1 and node.tag.lower() != 'seelie'):
+                    raise TypeError('XML tree root is not seelie')
+                elif(depth == 2):
+                    name = None
+                continue
+            depth -= 1
+            tag = node.tag.lower()
+            if(depth == 2 and tag == 'name'):
+                name = node.text
+            elif(depth == 1):
+                if(tag == 'project'):
+                    auto = node.attrib.get('auto', 'true')
+                    projects.append((name, not(auto.lower() == 'false' or
+                        auto == '0')))
+                elif(tag == 'include' and node.text and node.text.strip()):
+                    includes.append(os.path.normpath(os.path.join(
+                        os.path.dirname(filename),
+                        os.path.expanduser(node.text.strip()))))
+                node.clear()
+        return projects, includes
 
-        TODO: write this
+    def projects(self, filename, verbose=False):
         """
-        raise NotImplementedError("can't resolve yet...")
+        Returns the list of SeelieProject objects of one of the files, from
+        its ConfigCache if it's still valid, and parsing the file otherwise.
+        """
+        cache = None
+        if self.cache_dir is not None:
+            cache = ConfigCache(filename, self.cache_dir)
+            projects = cache.load()
+            if projects is not None:
+                return projects
+        projects = Seelie.xml_to_projects(etree.parse(filename), verbose)
+        if cache is not None:
+            cache.save(projects)
+        return projects
 
 
-class RSync(object):
+class SeelieState(object):
 
     """
-    Synchronizes paths using rsync.
+    Information about each path that is kept between runs, such as the
+    fingerprints of the last successful push. It's stored as JSON, read when
+    it's first needed and written by save().
     """
 
-    @staticmethod
-    def update(path, src, merge=False, verbose=False):
+    def __init__(self, filename=STATE_FILE):
         """
-        Update a path, pulling any changes. Returns False if no errors.
+        Initializes the state.
 
         Keyword arguments:
-        path -- the path to update
-        merge -- ignored
-        verbose -- printing level
+        filename -- the JSON file the state is kept in
         """
-        cmd = "rsync"
-        flags = "-au"
-        # TODO: check that 
-        opts = "--delete"
-        if verbose:
-            flags += "v"
-        # set the pipes and printing color
-        if verbose:
-            out = sys.stdout
-            err = sys.stderr
-            print('\033[97m', sep='', end='', file=out, flush=True)
-        else:
-            out = subprocess.DEVNULL
-            err = subprocess.DEVNULL
-        try:
-            # update the path
-            # TODO: log the output using the stdout and stderr arguments
-            error = subprocess.call((cmd, flags, opts, src, path), stdout=out,
-                    stderr=err)
-        except OSError as emsg:
-            error = True
-            if verbose:
-                error_print(emsg)
-        return error
+        self.filename = os.path.expanduser(filename)
+        # dict of paths to dicts of values, or None until loaded
+        self.paths = None
+        self.dirty = False
+        self.lock = threading.Lock()
 
-    @staticmethod
-    def push(path, dest, verbose=False):
+    def load(self):
         """
-        Adds and commits all changes, then pushes the commit.
-
+        Reads the state file, if it hasn't been read yet. A missing or broken
+        file gives an empty state.
+        """
+        if self.paths is not None:
+            return
+        try:
+            with open(self.filename) as f:
+                data = json.load(f)
+            self.paths = data.get('paths', {})
+        except (OSError, ValueError, AttributeError):
+            self.paths = {}
+
+    def get(self, path, key, default=None):
+        """
+        Returns the value stored under a key for a path.
+        """
+        with self.lock:
+            self.load()
+            return self.paths.get(path, {}).get(key, default)
+
+    def set(self, path, key, value):
+        """
+        Stores a value under a key for a path.
+        """
+        with self.lock:
+            self.load()
+            self.paths.setdefault(path, {})[key] = value
+            self.dirty = True
+
+    def discard(self, path, key):
+        """
+        Removes the value stored under a key for a path, if there is one.
+        """
+        with self.lock:
+            self.load()
+            values = self.paths.get(path, {})
+            if(key in values):
+                del values[key]
+                if(not values):
+                    del self.paths[path]
+                self.dirty = True
+
+    def save(self):
+        """
+        Writes the state file if anything changed, replacing the old file in
+        one step so that it's never left half written.
+        """
+        with self.lock:
+            if(not self.dirty):
+                return
+            data = {'version': 1, 'paths': self.paths}
+            try:
+                save_atomic(self.filename, lambda f: json.dump(data, f,
+                    indent=1, sort_keys=True), 'w', '.state-')
+                self.dirty = False
+            except (OSError, TypeError, ValueError) as emsg:
+                error_print("Couldn't save seelie state: %s" % (emsg),
+                        file=sys.stderr)
+
+
+class SeelieJournal(object):
+
+    """
+    A record of the paths that finished during a run of a config and mode,
+    appended to as each path finishes so that it survives the run being
+    killed. Resuming the run skips the paths that finished without errors.
+    """
+
+    def __init__(self, filename, config, mode, resume=False):
+        """
+        Opens the journal, starting a new one unless resume is True and the
+        file has a journal of the same config and mode.
+
+        Keyword arguments:
+        filename -- the file the journal is kept in
+        config -- a hash of the config being run
+        mode -- a string, one of "update", "push", or "resolve"
+        resume -- continues the journal in the file if True
+        """
+        self.filename = os.path.expanduser(filename)
+        self.config = config
+        self.mode = mode
+        # keys of the paths that finished without errors
+        self.done = set()
+        self.resumed = resume and self.load()
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        self.file = open(self.filename, 'a' if self.resumed else 'w')
+        if(not self.resumed):
+            self.write({'version': 1, 'config': config, 'mode': mode,
+                'start': round(time.time(), 3)})
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        Reads the paths that finished without errors from the file. Returns
+        False if there's no journal of the same config and mode in it.
+        """
+        try:
+            with open(self.filename) as f:
+                header = json.loads(f.readline())
+                if(header.get('version') != 1 or
+                        header.get('config') != self.config or
+                        header.get('mode') != self.mode):
+                    return False
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # the last line may be cut short by a crash
+                        continue
+                    if entry.get('error'):
+                        self.done.discard(entry.get('path'))
+                    else:
+                        self.done.add(entry.get('path'))
+        except (OSError, ValueError, AttributeError):
+            self.done = set()
+            return False
+        return True
+
+    def write(self, entry):
+        """
+        Appends an entry to the file and flushes it.
+        """
+        self.file.write(json.dumps(entry, sort_keys=True) + '\n')
+        self.file.flush()
+
+    def add(self, key, error):
+        """
+        Records that a path finished, and whether it had an error.
+        """
+        with self.lock:
+            if self.file is not None:
+                self.write({'path': key, 'error': bool(error),
+                    'time': round(time.time(), 3)})
+
+    def close(self):
+        """
+        Closes the file of the journal.
+        """
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+# metrics of the path being synchronized in the current thread or task
+CURRENT_METRICS = contextvars.ContextVar('seelie_metrics', default=None)
+# output of the path being synchronized in the current thread or task
+CURRENT_OUTPUT = contextvars.ContextVar('seelie_output', default=None)
+# deadline of the path being synchronized in the current thread or task, as
+# a time.monotonic() value and the timeout it was set from
+CURRENT_DEADLINE = contextvars.ContextVar('seelie_deadline', default=None)
+# status of the path being inspected in the current thread or task
+CURRENT_STATUS = contextvars.ContextVar('seelie_status', default=None)
+# bytes per second that the path being synchronized in the current thread or
+# task may transfer, its share of the bandwidth budget of its host
+CURRENT_BANDWIDTH = contextvars.ContextVar('seelie_bandwidth', default=None)
+
+def note_metrics(**values):
+    """
+    Sets values on the metrics of the path being synchronized, if any.
+    """
+    metrics = CURRENT_METRICS.get()
+    if metrics is not None:
+        for key, value in values.items():
+            setattr(metrics, key, value)
+
+def note_status(**values):
+    """
+    Sets values on the status of the path being inspected, if any.
+    """
+    status = CURRENT_STATUS.get()
+    if status is not None:
+        for key, value in values.items():
+            setattr(status, key, value)
+
+def call(args, stdout=None, stderr=None, cwd=None, env=None, stdin=None,
+        count=None, transient=None):
+    """
+    Runs a command and returns its exit status, like subprocess.call. The
+    command is added to the metrics of the path being synchronized, with the
+    CPU time it used. While a path is being synchronized, the output is
+    captured, written to the log of the run and shown on stdout and stderr
+    with the path in front of every line. If the path has a deadline, the
+    command's process group is killed when it passes, and TimeoutExpired is
+    raised.
+
+    Keyword arguments:
+    args -- the command
+    stdout, stderr, cwd, env, stdin -- as for subprocess.call
+    count -- a function that returns the objects and bytes transferred by the
+        command from its output, which is then always captured
+    transient -- a function that returns True if a failed command might work
+        when retried, given its exit status and the end of its output
+    """
+    metrics = CURRENT_METRICS.get()
+    output = CURRENT_OUTPUT.get()
+    timeout = time_left()
+    if(metrics is None or count is None) and output is None:
+        proc = subprocess.Popen(args, stdout=stdout, stderr=stderr, cwd=cwd,
+                env=env, stdin=stdin, start_new_session=(timeout is not None))
+        status = wait_process(proc, metrics, timeout)
+        streams = []
+    else:
+        if output is None:
+            output = PathOutput(None)
+        proc = subprocess.Popen(args, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, cwd=cwd, env=env, stdin=stdin,
+                start_new_session=(timeout is not None))
+        sink = [] if(count is not None and metrics is not None) else None
+        streams = [OUTPUT_MUX.watch(proc.stdout, output, 'stdout', stdout,
+            sink), OUTPUT_MUX.watch(proc.stderr, output, 'stderr', stderr,
+                sink)]
+        try:
+            status = wait_process(proc, metrics, timeout)
+        finally:
+            # don't wait long on pipes that were passed on to other processes
+            for stream in streams:
+                stream.wait(1.0)
+        if sink is not None:
+            objects, size = count(b''.join(sink).decode(errors='replace'))
+            metrics.objects += objects
+            metrics.bytes += size
+    if(status and transient is not None and metrics is not None and
+            transient(status, b''.join(s.tail for s in streams).decode(
+                errors='replace'))):
+        metrics.transient = True
+    return status
+
+def check_output(args, stderr=None, cwd=None, env=None, stdin=None):
+    """
+    Runs a command and returns its output, like subprocess.check_output. The
+    command is added to the metrics of the path being synchronized, its
+    error output is captured, and it's killed at the deadline of the path,
+    like with call.
+    """
+    output = CURRENT_OUTPUT.get()
+    timeout = time_left()
+    capture = (output is not None and stderr != subprocess.DEVNULL)
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE,
+            stderr=(subprocess.PIPE if capture else stderr), cwd=cwd, env=env,
+            stdin=stdin, start_new_session=(timeout is not None))
+    if capture:
+        stream = OUTPUT_MUX.watch(proc.stderr, output, 'stderr', stderr)
+    watchdog = Watchdog(proc, args, timeout)
+    try:
+        data = proc.stdout.read()
+    except BaseException:
+        watchdog.kill()
+        proc.kill()
+        raise
+    finally:
+        proc.stdout.close()
+        status = wait_process(proc, CURRENT_METRICS.get(), watchdog=watchdog)
+        if capture:
+            stream.wait(1.0)
+    if status:
+        raise subprocess.CalledProcessError(status, args, data)
+    return data
+
+def step(function, *args, **kwargs):
+    """
+    Returns a step of a synchronization, for run_steps or async_run_steps:
+    a call of function with the given arguments, which runs a command or
+    does other work that might block.
+    """
+    return (function, args, kwargs)
+
+def run_steps(steps):
+    """
+    Runs the steps a generator yields one after the other, sending it the
+    result of each step or throwing in the exception it raised, and returns
+    what the generator returns. Synchronizers write the work of a mode once
+    as such a generator, and run it like this or with async_run_steps.
+
+    Keyword arguments:
+    steps -- a generator that yields steps made by step
+    """
+    result = None
+    failure = None
+    while True:
+        try:
+            if failure is None:
+                function, args, kwargs = steps.send(result)
+            else:
+                function, args, kwargs = steps.throw(failure)
+        except StopIteration as stop:
+            return stop.value
+        result = None
+        failure = None
+        try:
+            result = function(*args, **kwargs)
+        except Exception as emsg:
+            failure = emsg
+
+def time_left():
+    """
+    Returns the seconds left until the deadline of the path being
+    synchronized, or None if it has none. Raises TimeoutExpired if the
+    deadline has passed.
+    """
+    deadline = CURRENT_DEADLINE.get()
+    if deadline is None:
+        return None
+    left = deadline[0] - time.monotonic()
+    if(left <= 0):
+        raise subprocess.TimeoutExpired('seelie', deadline[1])
+    return left
+
+def note_output(text, file=None):
+    """
+    Shows a message about the path being synchronized on file like a line of
+    output of its commands, and writes it to the log of the run.
+    """
+    output = CURRENT_OUTPUT.get()
+    if output is None:
+        color_print(text, color='white', file=file, flush=True)
+    else:
+        output.line('seelie', text, shown(file))
+
+def wait_process(proc, metrics=None, timeout=None, watchdog=None):
+    """
+    Waits for a process started by call or check_output and returns its exit
+    status, adding its exit status and CPU time to metrics. The process group
+    is killed after timeout seconds, or by watchdog if one is given, and then
+    TimeoutExpired is raised.
+    """
+    if watchdog is None:
+        watchdog = Watchdog(proc, proc.args, timeout)
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+    except BaseException:
+        # don't leave the command running, or unreaped, behind
+        watchdog.kill()
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        watchdog.cancel()
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if metrics is not None:
+        metrics.add_command(proc.returncode, usage.ru_utime, usage.ru_stime)
+    if watchdog.fired:
+        raise subprocess.TimeoutExpired(proc.args, watchdog.timeout)
+    return proc.returncode
+
+
+class Watchdog(object):
+
+    """
+    Kills the process group of a command that runs for too long. Commands
+    with a timeout run in their own process group, so that everything they
+    started goes with them.
+    """
+
+    # seconds between asking the processes to stop and killing them
+    grace = 5.0
+    # watchdogs of the commands still running
+    running = set()
+    lock = threading.Lock()
+
+    def __init__(self, proc, args, timeout=None):
+        """
+        Starts watching a process.
+
+        Keyword arguments:
+        proc -- the subprocess.Popen of the command
+        args -- the command
+        timeout -- seconds the command may run for, or None to never kill it
+        """
+        self.proc = proc
+        self.args = args
+        self.timeout = timeout
+        self.fired = False
+        self.reaped = threading.Event()
+        self.timer = None
+        if timeout is not None:
+            self.timer = threading.Timer(timeout, self.expire)
+            self.timer.daemon = True
+            with Watchdog.lock:
+                Watchdog.running.add(self)
+            self.timer.start()
+
+    def expire(self):
+        """
+        Stops the process group when the timeout passes.
+        """
+        if self.reaped.is_set():
+            return
+        self.fired = True
+        self.signal(signal.SIGTERM)
+        if(not self.reaped.wait(self.grace)):
+            self.signal(signal.SIGKILL)
+
+    def signal(self, signum):
+        """
+        Sends a signal to the process group, if it has one of its own.
+        """
+        if self.timer is None:
+            return
+        try:
+            os.killpg(self.proc.pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def kill(self):
+        """
+        Kills the process group right away.
+        """
+        self.signal(signal.SIGKILL)
+
+    def cancel(self):
+        """
+        Stops watching, once the process was reaped.
+        """
+        self.reaped.set()
+        if self.timer is not None:
+            self.timer.cancel()
+            with Watchdog.lock:
+                Watchdog.running.discard(self)
+
+    @classmethod
+    def kill_all(cls):
+        """
+        Kills the process groups of all commands still running, which don't
+        get the terminal's interrupt since they're in groups of their own.
+        """
+        with cls.lock:
+            running = list(cls.running)
+        for watchdog in running:
+            watchdog.kill()
+
+def shown(file):
+    """
+    Returns file if output written to it should be shown, or None if it's
+    DEVNULL or None.
+    """
+    if(file is None or file == subprocess.DEVNULL):
+        return None
+    return file
+
+
+class RunLog(object):
+
+    """
+    The log of a run, with every line of output of the commands run for each
+    path. Each run writes a new file, and only the newest ones are kept.
+    """
+
+    # number of logs kept
+    keep = 20
+
+    def __init__(self, directory, mode):
+        """
+        Initializes the log. The file is created by the first line written.
+
+        Keyword arguments:
+        directory -- the directory of the logs
+        mode -- a string, one of "update", "push", or "resolve"
+        """
+        self.directory = os.path.expanduser(directory)
+        self.filename = os.path.join(self.directory, '%s-%s.log' % (
+            time.strftime('%Y%m%dT%H%M%S'), mode))
+        self.file = None
+        self.lock = threading.Lock()
+
+    def write(self, tag, name, line):
+        """
+        Writes a line of output of a command run for the path tag, where name
+        is the stream it came from.
+        """
+        with self.lock:
+            if self.file is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self.file = open(self.filename, 'a', buffering=65536)
+                self.rotate()
+            self.file.write('%s %s %s: %s\n' % (time.strftime('%T'), tag,
+                name, line))
+
+    def rotate(self):
+        """
+        Removes all but the newest logs.
+        """
+        logs = sorted(x for x in os.listdir(self.directory)
+                if x.endswith('.log'))
+        for name in logs[:max(len(logs) - self.keep, 0)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def close(self):
+        """
+        Closes the file of the log.
+        """
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+class PathOutput(object):
+
+    """
+    Where the output of the commands run for a path goes: the log of the run,
+    and the terminal, with the path in front of each line.
+    """
+
+    def __init__(self, tag, log=None):
+        """
+        Initializes the output.
+
+        Keyword arguments:
+        tag -- the path, or a name for a batch of paths
+        log -- the RunLog of the run, or None to keep no log
+        """
+        self.tag = tag
+        self.log = log
+        # list of (stream name, text) tuples of every line written
+        self.lines = []
+
+    def line(self, name, text, show=None):
+        """
+        Writes a line of output from the stream name, showing it on the file
+        show if it isn't None. Progress updates ending with carriage returns
+        are reduced to the last one, and control sequences are left out.
+        """
+        text = text.rstrip('\r').rpartition('\r')[2]
+        text = Writer.escape_re.sub('', text).rstrip()
+        if(not text):
+            return
+        self.lines.append((name, text))
+        if(self.log is not None and self.tag is not None):
+            self.log.write(self.tag, name, text)
+        if show is not None:
+            if self.tag is None:
+                color_print(text, color='white', file=show)
+            else:
+                WRITER.write(show, '\033[94m%s\033[0m: \033[97m%s\033[0m\n' % (
+                    self.tag, text))
+
+
+class OutputStream(object):
+
+    """
+    A pipe being read by an OutputMux.
+    """
+
+    def __init__(self, pipe, output, name, show=None, sink=None):
+        self.pipe = pipe
+        self.output = output
+        self.name = name
+        self.show = shown(show)
+        self.sink = sink
+        # the end of the last line, until its newline arrives
+        self.partial = b''
+        # the last data read, for telling why a command failed
+        self.tail = b''
+        self.done = threading.Event()
+
+    def feed(self, data):
+        """
+        Handles data read from the pipe, or the end of the pipe if data is
+        empty.
+        """
+        if self.sink is not None:
+            self.sink.append(data)
+        self.tail = (self.tail + data)[-4096:]
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop() if data else b''
+        for line in lines:
+            self.output.line(self.name, line.decode(errors='replace'),
+                    self.show)
+        if(not data):
+            self.output.line(self.name, self.partial.decode(errors='replace'),
+                    self.show)
+
+    def wait(self, timeout=None):
+        """
+        Waits until the whole pipe was read, or until timeout seconds passed.
+        """
+        return self.done.wait(timeout)
+
+
+class OutputMux(object):
+
+    """
+    Reads the pipes of all running commands from a single thread, without
+    blocking on any of them, and passes their lines on to the PathOutput of
+    each command.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.selector = None
+        self.thread = None
+        # streams waiting to be added by the thread
+        self.pending = []
+        # pipe used to wake up the thread when there are pending streams
+        self.wake = None
+
+    def watch(self, pipe, output, name, show=None, sink=None):
+        """
+        Starts reading a pipe, and returns its OutputStream. The pipe is
+        closed once it's read to the end.
+
+        Keyword arguments:
+        pipe -- a pipe from subprocess.Popen
+        output -- the PathOutput to pass lines on to
+        name -- the name of the stream, like "stdout"
+        show -- a file to show the lines on, or None or DEVNULL to only log
+        sink -- a list to append all data read to, or None
+        """
+        stream = OutputStream(pipe, output, name, show, sink)
+        os.set_blocking(pipe.fileno(), False)
+        with self.lock:
+            if self.thread is None:
+                self.selector = selectors.DefaultSelector()
+                self.wake = os.pipe()
+                os.set_blocking(self.wake[0], False)
+                self.selector.register(self.wake[0], selectors.EVENT_READ)
+                self.thread = threading.Thread(target=self.run,
+                        name='seelie-output', daemon=True)
+                self.thread.start()
+            self.pending.append(stream)
+        os.write(self.wake[1], b'\0')
+        return stream
+
+    def run(self):
+        """
+        Reads the pipes as data arrives, forever.
+        """
+        while True:
+            for key, _ in self.selector.select():
+                if key.data is None:
+                    try:
+                        os.read(self.wake[0], 4096)
+                    except BlockingIOError:
+                        pass
+                    with self.lock:
+                        pending, self.pending = self.pending, []
+                    for stream in pending:
+                        self.selector.register(stream.pipe,
+                                selectors.EVENT_READ, stream)
+                    continue
+                stream = key.data
+                try:
+                    data = os.read(key.fd, 65536)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b''
+                try:
+                    stream.feed(data)
+                except Exception as emsg:
+                    error_print("Couldn't handle output: %s" % (emsg),
+                            file=sys.stderr)
+                    data = b''
+                if(not data):
+                    self.selector.unregister(stream.pipe)
+                    stream.pipe.close()
+                    stream.done.set()
+
+# reader of the pipes of all commands
+OUTPUT_MUX = OutputMux()
+
+
+class PathMetrics(object):
+
+    """
+    Measurements of one path being synchronized: how long it took, how much
+    CPU time its commands used, their exit status, how much they transferred,
+    and whether the path was skipped because it had nothing to do.
+    """
+
+    def __init__(self, path, tool=None, mode=None, host=None):
+        """
+        Initializes the metrics.
+
+        Keyword arguments:
+        path -- the path being synchronized
+        tool -- the name of its synchronizer
+        mode -- a string, one of "update", "push", or "resolve"
+        host -- the remote host of the path, or None if it's local
+        """
+        self.path = path
+        self.tool = tool
+        self.mode = mode
+        self.host = host
+        self.start = time.time()
+        self.wall_time = 0.0
+        self.cpu_user = 0.0
+        self.cpu_system = 0.0
+        self.commands = 0
+        self.exit_status = None
+        self.objects = 0
+        self.bytes = 0
+        self.skipped = False
+        self.error = False
+        # whether the last attempt timed out, and how many attempts did
+        self.timed_out = False
+        self.timeouts = 0
+        # attempts made after the first one
+        self.retries = 0
+        # whether a command of the last attempt failed in a way that might
+        # not happen again
+        self.transient = False
+        # bytes of disk space freed by maintenance, and a dict of what it
+        # measured before and after, or None if the path wasn't maintained
+        self.disk_saved = 0
+        self.maintenance = None
+        # number of paths that were synchronized together with this one
+        self.batch = 1
+        self.lock = threading.Lock()
+
+    def add_command(self, status, user, system):
+        """
+        Adds a finished command. The exit status kept is that of the last
+        command that failed, or 0 if none did.
+        """
+        with self.lock:
+            self.commands += 1
+            self.cpu_user += user
+            self.cpu_system += system
+            if(status or not self.exit_status):
+                self.exit_status = status
+
+    def finish(self, error):
+        """
+        Records the end of the synchronization and whether it had an error.
+        """
+        self.wall_time = time.time() - self.start
+        self.error = bool(error)
+
+    def split(self, items, errors):
+        """
+        Returns metrics for each path of a batch that these metrics measured
+        together, with the times and transfers shared equally between them.
+
+        Keyword arguments:
+        items -- the SeeliePath objects of the batch
+        errors -- whether each path had an error
+        """
+        n = len(items)
+        shares = []
+        for item, error in zip(items, errors):
+            share = PathMetrics(item.path, self.tool, self.mode,
+                    remote_host(item.origin))
+            share.start = self.start
+            share.wall_time = self.wall_time / n
+            share.cpu_user = self.cpu_user / n
+            share.cpu_system = self.cpu_system / n
+            share.commands = self.commands
+            share.exit_status = self.exit_status if error else 0
+            share.objects = self.objects // n
+            share.bytes = self.bytes // n
+            share.skipped = self.skipped
+            share.error = bool(error)
+            share.timed_out = self.timed_out and bool(error)
+            share.timeouts = self.timeouts
+            share.retries = self.retries
+            share.batch = n
+            shares.append(share)
+        return shares
+
+    def as_dict(self):
+        """
+        Returns the metrics as a dict for the JSON report.
+        """
+        return {
+                'path': self.path,
+                'tool': self.tool,
+                'mode': self.mode,
+                'host': self.host,
+                'start': round(self.start, 3),
+                'wall_time': round(self.wall_time, 6),
+                'cpu_user': round(self.cpu_user, 6),
+                'cpu_system': round(self.cpu_system, 6),
+                'commands': self.commands,
+                'exit_status': self.exit_status,
+                'objects': self.objects,
+                'bytes': self.bytes,
+                'skipped': self.skipped,
+                'error': self.error,
+                'timed_out': self.timed_out,
+                'timeouts': self.timeouts,
+                'retries': self.retries,
+                'batch': self.batch,
+                'disk_saved': self.disk_saved,
+                'maintenance': self.maintenance,
+                }
+
+
+class RunReport(object):
+
+    """
+    The metrics of every path synchronized during a run, written out as a
+    JSON report and optionally as a Prometheus textfile collector file.
+    """
+
+    # prefix of the Prometheus metric names
+    prefix = 'seelie'
+
+    def __init__(self, mode):
+        """
+        Initializes the report.
+
+        Keyword arguments:
+        mode -- a string, one of "update", "push", or "resolve"
+        """
+        self.mode = mode
+        self.start = time.time()
+        self.end = None
+        self.paths = []
+        self.lock = threading.Lock()
+
+    def add(self, metrics):
+        """
+        Adds the PathMetrics of a path.
+        """
+        with self.lock:
+            self.paths.append(metrics)
+
+    def finish(self):
+        """
+        Records the end of the run.
+        """
+        if self.end is None:
+            self.end = time.time()
+
+    def as_dict(self):
+        """
+        Returns the report as a dict for JSON.
+        """
+        with self.lock:
+            paths = [m.as_dict() for m in self.paths]
+        return {
+                'version': 1,
+                'mode': self.mode,
+                'host': socket.gethostname(),
+                'start': round(self.start, 3),
+                'wall_time': round((self.end or time.time()) - self.start, 6),
+                'paths': paths,
+                'errors': sum(1 for m in paths if m['error']),
+                'skipped': sum(1 for m in paths if m['skipped']),
+                'timeouts': sum(1 for m in paths if m['timed_out']),
+                'retries': sum(m['retries'] for m in paths),
+                'disk_saved': sum(m['disk_saved'] for m in paths),
+                }
+
+    def save(self, directory, keep=100):
+        """
+        Writes the JSON report to a new file in directory, named after the
+        start time and mode of the run, and removes all but the newest keep
+        reports. Returns the name of the file.
+        """
+        directory = os.path.expanduser(directory)
+        filename = os.path.join(directory, '%s-%s.json' % (time.strftime(
+            '%Y%m%dT%H%M%S', time.localtime(self.start)), self.mode))
+        text = json.dumps(self.as_dict(), indent=1, sort_keys=True)
+        RunReport.write(filename, text + '\n')
+        reports = sorted(x for x in os.listdir(directory)
+                if x.endswith('.json') and not x.startswith('.'))
+        for name in reports[:max(len(reports) - keep, 0)]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+        return filename
+
+    def save_prometheus(self, filename):
+        """
+        Writes the report in the Prometheus text format, for the textfile
+        collector of node_exporter.
+        """
+        data = self.as_dict()
+        gauges = (
+                ('path_duration_seconds', 'Wall time spent synchronizing the '
+                    'path.', lambda m: m['wall_time']),
+                ('path_cpu_seconds', 'CPU time used by the commands that '
+                    'synchronized the path.',
+                    lambda m: m['cpu_user'] + m['cpu_system']),
+                ('path_exit_status', 'Exit status of the last failed command '
+                    'of the path, or 0.', lambda m: m['exit_status'] or 0),
+                ('path_error', '1 if the path had an error.',
+                    lambda m: int(m['error'])),
+                ('path_skipped', '1 if the path had nothing to synchronize.',
+                    lambda m: int(m['skipped'])),
+                ('path_timed_out', '1 if the last attempt at the path timed '
+                    'out.', lambda m: int(m['timed_out'])),
+                ('path_retries', 'Attempts at the path after the first one.',
+                    lambda m: m['retries']),
+                ('path_transferred_objects', 'Git objects or files '
+                    'transferred for the path.', lambda m: m['objects']),
+                ('path_transferred_bytes', 'Bytes transferred for the path.',
+                    lambda m: m['bytes']),
+                ('path_disk_saved_bytes', 'Bytes of disk space freed by '
+                    'maintaining the path.', lambda m: m['disk_saved']),
+                )
+        lines = []
+        for name, text, value in gauges:
+            name = '%s_%s' % (RunReport.prefix, name)
+            lines.append('# HELP %s %s' % (name, text))
+            lines.append('# TYPE %s gauge' % (name))
+            for m in data['paths']:
+                labels = RunReport.labels((('path', m['path']),
+                    ('tool', m['tool']), ('mode', m['mode']),
+                    ('host', m['host'] or '')))
+                lines.append('%s{%s} %s' % (name, labels, value(m)))
+        labels = RunReport.labels((('mode', data['mode']),))
+        totals = (
+                ('run_start_time_seconds', 'Time the last run started.',
+                    data['start']),
+                ('run_duration_seconds', 'Wall time of the last run.',
+                    data['wall_time']),
+                ('run_paths', 'Paths synchronized in the last run.',
+                    len(data['paths'])),
+                ('run_errors', 'Paths with errors in the last run.',
+                    data['errors']),
+                ('run_skipped', 'Paths skipped in the last run.',
+                    data['skipped']),
+                ('run_timeouts', 'Paths that timed out in the last run.',
+                    data['timeouts']),
+                ('run_retries', 'Retries of paths in the last run.',
+                    data['retries']),
+                ('run_disk_saved_bytes', 'Bytes of disk space freed by '
+                    'maintenance in the last run.', data['disk_saved']),
+                )
+        for name, text, value in totals:
+            name = '%s_%s' % (RunReport.prefix, name)
+            lines.append('# HELP %s %s' % (name, text))
+            lines.append('# TYPE %s gauge' % (name))
+            lines.append('%s{%s} %s' % (name, labels, value))
+        RunReport.write(os.path.expanduser(filename), '\n'.join(lines) + '\n')
+
+    @staticmethod
+    def labels(pairs):
+        """
+        Returns Prometheus labels for (name, value) pairs, leaving out those
+        whose value is None.
+        """
+        return ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace(
+            '"', '\\"').replace('\n', '\\n')) for k, v in pairs
+            if v is not None)
+
+    @staticmethod
+    def write(filename, text):
+        """
+        Replaces a file in one step, so that it's never read half written.
+        """
+        save_atomic(filename, lambda f: f.write(text), 'w', '.report-',
+                0o644)
+
+
+class PathStatus(object):
+
+    """
+    What a path would need synchronized, read without changing it: whether it
+    has uncommitted changes, how far it is ahead of and behind its remote,
+    and when it was last synchronized.
+    """
+
+    columns = ('path', 'dirty', 'ahead', 'behind', 'last sync')
+
+    def __init__(self, path, tool=None, synced=None):
+        """
+        Initializes the status with nothing known yet.
+
+        Keyword arguments:
+        path -- the path being inspected
+        tool -- the name of its synchronizer
+        synced -- time of its last successful update or push, or None
+        """
+        self.path = path
+        self.tool = tool
+        self.synced = synced
+        # None wherever the tool can't tell
+        self.dirty = None
+        self.ahead = None
+        self.behind = None
+        # whether the remote has changes that haven't been fetched, so that
+        # the path is further behind than counted
+        self.changed = False
+        self.error = False
+
+    def cells(self):
+        """
+        Returns the strings shown for the status in a table, in the order of
+        columns.
+        """
+        if self.error:
+            return [self.path, 'error', '', '', '']
+        dirty = {None: '-', True: 'yes', False: 'no'}[self.dirty]
+        ahead = '-' if self.ahead is None else str(self.ahead)
+        behind = '-' if self.behind is None else str(self.behind)
+        if self.changed:
+            behind = ('' if self.behind is None else behind) + '+'
+        synced = 'never'
+        if self.synced is not None:
+            synced = time.strftime('%Y-%m-%d %H:%M',
+                    time.localtime(self.synced))
+        return [self.path, dirty, ahead, behind, synced]
+
+    @staticmethod
+    def table(statuses, file=sys.stdout):
+        """
+        Prints statuses as a table with a header and aligned columns, in the
+        success colors for paths that are in sync, the colors for unknown for
+        paths with something to synchronize, and the error colors for paths
+        that couldn't be inspected.
+        """
+        rows = [list(PathStatus.columns)] + [x.cells() for x in statuses]
+        widths = [max(len(row[i]) for row in rows)
+                for i in range(len(PathStatus.columns))]
+        for i, row in enumerate(rows):
+            line = '  '.join(c.ljust(w) for c, w in zip(row, widths)).rstrip()
+            if(i == 0):
+                project_print(line, file=file)
+            elif statuses[i - 1].error:
+                error_print(line, file=file)
+            elif(statuses[i - 1].dirty or statuses[i - 1].ahead or
+                    statuses[i - 1].behind or statuses[i - 1].changed):
+                unknown_print(line, file=file)
+            else:
+                success_print(line, file=file)
+
+
+class PathResult(object):
+
+    """
+    The outcome of one path of a run, as handed out by Seelie.results while
+    the run goes on: the path, its tool and the mode, whether it worked, how
+    long it took and the output of its commands.
+    """
+
+    def __init__(self, path, tool=None, mode=None, status='ok', duration=0.0,
+            output=(), metrics=None, details=None):
+        """
+        Initializes the result.
+
+        Keyword arguments:
+        path -- the path that was synchronized
+        tool -- the name of its synchronizer
+        mode -- a string, one of "update", "push", "resolve", "status", or
+            "maintain"
+        status -- "ok", "skipped" if it had nothing to do, or "error"
+        duration -- seconds it took
+        output -- a list of (stream, text) tuples of the lines of output of
+            its commands, where stream is "stdout", "stderr" or "seelie"
+        metrics -- its PathMetrics, or None if it has none
+        details -- its PathStatus in a status run, or None
+        """
+        self.path = path
+        self.tool = tool
+        self.mode = mode
+        self.status = status
+        self.duration = duration
+        self.output = list(output)
+        self.metrics = metrics
+        self.details = details
+
+    @property
+    def error(self):
+        """
+        True if the path had an error.
+        """
+        return self.status == 'error'
+
+    def show(self, announce=True, file=sys.stdout):
+        """
+        Prints whether the path worked, after its name if announce is True.
+        """
+        if(announce):
+            path_print('\t', self.path, sep='', end='', file=file)
+            project_print('... ', sep='', end='', file=file)
+        if(self.error):
+            error_print('failed!', file=file)
+        else:
+            success_print('ok', file=file)
+
+    def as_dict(self):
+        """
+        Returns the result as a dict that can be written as JSON.
+        """
+        return {
+                'path': self.path,
+                'tool': self.tool,
+                'mode': self.mode,
+                'status': self.status,
+                'duration': round(self.duration, 6),
+                'output': [list(x) for x in self.output],
+                'metrics': None if self.metrics is None else
+                    self.metrics.as_dict(),
+                }
+
+
+class SeelieCancelled(Exception):
+
+    """
+    Raised inside a run whose results stopped being read, to end it.
+    """
+
+
+def make_watcher(interval=5.0, skip=('.git',)):
+    """
+    Returns an InotifyWatcher if inotify is available, and a PollingWatcher
+    otherwise.
+
+    Keyword arguments:
+    interval -- seconds between scans for the PollingWatcher
+    skip -- names of entries whose changes are ignored
+    """
+    try:
+        return InotifyWatcher(skip=skip)
+    except OSError:
+        return PollingWatcher(interval=interval, skip=skip)
+
+
+class Watcher(object):
+
+    """
+    Abstract base class for watchers of changes below a set of directories.
+    """
+
+    def add(self, root):
+        """
+        Starts watching everything below a directory.
+        """
+        raise NotImplementedError("abstract class")
+
+    def wait(self, timeout=None):
+        """
+        Waits for changes for up to timeout seconds (forever if None) and
+        returns the set of watched directories that changed.
+        """
+        raise NotImplementedError("abstract class")
+
+    def close(self):
+        """
+        Stops watching.
+        """
+        pass
+
+
+class InotifyWatcher(Watcher):
+
+    """
+    Watches directories recursively using Linux inotify, with one watch for
+    each directory below them.
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+            IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+            IN_MOVE_SELF | IN_ONLYDIR)
+
+    def __init__(self, skip=('.git',)):
+        """
+        Initializes the watcher. Raises OSError if inotify isn't available.
+
+        Keyword arguments:
+        skip -- names of entries whose changes are ignored
+        """
+        self.skip = set(skip)
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                    use_errno=True)
+            self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        except (OSError, AttributeError, TypeError):
+            raise OSError(errno.ENOSYS, "inotify isn't available")
+        if(self.fd < 0):
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        # dict of watch descriptors to their directory and set of roots
+        self.watches = {}
+        self.roots = set()
+
+    def add(self, root):
+        """
+        Starts watching a directory and all directories below it. Raises
+        OSError if the watches can't be added, such as when the inotify watch
+        limit is reached.
+        """
+        self.roots.add(root)
+        self.add_tree(root, set((root,)))
+
+    def add_tree(self, top, roots):
+        """
+        Adds watches for a directory and all directories below it.
+        """
+        for dirpath, dirnames, filenames in os.walk(top):
+            dirnames[:] = [d for d in dirnames if not d in self.skip]
+            self.add_watch(dirpath, roots)
+
+    def add_watch(self, directory, roots):
+        """
+        Adds a watch for a single directory on behalf of the given roots.
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory),
+                self.MASK)
+        if(wd < 0):
+            code = ctypes.get_errno()
+            # the directory went away or can't be read, so nothing to watch
+            if(code in (errno.ENOENT, errno.ENOTDIR, errno.EACCES)):
+                return
+            raise OSError(code, os.strerror(code), directory)
+        watch = self.watches.setdefault(wd, (directory, set()))
+        watch[1].update(roots)
+
+    def wait(self, timeout=None):
+        """
+        Waits for changes for up to timeout seconds (forever if None) and
+        returns the set of watched directories that changed.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if(not ready):
+            return set()
+        data = os.read(self.fd, 1 << 16)
+        changed = set()
+        offset = 0
+        while(offset + 16 <= len(data)):
+            wd, mask, cookie, length = struct.unpack_from('iIII', data,
+                    offset)
+            name = os.fsdecode(data[offset + 16:offset + 16 + length]
+                    .rstrip(b'\0'))
+            offset += 16 + length
+            if(mask & self.IN_Q_OVERFLOW):
+                # events were lost, so anything could have changed
+                changed |= self.roots
+                continue
+            if(not wd in self.watches):
+                continue
+            directory, roots = self.watches[wd]
+            if(mask & self.IN_IGNORED):
+                del self.watches[wd]
+                continue
+            if(name in self.skip):
+                continue
+            changed |= roots
+            # watch new directories too
+            if(mask & self.IN_ISDIR and
+                    mask & (self.IN_CREATE | self.IN_MOVED_TO)):
+                self.add_tree(os.path.join(directory, name), roots)
+        return changed
+
+    def close(self):
+        """
+        Stops watching.
+        """
+        if(self.fd >= 0):
+            os.close(self.fd)
+            self.fd = -1
+        self.watches = {}
+
+
+class PollingWatcher(Watcher):
+
+    """
+    Watches directories by scanning them with tree_fingerprint at a fixed
+    interval, for systems without inotify.
+    """
+
+    def __init__(self, interval=5.0, skip=('.git',)):
+        """
+        Initializes the watcher.
+
+        Keyword arguments:
+        interval -- seconds between scans
+        skip -- names of entries whose changes are ignored
+        """
+        self.interval = interval
+        self.skip = tuple(skip)
+        # dict of roots to their last fingerprints
+        self.fingerprints = {}
+        self.next_scan = time.time() + interval
+
+    def add(self, root):
+        """
+        Starts watching everything below a directory.
+        """
+        self.fingerprints[root] = tree_fingerprint(root, self.skip)
+
+    def wait(self, timeout=None):
+        """
+        Waits for changes for up to timeout seconds (forever if None) and
+        returns the set of watched directories that changed.
+        """
+        end = None if timeout is None else time.time() + timeout
+        while True:
+            now = time.time()
+            if(end is not None and end < self.next_scan):
+                time.sleep(max(end - now, 0))
+                return set()
+            time.sleep(max(self.next_scan - now, 0))
+            self.next_scan = time.time() + self.interval
+            changed = set()
+            for root, old in self.fingerprints.items():
+                new = tree_fingerprint(root, self.skip)
+                if(new != old):
+                    self.fingerprints[root] = new
+                    changed.add(root)
+            if(changed):
+                return changed
+
+
+class ProjectGraph(object):
+
+    """
+    The graph of projects, with edges from each project to the projects it
+    references and to the projects named in its "after" attribute.
+    """
+
+    def __init__(self, projects, names):
+        """
+        Initializes the graph.
+
+        Keyword arguments:
+        projects -- a list of SeelieProject objects
+        names -- a dict of project names to indices
+        """
+        # list of the indices of the projects each project references
+        self.refs = [[names[x.name] for x in p
+            if isinstance(x, SeelieRef) and x.name in names]
+            for p in projects]
+        # list of the indices of the projects each project waits for
+        self.after = [[names[n] for n in p.after if n in names]
+                for p in projects]
+        # names in "after" attributes that aren't projects
+        self.unknown = sorted(set(n for p in projects for n in p.after
+            if not n in names))
+
+    def reachable(self, starts):
+        """
+        Returns the set of projects that are reachable from the given project
+        indices through references, including the projects themselves.
+        """
+        seen = set()
+        stack = list(starts)
+        while stack:
+            i = stack.pop()
+            if(i in seen):
+                continue
+            seen.add(i)
+            stack.extend(self.refs[i])
+        return seen
+
+    def cycles(self, edges=None):
+        """
+        Returns a list of the cycles found by a depth first search, each as a
+        list of project indices that starts and ends with the same project.
+
+        Keyword arguments:
+        edges -- a list of the successors of each project, or None for both
+            references and "after" edges
+        """
+        if edges is None:
+            edges = [r + a for r, a in zip(self.refs, self.after)]
+        # 0 for unvisited, 1 for on the current path, 2 for finished
+        state = [0] * len(edges)
+        cycles = []
+        for start in range(len(edges)):
+            if(state[start]):
+                continue
+            path = [start]
+            state[start] = 1
+            stack = [iter(edges[start])]
+            while stack:
+                for j in stack[-1]:
+                    if(state[j] == 1):
+                        cycles.append(path[path.index(j):] + [j])
+                    elif(state[j] == 0):
+                        state[j] = 1
+                        path.append(j)
+                        stack.append(iter(edges[j]))
+                        break
+                else:
+                    state[path.pop()] = 2
+                    stack.pop()
+        return cycles
+
+    def report(self, projects, file=sys.stderr, known=()):
+        """
+        Prints the cycles in the graph and the unknown "after" names.
+
+        Keyword arguments:
+        projects -- the list of SeelieProject objects the graph was made from
+        known -- names that are defined elsewhere, like in the shards of the
+            config that aren't parsed yet, and aren't reported as unknown
+        """
+        def name(i):
+            return projects[i].name or ('project #%d' % (i+1))
+        for cycle in self.cycles(self.refs):
+            print("Reference cycle:", ' -> '.join(name(i) for i in cycle),
+                    file=file)
+        for cycle in self.cycles(self.after):
+            print("Ordering cycle, ignored while it lasts:",
+                    ' -> '.join(name(i) for i in cycle), file=file)
+        for n in self.unknown:
+            if(n in known):
+                continue
+            print("Unknown project '%s' in after attribute" % (n), file=file)
+
+
+class PathTrie(object):
+
+    """
+    A prefix tree of the canonical paths of a run, with symlinks resolved,
+    and one node for each path component, for finding the paths that are
+    the same directory or inside one another.
+    """
+
+    def __init__(self):
+        # nodes are dicts of path components to nodes, and the paths that
+        # end at a node are kept in a list under None
+        self.root = {}
+
+    @staticmethod
+    def canonical(path):
+        """
+        Returns the components of the canonical form of a path.
+        """
+        return [x for x in os.path.realpath(path).split(os.sep) if x]
+
+    def find(self, item):
+        """
+        Returns the list of the paths already in the tree that are the same
+        directory as a path.
+        """
+        node = self.root
+        for part in PathTrie.canonical(item.key):
+            node = node.get(part)
+            if node is None:
+                return []
+        return node.get(None, [])
+
+    def insert(self, item):
+        """
+        Adds a SeeliePath to the tree.
+        """
+        node = self.root
+        for part in PathTrie.canonical(item.key):
+            node = node.setdefault(part, {})
+        node.setdefault(None, []).append(item)
+
+    def overlaps(self):
+        """
+        Returns a dict mapping the key of each path that overlaps paths added
+        before it, because it's the same directory or inside them, to the
+        list of those paths, starting with the outermost. Paths inside others
+        overlap them regardless of the order they were added in.
+        """
+        overlaps = {}
+        # nodes to visit, with the paths of the directories containing them
+        stack = [(self.root, [])]
+        while stack:
+            node, outer = stack.pop()
+            items = node.get(None, [])
+            for i, item in enumerate(items):
+                if(outer or i):
+                    overlaps[item.key] = outer + items[:i]
+            outer = outer + items
+            stack.extend((child, outer) for part, child in node.items()
+                    if part is not None)
+        return overlaps
+
+
+class Scheduler(object):
+
+    """
+    Hands out the groups of a run in the order they should start. A group is
+    ready once the groups it waits for have finished and its held paths have
+    been let go, and the ready group with the lowest weight starts first.
+    Groups of hosts that are running as many groups as they allow wait, and
+    of ready groups whose weights have the same first item, those of the
+    hosts running the fewest groups start first, so that the hosts are kept
+    busy evenly.
+    """
+
+    def __init__(self, count, deps, weights, held=None, hosts=None,
+            caps=None):
+        """
+        Initializes the scheduler.
+
+        Keyword arguments:
+        count -- the number of groups
+        deps -- a dict mapping group indices to the sets of groups they wait
+            for
+        weights -- a list of sortable tuples, one for each group
+        held -- a dict mapping group indices to the number of their paths
+            whose local work hasn't been done yet, or None
+        hosts -- a list of the host of each group, or None if it's local,
+            or None if no group has a host
+        caps -- a dict mapping hosts to the number of their groups that may
+            run at once, or None for no limits
+        """
+        self.weights = weights
+        self.hosts = hosts or [None] * count
+        self.caps = caps or {}
+        self.held = dict((g, n) for g, n in (held or {}).items() if n)
+        self.waiting = dict((g, set(deps.get(g, ()))) for g in range(count))
+        # dict of groups to the groups waiting for them
+        self.dependents = {}
+        for g, waits in self.waiting.items():
+            for h in waits:
+                self.dependents.setdefault(h, set()).add(g)
+        # dict of hosts to heaps of their ready groups
+        self.ready = {}
+        for g in list(self.waiting):
+            self.release(g)
+        self.running = 0
+        # dict of hosts to the number of their groups running
+        self.busy = {}
+
+    def release(self, g):
+        """
+        Moves a waiting group to the ready queue if it doesn't wait for
+        anything anymore.
+        """
+        if(g in self.waiting and not self.waiting[g] and
+                not g in self.held):
+            del self.waiting[g]
+            heapq.heappush(self.ready.setdefault(self.hosts[g], []),
+                    (self.weights[g], g))
+
+    def next(self):
+        """
+        Returns the next group to start, or None if no group is ready or all
+        the ready groups wait for their hosts.
+        """
+        if(not any(self.ready.values()) and self.waiting and
+                not self.running and not self.held):
+            # only a cycle can be left, so break it at its first group
+            g = min(self.waiting, key=lambda g: self.weights[g])
+            self.waiting[g] = set()
+            self.release(g)
+        best = None
+        for host, ready in self.ready.items():
+            busy = self.busy.get(host, 0)
+            if(not ready or (host in self.caps and busy >= self.caps[host])):
+                continue
+            weight = ready[0][0]
+            key = (weight[:1], busy, weight)
+            if(best is None or key < best[0]):
+                best = (key, host)
+        if best is None:
+            return None
+        host = best[1]
+        self.running += 1
+        self.busy[host] = self.busy.get(host, 0) + 1
+        return heapq.heappop(self.ready[host])[1]
+
+    def finish(self, g):
+        """
+        Marks a started group as finished, releasing the groups waiting for
+        it.
+        """
+        self.running -= 1
+        self.busy[self.hosts[g]] -= 1
+        for h in self.dependents.pop(g, ()):
+            if(h in self.waiting):
+                self.waiting[h].discard(g)
+                self.release(h)
+
+    def let_go(self, g):
+        """
+        Marks the local work of one held path of a group as done, releasing
+        the group once none of its paths are held.
+        """
+        if(g in self.held):
+            self.held[g] -= 1
+            if(not self.held[g]):
+                del self.held[g]
+                self.release(g)
+
+
+class Seelie(object):
+
+    """
+    Abstract base class for Seelie syncing objects
+    """
+
+    # seconds to wait before the first retry of a path, and at most
+    retry_base_delay = 1.0
+    retry_max_delay = 30.0
+    # number of paths to inspect concurrently for a status by default
+    status_jobs = 32
+    # number of paths to maintain concurrently by default, kept low because
+    # each maintenance is heavy on disk and CPU
+    maintain_jobs = 4
+    # number of paths whose local work, like committing before a push, is
+    # done concurrently ahead of their network work when jobs is above 1
+    local_jobs = os.cpu_count() or 4
+
+    def __init__(self, tree, sync=None, verbose=False, async_sync=None,
+            multiplex=True, state_file=STATE_FILE, projects=None,
+            report_dir=REPORT_DIR, prometheus_file=None, log_dir=LOG_DIR,
+            journal_dir=JOURNAL_DIR, timeout=None, retries=None,
+            manifest_dir=MANIFEST_DIR, index=None, mirror_dir=MIRROR_DIR,
+            hosts=None):
+        """
+        Initializes the Seelie object.
+
+        Keyword arguments:
+        tree -- the root of a seelie XML tree, or None if projects is given.
+            Its <include> elements are only followed by from_file.
+        sync -- a dictionary mapping syncing tool strings (e.g., "git", "rsync")
+            to Sync objects, or None for the default dictionary
+        verbose -- warns the user of potential errors if True
+        async_sync -- like sync, but with the asyncio synchronizers used by
+            apply_async, or None for the default dictionary
+        multiplex -- shares one ssh master connection per host between the
+            default synchronizers for the length of each run if True (default)
+        state_file -- file where the default synchronizers keep information
+            about paths between runs, or None to keep nothing
+        projects -- a list of SeelieProject objects to use instead of reading
+            them from tree
+        report_dir -- directory where a JSON report with the metrics of each
+            path is written after every run, or None to write no reports
+        prometheus_file -- file where the metrics of the last run are written
+            for the Prometheus textfile collector, or None (default)
+        log_dir -- directory where the output of the commands of every run is
+            logged, or None to keep no logs
+        journal_dir -- directory where the paths that finished during runs
+            are recorded, so that the runs can be resumed, or None to keep no
+            journals
+        timeout -- seconds the default synchronizers allow each path that
+            doesn't set its own timeout, or None for their defaults
+        retries -- times the default synchronizers try paths again after
+            transient failures, or None for their defaults
+        manifest_dir -- directory where the default rsync synchronizers keep
+            the manifests of pushed paths, so that later pushes only send
+            what changed, or None to always push everything
+        index -- a ConfigIndex of the shards included by the config, whose
+            projects are parsed once a run needs them, or None if tree or
+            projects hold every project
+        mirror_dir -- directory where the default git synchronizers keep a
+            bare mirror of each remote, fetched once per run, for the working
+            copies of the remote to pull from, or None to pull each working
+            copy from its remote
+        hosts -- a dict mapping host names to SeelieHost objects with the
+            limits of the hosts, or None to read them from tree
+        """
+        # pool of ssh master connections
+        self.ssh = SSHPool() if multiplex else None
+        # information about paths kept between runs
+        self.state = SeelieState(state_file) if state_file else None
+        # metrics of the current run, and where to write them
+        self.report = None
+        self.last_report = None
+        self.report_dir = report_dir
+        self.prometheus_file = prometheus_file
+        # log of the output of the current run, and where to write it
+        self.log = None
+        self.log_dir = log_dir
+        # journal of the paths that finished in the current run
+        self.journal = None
+        self.journal_dir = journal_dir
+        # dict of path keys to the PathStatus of the current status run
+        self.statuses = {}
+        self.statuses_lock = threading.Lock()
+        # dict of path keys to the PathMetrics and PathOutput of the local
+        # work done ahead of their synchronization in the current run
+        self.staged = {}
+        # dict of path keys to the PathMetrics and lines of output of the
+        # paths that finished in the current run, until they're handed out
+        self.outcomes = {}
+        # dict of path keys to the hosts they're synchronized with, found
+        # during the current run
+        self.path_hosts = {}
+        # number of paths the current run synchronizes at once, which the
+        # bandwidth budgets of the hosts are split between
+        self.run_jobs = 1
+        # dictionary of synchronizers
+        limits = {'timeout': timeout, 'retries': retries}
+        if sync is None:
+            git = GitSync(ssh=self.ssh, state=self.state,
+                    mirror_dir=mirror_dir, **limits)
+            sync = {
+                    'git': git,
+                    'rsync': RSync(ssh=self.ssh, state=self.state,
+                        manifest_dir=manifest_dir, **limits),
+                    None: git,
+                    }
+        self.sync = sync
+        if async_sync is None:
+            git = AsyncGitSync(ssh=self.ssh, state=self.state,
+                    mirror_dir=mirror_dir, **limits)
+            async_sync = {
+                    'git': git,
+                    'rsync': AsyncRSync(ssh=self.ssh, state=self.state,
+                        manifest_dir=manifest_dir, **limits),
+                    None: git,
+                    }
+        self.async_sync = async_sync
+        # XML tree
+        self.tree = tree
+        # list of projects
+        if projects is None:
+            if(self.tree.getroot().tag.lower() != 'seelie'):
+                raise TypeError('XML tree root is not seelie')
+            projects = self.xml_to_projects(self.tree, verbose=verbose)
+        self.projects = projects
+        # limits of the hosts
+        if hosts is None:
+            hosts = {}
+            if self.tree is not None:
+                hosts = self.xml_to_hosts(self.tree, verbose=verbose)
+        self.hosts = hosts
+        # shards of the config, and the files whose projects are parsed
+        self.index = index
+        self.loaded = set()
+        if index is not None:
+            self.loaded.add(index.filename)
+        self.link()
+        if verbose:
+            # projects of shards that aren't parsed yet aren't unknown
+            self.graph.report(self.projects,
+                    known=index.shards if index is not None else ())
+
+    def link(self):
+        """
+        Rebuilds the dict of project names, the list of automatic projects
+        and the graph of the projects after they changed.
+        """
+        # dict of project names to indices
+        self.names = dict(zip([p.name for p in self.projects],
+            range(0, len(self.projects))))
+        if(None in self.names):
+            self.names.pop(None)
+        # list of automatic projects (the default list to use)
+        self.auto = [p.name for p in self.projects if p.auto]
+        # graph of references and ordering between projects
+        self.graph = ProjectGraph(self.projects, self.names)
+
+    def require(self, names=None, verbose=False):
+        """
+        Parses the shards of the config that define the projects in names, or
+        those with automatic projects if names is None, and the shards of
+        every project they reference, unless they're parsed already. Names
+        that no shard defines are left for the run to report as unknown.
+
+        Keyword arguments:
+        names -- a list of project names, or None for the automatic projects
+        verbose -- warns the user of potential errors if True
+        """
+        if self.index is None:
+            return
+        if(names is None):
+            self.load(self.index.auto, verbose)
+            stack = [x.name for p in self.projects if p.auto for x in p
+                    if isinstance(x, SeelieRef)]
+        else:
+            stack = list(names)
+        seen = set()
+        while stack:
+            name = stack.pop()
+            if(name in seen):
+                continue
+            seen.add(name)
+            if(not name in self.names):
+                self.load([self.index.shards.get(name)], verbose)
+                if(not name in self.names):
+                    continue
+            stack.extend(x.name for x in self.projects[self.names[name]]
+                    if isinstance(x, SeelieRef))
+
+    def load(self, files, verbose=False):
+        """
+        Parses the given shards of the config, unless they're parsed already,
+        and adds their projects.
+
+        Keyword arguments:
+        files -- a list of filenames from the ConfigIndex, where None stands
+            for a project no shard defines
+        verbose -- warns the user of potential errors if True
+        """
+        projects = []
+        for filename in files:
+            if(filename is None or filename in self.loaded):
+                continue
+            self.loaded.add(filename)
+            projects.extend(self.index.projects(filename, verbose))
+        if projects:
+            self.projects = self.projects + projects
+            self.link()
+
+    @classmethod
+    def from_file(cls, filename, verbose=False, cache_dir=CACHE_DIR,
+            **kwargs):
+        """
+        Creates a Seelie object from a config file. The parsed projects are
+        cached in cache_dir, and the cache is used for as long as the file
+        keeps the same modification time and size. Files included with
+        <include> elements, relative to the file including them, are shards
+        whose projects are parsed and cached once a run needs them.
+        Further arguments are passed to the constructor.
+
+        Keyword arguments:
+        filename -- the seelie XML config file
+        verbose -- warns the user of potential errors if True
+        cache_dir -- directory for the cache, or None to always parse the file
+        """
+        filename = os.path.abspath(os.path.expanduser(filename))
+        # only the projects of the config file itself are parsed now, and
+        # those of its shards once they're needed
+        index = ConfigIndex(filename, cache_dir).load()
+        if(len(index.files) == 1):
+            index = None
+        cache = None
+        if cache_dir is not None:
+            cache = ConfigCache(filename, cache_dir)
+            projects = cache.load()
+            if projects is not None:
+                return cls(None, verbose=verbose, projects=projects,
+                        index=index, hosts=cache.hosts, **kwargs)
+        tree = etree.parse(filename)
+        seelie = cls(tree, verbose=verbose, index=index, **kwargs)
+        if cache is not None:
+            cache.save(seelie.projects, seelie.hosts)
+        return seelie
+
+    @staticmethod
+    def xml_to_projects(tree, verbose=False):
+        """
+        Reads the seelie projects from the given xml tree and returns a list of
+        SeelieProject objects.
+
+        Keyword arguments:
+        tree -- the root of a seelie XML tree
+        verbose -- warns the user of potential errors if True
+        """
+        i = 0
+        projs = []
+        for proj in tree.getroot():
+            i = i+1
+            if(proj.tag.lower() in ('include', 'host')):
+                # shards are read by ConfigIndex, and hosts by xml_to_hosts
+                continue
+            elif(proj.tag.lower() != 'project'):
+                if(verbose):
+                    print("Ignored seelie child %i, tag='%s'" % (i, proj.tag),
+                            file=sys.stderr)
+                continue
+            # get the list of objects for it
+            cur = SeelieProject(proj, verbose=verbose, i=i)
+            projs.append(cur)
+        return projs
+
+    @staticmethod
+    def xml_to_hosts(tree, verbose=False):
+        """
+        Reads the limits of the hosts from the <host> elements of the given
+        xml tree and returns a dict mapping host names to SeelieHost objects.
+        Hosts are only read from the config file itself, not its shards.
+
+        Keyword arguments:
+        tree -- the root of a seelie XML tree
+        verbose -- warns the user of potential errors if True
+        """
+        hosts = {}
+        for i, node in enumerate(tree.getroot(), 1):
+            if(node.tag.lower() != 'host'):
+                continue
+            host = SeelieHost(node, verbose=verbose, i=i)
+            if host.name is None:
+                if verbose:
+                    print("No name set for host #%d" % (i), file=sys.stderr)
+                continue
+            hosts[host.name] = host
+        return hosts
+    
+    def apply(self, mode, names=None, verbose=False, jobs=1, *args,
+            resume=False, on_result=None, **kwargs):
+        """
+        Depending on the mode either updates, pushes, resolves, prints the
+        status of, or maintains the projects specified by names (all by
+        default).
+        Further arguments are passed to the synchronizer.
+
+        Keyword arguments:
+        mode -- a string, one of "update", "push", "resolve", "status", or
+            "maintain"
+        names -- a list of project names or indices, or None for all automatic
+            projects (default)
+        verbose -- printing level
+        jobs -- number of paths to synchronize concurrently (default 1)
+        resume -- skips the paths that finished without errors in the last
+            run of the same config and mode if True
+        on_result -- function called with a PathResult for each path as it
+            finishes, which then shows the paths instead of apply, or None
+        """
+        if(not mode in ('update', 'push', 'resolve', 'status', 'maintain')):
+            raise ValueError("unknown mode: '%s'" % (mode))
+        # status runs change nothing, so there's nothing to resume
+        self.begin(mode, resume=(None if mode == 'status' else resume),
+                jobs=jobs)
+        run = SeelieRun(self, names=names, verbose=verbose,
+                journal=self.journal, quiet=(mode == 'status' and
+                    verbose < 2), on_result=on_result)
+
+        def sync_now(item):
+            """
+            Synchronizes a single path right away, unless it was already
+            visited, and prints its status.
+            """
+            # check if already visited, otherwise apply the function
+            if(item.key in run.visited_paths):
+                return (item.key in run.error_paths)
+            # print the name
+            if(verbose == 1 and run.shows_paths()):
+                path_print('\t', item.path, sep='', end='')
+                project_print('... ', sep='', end='', flush=True)
+            run.visited_paths.add(item.key)
+            if(item.key in batched):
+                error = batched[item.key]
+            else:
+                error = self.sync_path(item, mode, verbose, *args, **kwargs)
+            # print the name if needed
+            if(verbose > 1 and run.shows_paths()):
+                path_print('\t', item, " ", sep='', end='')
+            run.finish_path(item, error)
+            return error
+
+        try:
+            # group the paths that their tools can synchronize together, but
+            # keep the paths that are ordered by "after" on their own
+            pending = run.collect()
+            # aliases of paths aren't synchronized twice, and paths that
+            # certainly have nothing to do aren't synchronized at all
+            settled, overlaps = self.overlaps(pending, mode, self.sync,
+                    verbose)
+            keys = set(x.key for x in settled)
+            settled += self.prefilter([x for x in pending
+                if not x.key in keys], mode, self.sync, **kwargs)
+            if(settled):
+                keys = set(x.key for x in settled)
+                pending = [x for x in pending if not x.key in keys]
+            prerequisites = {}
+            if(mode != 'status'):
+                prerequisites = self.prerequisites(run, pending)
+                # overlapping paths wait for the paths they overlap
+                for key, waits in overlaps.items():
+                    prerequisites.setdefault(key, set()).update(waits)
+            ordered = set(prerequisites)
+            for keys in prerequisites.values():
+                ordered |= keys
+            groups = self.batches(pending, mode, exclude=ordered)
+            if(jobs is None or jobs <= 1):
+                # synchronize the batches first, then iterate over the
+                # projects one path at a time
+                batched = dict((x.key, False) for x in settled)
+                for group in groups:
+                    if(len(group) > 1):
+                        errors = self.sync_batch(group, mode, verbose, *args,
+                                **kwargs)
+                        batched.update(zip([x.key for x in group], errors))
+                run.walk(sync_now)
+            else:
+                # synchronize the groups on a pool of worker threads, in the
+                # order given by the scheduler, while the local work of the
+                # paths is done ahead on a pool of its own
+                for item in settled:
+                    run.finish_path(item, False, announce=True)
+                # paths that wait for others, by "after" or because they
+                # overlap them, do their local work in turn with the rest of
+                # their synchronization instead
+                staged = [(g, item) for g, group in enumerate(groups)
+                        for item in group if mode in
+                        getattr(self.sync[item.tool], 'local_stages', {})
+                        and not item.key in prerequisites]
+                held = {}
+                for g, item in staged:
+                    held[g] = held.get(g, 0) + 1
+                scheduler = self.schedule(run, groups, prerequisites, held)
+                with concurrent.futures.ThreadPoolExecutor(
+                        max_workers=jobs) as pool, \
+                        concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.local_jobs) as local_pool:
+                    local = dict((local_pool.submit(self.stage_path, item,
+                        mode, verbose, *args, **kwargs), g)
+                        for g, item in staged)
+                    futures = {}
+                    try:
+                        while True:
+                            while(len(futures) < jobs):
+                                g = scheduler.next()
+                                if g is None:
+                                    break
+                                futures[pool.submit(self.sync_batch,
+                                    groups[g], mode, verbose, *args,
+                                    **kwargs)] = g
+                            if(not futures and not local):
+                                break
+                            try:
+                                done, _ = concurrent.futures.wait(
+                                    list(futures) + list(local), return_when=
+                                    concurrent.futures.FIRST_COMPLETED)
+                            except KeyboardInterrupt:
+                                # commands with timeouts are in process
+                                # groups of their own, which the interrupt
+                                # doesn't reach
+                                Watchdog.kill_all()
+                                raise
+                            for future in done:
+                                if(future in local):
+                                    # errors of the local work are reported
+                                    # by the synchronization that follows it
+                                    scheduler.let_go(local.pop(future))
+                                    continue
+                                g = futures.pop(future)
+                                try:
+                                    errors = future.result()
+                                except Exception as emsg:
+                                    # the paths failed, but the others are
+                                    # still collected
+                                    errors = [True] * len(groups[g])
+                                    self.record_failure(groups[g], emsg)
+                                    if verbose:
+                                        error_print(emsg)
+                                for item, error in zip(groups[g], errors):
+                                    run.finish_path(item, error,
+                                            announce=True)
+                                scheduler.finish(g)
+                    except BaseException:
+                        # a run that stops early, on an error, a cancelled
+                        # results() or an interrupt, doesn't start the
+                        # queued local work, like commits
+                        for future in list(local) + list(futures):
+                            future.cancel()
+                        raise
+                run.settle()
+        finally:
+            self.close()
+        if(mode == 'status'):
+            # keep the statuses in the order of the paths
+            self.statuses = dict((x.key, self.statuses[x.key])
+                    for x in pending if x.key in self.statuses)
+            if verbose:
+                PathStatus.table(list(self.statuses.values()))
+        run.summary()
+
+    async def apply_async(self, mode, names=None, verbose=False, jobs=64,
+            *args, resume=False, on_result=None, **kwargs):
+        """
+        Coroutine version of apply, using the asyncio synchronizers in
+        self.async_sync. All paths are driven from the running event loop,
+        with at most jobs of them synchronizing at once, in the order apply
+        would start them.
+        Further arguments are passed to the synchronizer.
+
+        Keyword arguments:
+        mode -- a string, one of "update", "push", "resolve", "status", or
+            "maintain"
+        names -- a list of project names or indices, or None for all automatic
+            projects (default)
+        verbose -- printing level
+        jobs -- number of paths to synchronize concurrently (default 64)
+        resume -- skips the paths that finished without errors in the last
+            run of the same config and mode if True
+        on_result -- as for apply
+        """
+        if(not mode in ('update', 'push', 'resolve', 'status', 'maintain')):
+            raise ValueError("unknown mode: '%s'" % (mode))
+        self.begin(mode, resume=(None if mode == 'status' else resume),
+                jobs=jobs)
+        run = SeelieRun(self, names=names, verbose=verbose,
+                journal=self.journal, quiet=(mode == 'status' and
+                    verbose < 2), on_result=on_result)
+        pending = run.collect()
+        loop = asyncio.get_running_loop()
+        settled, overlaps = await loop.run_in_executor(None,
+                functools.partial(self.overlaps, pending, mode,
+                    self.async_sync, verbose))
+        keys = set(x.key for x in settled)
+        settled += await loop.run_in_executor(None, functools.partial(
+            self.prefilter, [x for x in pending if not x.key in keys], mode,
+            self.async_sync, **kwargs))
+        keys = set(x.key for x in settled)
+        for item in settled:
+            run.finish_path(item, False, announce=True)
+        pending = [x for x in pending if not x.key in keys]
+        # the paths are ordered, batched and spread over their hosts as
+        # apply does, by the same scheduler
+        prerequisites = {}
+        if(mode != 'status'):
+            prerequisites = self.prerequisites(run, pending)
+            # overlapping paths wait for the paths they overlap
+            for key, waits in overlaps.items():
+                prerequisites.setdefault(key, set()).update(waits)
+        ordered = set(prerequisites)
+        for keys in prerequisites.values():
+            ordered |= keys
+        groups = self.batches(pending, mode, exclude=ordered)
+        scheduler = await loop.run_in_executor(None, self.schedule, run,
+                groups, prerequisites)
+
+        async def sync_group(group):
+            """
+            Synchronizes a group of paths made by batches, and returns a list
+            with True for each path that had an error.
+            """
+            if(len(group) == 1):
+                return [await self.sync_path_async(group[0], mode, verbose,
+                    *args, **kwargs)]
+            # a batch is a single transfer of the threaded synchronizer,
+            # which runs on the default executor
+            return await loop.run_in_executor(None,
+                    contextvars.copy_context().run, functools.partial(
+                        self.sync_batch, group, mode, verbose, *args,
+                        **kwargs))
+
+        tasks = {}
+        try:
+            while True:
+                while(len(tasks) < max(jobs or 1, 1)):
+                    g = scheduler.next()
+                    if g is None:
+                        break
+                    tasks[asyncio.ensure_future(sync_group(groups[g]))] = g
+                if(not tasks):
+                    break
+                done, _ = await asyncio.wait(list(tasks),
+                        return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    g = tasks.pop(task)
+                    try:
+                        errors = task.result()
+                    except Exception as emsg:
+                        # the paths failed, but the others are still
+                        # collected
+                        errors = [True] * len(groups[g])
+                        self.record_failure(groups[g], emsg)
+                        if verbose:
+                            error_print(emsg)
+                    for item, error in zip(groups[g], errors):
+                        run.finish_path(item, error, announce=True)
+                    scheduler.finish(g)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await loop.run_in_executor(None, self.close)
+        run.settle()
+        if(mode == 'status'):
+            # keep the statuses in the order of the paths
+            self.statuses = dict((x.key, self.statuses[x.key])
+                    for x in pending if x.key in self.statuses)
+            if verbose:
+                PathStatus.table(list(self.statuses.values()))
+        run.summary()
+
+    def results(self, mode, names=None, verbose=False, jobs=1, *args,
+            **kwargs):
+        """
+        Applies a mode like apply, on a thread of its own, and yields a
+        PathResult for each path as it finishes. The run waits while the
+        caller handles each result, so that what the caller prints stays in
+        order with what the run prints. If the caller stops early, no more
+        paths are started, and the generator returns once those being
+        synchronized have finished.
+        Further arguments are passed to apply.
+
+        Keyword arguments:
+        mode, names, verbose, jobs -- as for apply
+        """
+        handoff = queue.Queue()
+        proceed = threading.Semaphore(0)
+        stopped = threading.Event()
+        done = object()
+
+        def on_result(result):
+            handoff.put(result)
+            proceed.acquire()
+            if stopped.is_set():
+                raise SeelieCancelled()
+
+        def run():
+            try:
+                self.apply(mode, names, verbose, jobs, *args,
+                        on_result=on_result, **kwargs)
+            except SeelieCancelled:
+                pass
+            except BaseException as emsg:
+                handoff.put(emsg)
+            handoff.put(done)
+
+        thread = threading.Thread(target=run, name='seelie-results',
+                daemon=True)
+        thread.start()
+        try:
+            while True:
+                result = handoff.get()
+                if(result is done):
+                    break
+                if isinstance(result, BaseException):
+                    raise result
+                yield result
+                proceed.release()
+        except KeyboardInterrupt:
+            # commands with timeouts are in process groups of their own,
+            # which the interrupt doesn't reach
+            Watchdog.kill_all()
+            raise
+        finally:
+            stopped.set()
+            proceed.release()
+            thread.join()
+
+    async def results_async(self, mode, names=None, verbose=False, jobs=64,
+            *args, **kwargs):
+        """
+        Asynchronous generator version of results, applying the mode with
+        apply_async on the running event loop. Results are queued while the
+        caller handles earlier ones, and the run is cancelled if the caller
+        stops early.
+        Further arguments are passed to apply_async.
+
+        Keyword arguments:
+        mode, names, verbose, jobs -- as for apply_async
+        """
+        handoff = asyncio.Queue()
+        done = object()
+
+        async def run():
+            try:
+                await self.apply_async(mode, names, verbose, jobs, *args,
+                        on_result=handoff.put_nowait, **kwargs)
+            finally:
+                handoff.put_nowait(done)
+
+        task = asyncio.ensure_future(run())
+        try:
+            while True:
+                result = await handoff.get()
+                if(result is done):
+                    break
+                yield result
+            # raises the errors of the run
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    def result(self, item, error):
+        """
+        Returns the PathResult of a path that finished in the current run,
+        from the metrics and output recorded for it.
+
+        Keyword arguments:
+        item -- the SeeliePath that finished
+        error -- True if it had an error
+        """
+        metrics, lines = self.outcomes.pop(item.key, (None, []))
+        status = 'ok'
+        if(error):
+            status = 'error'
+        elif(metrics is not None and metrics.skipped):
+            status = 'skipped'
+        return PathResult(item.path, item.tool, None if self.report is None
+                else self.report.mode, status, 0.0 if metrics is None else
+                metrics.wall_time, lines, metrics, self.statuses.get(item.key))
+
+    def record_outcome(self, items, metrics, output=None):
+        """
+        Keeps the metrics and output of finished paths until the run hands
+        them out as PathResult objects.
+
+        Keyword arguments:
+        items -- the SeeliePath objects that finished
+        metrics -- the PathMetrics of each of them
+        output -- the PathOutput they shared, or None if they had none
+        """
+        lines = [] if output is None else list(output.lines)
+        for item, m in zip(items, metrics):
+            self.outcomes[item.key] = (m, lines)
+
+    def record_failure(self, items, emsg):
+        """
+        Adds the exception that stopped the synchronization of paths to their
+        output, so their results and the log of the run tell why they failed.
+
+        Keyword arguments:
+        items -- the SeeliePath objects that failed
+        emsg -- the exception
+        """
+        text = '%s: %s' % (type(emsg).__name__, emsg)
+        for item in items:
+            metrics, lines = self.outcomes.get(item.key, (None, []))
+            self.outcomes[item.key] = (metrics, lines + [('stderr', text)])
+            if self.log is not None:
+                self.log.write(item.path, 'stderr', text)
+
+    def begin(self, mode, resume=None, jobs=1):
+        """
+        Starts the report, log and journal of a run.
+
+        Keyword arguments:
+        mode -- a string, one of "update", "push", or "resolve"
+        resume -- None to keep no journal (default), False to start a new
+            journal, or True to continue the journal of the last run of the
+            same config and mode
+        jobs -- number of paths the run synchronizes at once (default 1)
+        """
+        self.report = RunReport(mode)
+        self.run_jobs = max(jobs or 1, 1)
+        self.statuses = {}
+        self.staged = {}
+        self.outcomes = {}
+        if self.log_dir is not None:
+            self.log = RunLog(self.log_dir, mode)
+        if(resume is not None and self.journal_dir is not None):
+            config = self.config_hash()
+            filename = os.path.join(os.path.expanduser(self.journal_dir),
+                    '%s-%s.jsonl' % (config[:16], mode))
+            try:
+                self.journal = SeelieJournal(filename, config, mode,
+                        resume=resume)
+            except OSError as emsg:
+                error_print("Couldn't open seelie journal: %s" % (emsg),
+                        file=sys.stderr)
+
+    def config_hash(self):
+        """
+        Returns a hash of the projects, which changes whenever the config
+        does.
+        """
+        if self.index is not None:
+            # the shards that aren't parsed yet count too
+            data = json.dumps(self.index.files)
+        else:
+            data = json.dumps(ConfigCache.pack(self.projects), sort_keys=True)
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def close(self):
+        """
+        Releases the resources held between paths of a run, such as ssh master
+        connections and remote heads, and writes its report and log.
+        """
+        tools = list(self.sync.values()) + list(self.async_sync.values())
+        for tool in set(tools):
+            close = getattr(tool, 'close', None)
+            if close is not None:
+                close()
+        if self.ssh is not None:
+            self.ssh.close()
+        if self.state is not None:
+            self.state.save()
+        if self.report is not None:
+            self.save_report()
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self.path_hosts = {}
+
+    def save_report(self):
+        """
+        Writes the metrics of the current run to report_dir and
+        prometheus_file, and forgets them.
+        """
+        report = self.report
+        self.report = None
+        self.last_report = report
+        report.finish()
+        try:
+            if self.report_dir is not None:
+                report.save(self.report_dir)
+            if self.prometheus_file is not None:
+                report.save_prometheus(self.prometheus_file)
+        except OSError as emsg:
+            error_print("Couldn't save seelie report: %s" % (emsg),
+                    file=sys.stderr)
+
+    def record_metrics(self, metrics):
+        """
+        Adds a list of PathMetrics to the report of the current run.
+        """
+        if self.report is not None:
+            for m in metrics:
+                self.report.add(m)
+
+    def batches(self, items, mode, exclude=()):
+        """
+        Splits paths into groups that their tools can synchronize in a single
+        transfer, and returns the list of groups in the order of their first
+        paths. Paths that can't be batched are in groups of their own.
+
+        Keyword arguments:
+        items -- a list of SeeliePath objects
+        mode -- a string, one of "update", "push", or "resolve"
+        exclude -- keys of paths to keep in groups of their own
+        """
+        groups = []
+        # dict of batch keys to indices of the groups being filled
+        open_groups = {}
+        for item in items:
+            key = None
+            batch_key = getattr(self.sync[item.tool], 'batch_key', None)
+            if(batch_key is not None and mode in ('update', 'push') and
+                    not item.key in exclude):
+                key = batch_key(item.path, item.origin, mode)
+            if key is None:
+                groups.append([item])
+                continue
+            # only paths with the same further settings share a transfer
+            key = (item.tool, key) + tuple(sorted(self.settings(item,
+                self.sync[item.tool], mode, {}).items()))
+            limit = getattr(self.sync[item.tool], 'batch_size', 0)
+            if(key in open_groups and
+                    len(groups[open_groups[key]]) < limit):
+                groups[open_groups[key]].append(item)
+            else:
+                open_groups[key] = len(groups)
+                groups.append([item])
+        return groups
+
+    def sync_batch(self, items, mode, verbose=False, *args, **kwargs):
+        """
+        Synchronizes a group of paths made by batches, and returns a list with
+        True for each path that had an error.
+        Further arguments are passed to the synchronizer.
+
+        Keyword arguments:
+        items -- a list of SeeliePath objects with the same tool
+        mode -- a string, one of "update", "push", or "resolve"
+        verbose -- printing level
+        """
+        if(len(items) == 1):
+            return [self.sync_path(items[0], mode, verbose, *args, **kwargs)]
+        sync = self.sync[items[0].tool]
+        kwargs = self.settings(items[0], sync, mode, kwargs)
+        paths = [x.path for x in items]
+        remotes = [x.origin for x in items]
+        metrics = PathMetrics(None, items[0].tool, mode)
+        path_output = PathOutput('%s (+%d)' % (items[0].path, len(items) - 1),
+                self.log)
+        token = CURRENT_METRICS.set(metrics)
+        output = CURRENT_OUTPUT.set(path_output)
+        share = self.start_transfer(items, sync)
+        bandwidth = CURRENT_BANDWIDTH.set(share)
+        errors = [True] * len(items)
+        start = time.time()
+
+        def attempt():
+            if(mode == 'update'):
+                return sync.update_batch(paths, remotes,
+                        verbose=(verbose > 1), *args, **kwargs)
+            elif(mode == 'push'):
+                return sync.push_batch(paths, remotes, verbose=(verbose > 1),
+                        *args, **kwargs)
+            else:
+                raise ValueError("can't batch mode: '%s'" % (mode))
+
+        try:
+            errors = self.retry(metrics, self.limits(items, sync), attempt,
+                    [True] * len(items), verbose)
+            return errors
+        finally:
+            CURRENT_METRICS.reset(token)
+            CURRENT_OUTPUT.reset(output)
+            CURRENT_BANDWIDTH.reset(bandwidth)
+            self.record_synced(items, errors, mode, time.time() - start)
+            metrics.finish(any(errors))
+            shares = metrics.split(items, errors)
+            self.record_metrics(shares)
+            self.record_outcome(items, shares, path_output)
+
+    def record_synced(self, items, errors, mode, elapsed=None):
+        """
+        Remembers when paths were last updated or pushed without errors, and
+        how long they took, for scheduling later runs. A batch's time is
+        shared equally between its paths. Status and maintenance runs aren't
+        remembered.
+
+        Keyword arguments:
+        items -- a list of SeeliePath objects synchronized together
+        errors -- whether each path had an error
+        mode -- a string, one of "update", "push", "resolve", "status", or
+            "maintain"
+        elapsed -- the time they took, in seconds, or None if unknown
+        """
+        if(self.state is None or mode in ('status', 'maintain')):
+            return
+        now = round(time.time())
+        for item, error in zip(items, errors):
+            if elapsed is not None:
+                self.state.set(item.path, 'duration',
+                        round(elapsed / len(items), 3))
+            if(not error and mode in ('update', 'push')):
+                self.state.set(item.path, 'synced', now)
+
+    def path_status(self, item, mode):
+        """
+        Returns a new PathStatus for a path of a status run, remembered in
+        self.statuses, or None in other modes.
+        """
+        if(mode != 'status'):
+            return None
+        status = PathStatus(item.path, item.tool, None if self.state is None
+                else self.state.get(item.path, 'synced'))
+        with self.statuses_lock:
+            self.statuses[item.key] = status
+        return status
+
+    def prerequisites(self, run, items):
+        """
+        Returns a dict mapping the key of each path that has to wait for other
+        paths of the run to the set of their keys. A path waits for all paths
+        of the projects named in the "after" attribute of the projects it's
+        directly in, as long as those projects are part of the run.
+
+        Keyword arguments:
+        run -- the SeelieRun being applied
+        items -- the list of SeeliePath objects of the run
+        """
+        included = run.included
+        keys = set(x.key for x in items)
+        prerequisites = {}
+        for i in included:
+            after = [j for j in self.graph.after[i] if j in included]
+            if(not after):
+                continue
+            before = set()
+            for j in after:
+                for k in self.graph.reachable([j]):
+                    before |= set(x.key for x in self.projects[k]
+                            if isinstance(x, SeeliePath))
+            for item in self.projects[i]:
+                if(isinstance(item, SeeliePath) and item.key in keys):
+                    waits = prerequisites.setdefault(item.key, set())
+                    waits |= (before & keys) - set((item.key,))
+        return dict((k, v) for k, v in prerequisites.items() if v)
+
+    def schedule(self, run, groups, prerequisites, held=None):
+        """
+        Returns a Scheduler for groups of paths made by batches. Groups wait
+        for the groups with their prerequisites, and among the groups that
+        are ready, those of projects with a higher priority start first,
+        then those of the hosts with the fewest groups running, then those
+        that took longest in earlier runs. Hosts with a jobs limit in the
+        config run at most that many groups at once.
+
+        Keyword arguments:
+        run -- the SeelieRun being applied
+        groups -- a list of lists of SeeliePath objects
+        prerequisites -- a dict made by prerequisites
+        held -- a dict mapping group indices to the number of their paths
+            whose local work has to be done first, or None
+        """
+        # priority of each path: the highest of its projects
+        priority = {}
+        for i in run.included:
+            for item in self.projects[i]:
+                if(isinstance(item, SeeliePath)):
+                    priority[item.key] = max(priority.get(item.key,
+                        self.projects[i].priority), self.projects[i].priority)
+        # group index of each path
+        owner = {}
+        for g, group in enumerate(groups):
+            for item in group:
+                owner[item.key] = g
+        deps = {}
+        weights = []
+        for g, group in enumerate(groups):
+            waits = set()
+            for item in group:
+                waits |= set(owner[k] for k in
+                        prerequisites.get(item.key, ()) if k in owner)
+            waits.discard(g)
+            deps[g] = waits
+            duration = 0.0
+            if self.state is not None:
+                duration = sum(self.state.get(x.path, 'duration', 0.0)
+                        for x in group)
+            weights.append((-max(priority.get(x.key, 0) for x in group),
+                -duration, g))
+        hosts = [self.path_host(group[0]) for group in groups]
+        caps = dict((name, host.jobs) for name, host in self.hosts.items()
+                if host.jobs is not None)
+        return Scheduler(len(groups), deps, weights, held, hosts, caps)
+
+    def path_host(self, item):
+        """
+        Returns the host a path is synchronized with, or None if it's local.
+        Hosts are looked up once per run.
+        """
+        host = self.path_hosts.get(item.key, False)
+        if host is False:
+            lookup = getattr(self.sync[item.tool], 'host', None)
+            if lookup is None:
+                host = location_host(item.origin)
+            else:
+                host = lookup(item.path, item.origin)
+            self.path_hosts[item.key] = host
+        return host
+
+    def start_transfer(self, items, sync):
+        """
+        Returns the share of the bandwidth budget of the host of a group of
+        paths that they may use, in bytes per second, or None if the host
+        has no budget or their tool doesn't keep to it. Each of the
+        transfers the host may run at once gets a fixed share, so that
+        together they never exceed the budget: the host's jobs limit, or
+        the number of paths the run synchronizes at once if that's lower.
+
+        Keyword arguments:
+        items -- a list of SeeliePath objects synchronized together
+        sync -- their synchronizer
+        """
+        if(not getattr(sync, 'bandwidth_limited', False)):
+            return None
+        host = self.hosts.get(self.path_host(items[0]))
+        if(host is None or host.bandwidth is None):
+            return None
+        slots = max(self.run_jobs or 1, 1)
+        if(host.jobs is not None):
+            slots = min(slots, host.jobs)
+        return max(host.bandwidth // slots, 1)
+
+    def sync_path(self, item, mode, verbose=False, *args, **kwargs):
+        """
+        Synchronizes a single path with its tool. Returns True if there was an
+        error.
+        Further arguments are passed to the synchronizer.
+
+        Keyword arguments:
+        item -- the SeeliePath to synchronize
+        mode -- a string, one of "update", "push", or "resolve"
+        verbose -- printing level
+        """
+        sync = self.sync[item.tool]
+        settings = self.settings(item, sync, mode, kwargs)
+        # the metrics and output of local work done ahead also count the rest
+        metrics, path_output = self.staged.pop(item.key, (None, None))
+        if metrics is None:
+            metrics = PathMetrics(item.path, item.tool, mode,
+                    remote_host(item.origin))
+            path_output = PathOutput(item.path, self.log)
+        token = CURRENT_METRICS.set(metrics)
+        output = CURRENT_OUTPUT.set(path_output)
+        status = CURRENT_STATUS.set(self.path_status(item, mode))
+        share = self.start_transfer([item], sync)
+        bandwidth = CURRENT_BANDWIDTH.set(share)
+        error = True
+        start = time.time()
+
+        def attempt():
+            if(mode == 'update'):
+                return sync.update(item.path, src=item.origin,
+                        verbose=(verbose > 1), *args, **settings)
+            elif(mode == 'push'):
+                return sync.push(item.path, dest=item.origin,
+                        verbose=(verbose > 1), *args, **settings)
+            elif(mode == 'resolve'):
+                return sync.resolve(item.path, verbose=(verbose > 1), *args,
+                        **kwargs)
+            elif(mode == 'status'):
+                return sync.status(item.path, src=item.origin,
+                        verbose=(verbose > 1), *args, **settings)
+            elif(mode == 'maintain'):
+                return sync.maintain(item.path, verbose=(verbose > 1), *args,
+                        **kwargs)
+            else:
+                raise ValueError("unknown mode: '%s'" % (mode))
+
+        try:
+            error = self.retry(metrics, self.limits([item], sync), attempt,
+                    True, verbose)
+            return error
+        finally:
+            note_status(error=bool(error))
+            CURRENT_METRICS.reset(token)
+            CURRENT_OUTPUT.reset(output)
+            CURRENT_STATUS.reset(status)
+            CURRENT_BANDWIDTH.reset(bandwidth)
+            self.record_synced([item], [error], mode, time.time() - start)
+            metrics.finish(error)
+            self.record_metrics([metrics])
+            self.record_outcome([item], [metrics], path_output)
+
+    def stage_path(self, item, mode, verbose=False, *args, **kwargs):
+        """
+        Does the local work of a path, like committing its changes before a
+        push, with the method named in the local_stages of its tool, ahead
+        of the rest of its synchronization by sync_path. Returns True if
+        there was an error, which the tool reports again from sync_path.
+        Further arguments are passed to the synchronizer.
+
+        Keyword arguments:
+        item -- the SeeliePath to work on
+        mode -- a string, one of "update", "push", or "resolve"
+        verbose -- printing level
+        """
+        sync = self.sync[item.tool]
+        settings = self.settings(item, sync, mode, kwargs)
+        metrics = PathMetrics(item.path, item.tool, mode,
+                remote_host(item.origin))
+        path_output = PathOutput(item.path, self.log)
+        token = CURRENT_METRICS.set(metrics)
+        output = CURRENT_OUTPUT.set(path_output)
+        try:
+            return getattr(sync, sync.local_stages[mode])(item.path,
+                    item.origin, verbose=(verbose > 1), *args, **settings)
+        finally:
+            CURRENT_METRICS.reset(token)
+            CURRENT_OUTPUT.reset(output)
+            self.staged[item.key] = (metrics, path_output)
+
+    async def sync_path_async(self, item, mode, verbose=False, *args,
+            **kwargs):
+        """
+        Coroutine version of sync_path, using the asyncio synchronizers.
+        Returns True if there was an error.
+
+        Keyword arguments:
+        item -- the SeeliePath to synchronize
+        mode -- a string, one of "update", "push", or "resolve"
+        verbose -- printing level
+        """
+        sync = self.async_sync[item.tool]
+        settings = self.settings(item, sync, mode, kwargs)
+        metrics = PathMetrics(item.path, item.tool, mode,
+                remote_host(item.origin))
+        path_output = PathOutput(item.path, self.log)
+        token = CURRENT_METRICS.set(metrics)
+        output = CURRENT_OUTPUT.set(path_output)
+        status = CURRENT_STATUS.set(self.path_status(item, mode))
+        share = self.start_transfer([item], sync)
+        bandwidth = CURRENT_BANDWIDTH.set(share)
+        error = True
+
+        async def attempt():
+            if(mode == 'update'):
+                return await sync.update(item.path, src=item.origin,
+                        verbose=(verbose > 1), *args, **settings)
+            elif(mode == 'push'):
+                return await sync.push(item.path, dest=item.origin,
+                        verbose=(verbose > 1), *args, **settings)
+            elif(mode == 'resolve'):
+                return await sync.resolve(item.path, verbose=(verbose > 1),
+                        *args, **kwargs)
+            elif(mode == 'status'):
+                return await sync.status(item.path, src=item.origin,
+                        verbose=(verbose > 1), *args, **settings)
+            elif(mode == 'maintain'):
+                # maintenance is local and slow, so it's done by the threaded
+                # synchronizer on the default executor
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(None,
+                        contextvars.copy_context().run, functools.partial(
+                            self.sync[item.tool].maintain, item.path,
+                            verbose=(verbose > 1), *args, **kwargs))
+            else:
+                raise ValueError("unknown mode: '%s'" % (mode))
+
+        try:
+            error = await self.retry_async(metrics, self.limits([item], sync),
+                    attempt, True, verbose)
+            return error
+        finally:
+            note_status(error=bool(error))
+            CURRENT_METRICS.reset(token)
+            CURRENT_OUTPUT.reset(output)
+            CURRENT_STATUS.reset(status)
+            CURRENT_BANDWIDTH.reset(bandwidth)
+            self.record_synced([item], [error], mode)
+            metrics.finish(error)
+            self.record_metrics([metrics])
+            self.record_outcome([item], [metrics], path_output)
+
+    def overlaps(self, items, mode, tools, verbose=False):
+        """
+        Finds the paths of a run that overlap others once symlinks are
+        resolved, because they're the same directory or inside another path.
+        Returns a list of the paths that are redundant, because an earlier
+        path is the same directory with the same tool and settings, which are
+        recorded as skipped, and a dict mapping the keys of the other
+        overlapping paths to the lists of the keys of the paths they overlap,
+        as made by PathTrie.overlaps, so that they aren't synchronized at the
+        same time. Prints a warning for each of them if verbose.
+
+        Keyword arguments:
+        items -- a list of SeeliePath objects, in the order they're visited
+        mode -- a string, one of "update", "push", "resolve", "status", or
+            "maintain"
+        tools -- the synchronizers of the paths, self.sync or self.async_sync
+        verbose -- printing level
+        """
+        trie = PathTrie()
+        redundant = []
+        for item in items:
+            same = [x for x in trie.find(item) if(tools[x.tool] is
+                tools[item.tool] and x.origin == item.origin and
+                x.options == item.options)]
+            if(not same):
+                trie.insert(item)
+                continue
+            if verbose:
+                print("Skipped path %s, the same directory as %s"
+                        % (item.key, same[0].key), file=sys.stderr)
+            metrics = PathMetrics(item.path, item.tool, mode,
+                    remote_host(item.origin))
+            metrics.skipped = True
+            metrics.finish(False)
+            self.record_metrics([metrics])
+            self.record_outcome([item], [metrics])
+            redundant.append(item)
+        overlaps = trie.overlaps()
+        if verbose:
+            for key, paths in overlaps.items():
+                print("Path %s overlaps %s, synchronizing them one at a time"
+                        % (key, ', '.join(x.key for x in paths)),
+                        file=sys.stderr)
+        return redundant, dict((k, [x.key for x in v])
+                for k, v in overlaps.items())
+
+    def prefilter(self, items, mode, tools, **kwargs):
+        """
+        Returns the paths whose tools can tell without running any commands
+        that they have nothing to synchronize, and records them as skipped,
+        so that no work is started for them.
+
+        Keyword arguments:
+        items -- a list of SeeliePath objects
+        mode -- a string, one of "update", "push", or "resolve"
+        tools -- the synchronizers of the paths, self.sync or self.async_sync
+        """
+        settled = []
+        for item in items:
+            sync = tools[item.tool]
+            check = getattr(sync, 'settled', None)
+            if check is None:
+                continue
+            settings = self.settings(item, sync, mode, kwargs)
+            if(mode == 'push'):
+                settings['dest'] = item.origin
+            if(not check(item.path, mode, **settings)):
+                continue
+            metrics = PathMetrics(item.path, item.tool, mode,
+                    remote_host(item.origin))
+            metrics.skipped = True
+            metrics.finish(False)
+            self.record_metrics([metrics])
+            self.record_outcome([item], [metrics])
+            self.record_synced([item], [False], mode)
+            settled.append(item)
+        return settled
+
+    def settings(self, item, sync, mode, kwargs):
+        """
+        Returns the keyword arguments for synchronizing a path, adding those
+        of its further settings that its tool takes in the given mode.
+
+        Keyword arguments:
+        item -- the SeeliePath to synchronize
+        sync -- its synchronizer
+        mode -- a string, one of "update", "push", or "resolve"
+        kwargs -- the keyword arguments given for all paths
+        """
+        settings = dict(kwargs)
+        for key in getattr(sync, 'path_settings', {}).get(mode, ()):
+            if(key in item.options):
+                settings[key] = item.options[key]
+        return settings
+
+    def limits(self, items, sync):
+        """
+        Returns the timeout in seconds, or None, and the number of retries
+        for synchronizing paths together. Paths without their own settings
+        use those of their tool, and a batch may take as long as its paths
+        could separately.
+
+        Keyword arguments:
+        items -- a list of SeeliePath objects
+        sync -- their synchronizer
+        """
+        timeouts = [x.options.get('timeout', getattr(sync, 'timeout', None))
+                for x in items]
+        timeout = None if(None in timeouts) else sum(timeouts)
+        retries = max(x.options.get('retries', getattr(sync, 'retries', 0))
+                for x in items)
+        return timeout, retries
+
+    def retry_delay(self, tries):
+        """
+        Returns the seconds to wait before trying a path again, which double
+        with each try up to a limit, and are randomly cut by up to half so
+        that paths failing together don't retry together.
+        """
+        delay = min(self.retry_max_delay, self.retry_base_delay *
+                2 ** (tries - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def start_attempt(self, metrics, timeout):
+        """
+        Resets the per-attempt metrics and sets the deadline of an attempt at
+        a path. Returns the token to reset the deadline with.
+        """
+        metrics.transient = False
+        metrics.timed_out = False
+        if timeout is None:
+            return CURRENT_DEADLINE.set(None)
+        return CURRENT_DEADLINE.set((time.monotonic() + timeout, timeout))
+
+    def end_attempt(self, metrics, error, tries, retries, verbose):
+        """
+        Returns the seconds to wait before trying a path again after an
+        attempt, or None if it shouldn't be tried again.
+        """
+        failed = any(error) if isinstance(error, list) else error
+        if(not failed or tries >= retries or
+                not (metrics.transient or metrics.timed_out)):
+            return None
+        delay = self.retry_delay(tries + 1)
+        note_output('%s, trying again in %.1f seconds.' % ('Timed out'
+            if metrics.timed_out else 'Failed', delay),
+            file=(sys.stdout if verbose > 1 else None))
+        return delay
+
+    def retry(self, metrics, limits, attempt, failed=True, verbose=False):
+        """
+        Calls attempt, which synchronizes a path or batch and returns its
+        error, until it works or fails in a way that isn't transient, and at
+        most retries more times. Each call may take timeout seconds, after
+        which its command is killed and it gives failed. Returns the error of
+        the last call.
+
+        Keyword arguments:
+        metrics -- the PathMetrics of the path or batch
+        limits -- the timeout and retries, as given by limits
+        attempt -- a function taking no arguments
+        failed -- the error of a call that timed out
+        verbose -- printing level
+        """
+        timeout, retries = limits
+        tries = 0
+        while True:
+            token = self.start_attempt(metrics, timeout)
+            try:
+                error = attempt()
+            except subprocess.TimeoutExpired:
+                error = failed
+                metrics.timed_out = True
+                metrics.timeouts += 1
+            finally:
+                CURRENT_DEADLINE.reset(token)
+            delay = self.end_attempt(metrics, error, tries, retries, verbose)
+            if delay is None:
+                return error
+            time.sleep(delay)
+            tries += 1
+            metrics.retries = tries
+
+    async def retry_async(self, metrics, limits, attempt, failed=True,
+            verbose=False):
+        """
+        Coroutine version of retry, where attempt returns an awaitable.
+        """
+        timeout, retries = limits
+        tries = 0
+        while True:
+            token = self.start_attempt(metrics, timeout)
+            try:
+                error = await attempt()
+            except subprocess.TimeoutExpired:
+                error = failed
+                metrics.timed_out = True
+                metrics.timeouts += 1
+            finally:
+                CURRENT_DEADLINE.reset(token)
+            delay = self.end_attempt(metrics, error, tries, retries, verbose)
+            if delay is None:
+                return error
+            await asyncio.sleep(delay)
+            tries += 1
+            metrics.retries = tries
+
+    def update(self, names=None, verbose=False, merge=False, jobs=1,
+            resume=False):
+        """
+        Updates the projects given in names (all by default).
+
+        Keyword arguments:
+        names -- a list of project names or indices, or None for all projects
+            (default)
+        verbose -- printing level
+        merge -- attempts to merge branches if true, rebases otherwise (default)
+        jobs -- number of paths to synchronize concurrently (default 1)
+        resume -- only updates the paths that failed or didn't finish in the
+            last update if True
+        """
+        self.apply(mode='update', names=names, verbose=verbose, jobs=jobs,
+                merge=merge, resume=resume)
+
+    def push(self, names=None, verbose=False, jobs=1, force=False,
+            resume=False):
+        """
+        Commits changes and pushes the projects given in names (all by default).
+
+        Keyword arguments:
+        names -- a list of project names or indices, or None for all projects
+            (default)
+        verbose -- printing level
+        jobs -- number of paths to synchronize concurrently (default 1)
+        force -- pushes paths even if nothing changed since their last push
+        resume -- only pushes the paths that failed or didn't finish in the
+            last push if True
+        """
+        self.apply(mode='push', names=names, verbose=verbose, jobs=jobs,
+                force=force, resume=resume)
+
+    def resolve(self, names=None, verbose=False, jobs=1, resume=False):
+        """
+        Resolves conflicts in the projects specified by names (all by default).
+
+        Keyword arguments:
+        names -- a list of project names or indices, or None for all projects
+            (default)
+        verbose -- printing level
+        jobs -- number of paths to synchronize concurrently (default 1)
+        resume -- only resolves the paths that failed or didn't finish in the
+            last resolve if True
+        """
+        self.apply(mode='resolve', names=names, verbose=verbose, jobs=jobs,
+                resume=resume)
+
+    def status(self, names=None, verbose=False, jobs=None):
+        """
+        Prints a table of the paths of the projects given in names (all by
+        default), with whether they have uncommitted changes, how far they
+        are ahead of and behind their remotes, and when they were last
+        synchronized, without changing them. Returns the list of PathStatus
+        objects in the order they were printed.
+
+        Keyword arguments:
+        names -- a list of project names or indices, or None for all projects
+            (default)
+        verbose -- printing level
+        jobs -- number of paths to inspect concurrently, or None for
+            status_jobs
+        """
+        self.apply(mode='status', names=names, verbose=verbose,
+                jobs=(jobs or self.status_jobs))
+        return list(self.statuses.values())
+
+    def maintain(self, names=None, verbose=False, jobs=None, force=False,
+            resume=False):
+        """
+        Maintains the git repositories of the projects given in names (all by
+        default), skipping those maintained recently, and prints the time
+        each took and the disk space it freed.
+
+        Keyword arguments:
+        names -- a list of project names or indices, or None for all projects
+            (default)
+        verbose -- printing level
+        jobs -- number of paths to maintain concurrently, or None for
+            maintain_jobs
+        force -- maintains paths even if they were maintained recently
+        resume -- only maintains the paths that failed or didn't finish in
+            the last maintenance if True
+        """
+        self.apply(mode='maintain', names=names, verbose=verbose,
+                jobs=(jobs or self.maintain_jobs), force=force,
+                resume=resume)
+
+    def watch(self, names=None, verbose=False, jobs=1, delay=2.0,
+            interval=5.0, watcher=None):
+        """
+        Watches the paths of the projects given in names (all by default) and
+        pushes each path shortly after it changes, until interrupted.
+
+        Keyword arguments:
+        names -- a list of project names or indices, or None for all projects
+            (default)
+        verbose -- printing level
+        jobs -- number of paths to push concurrently (default 1)
+        delay -- seconds without changes to wait for before pushing, so that
+            bursts of changes are pushed together
+        interval -- seconds between scans if the paths have to be polled
+        watcher -- a Watcher to use, or None to use inotify if available and
+            polling otherwise
+        """
+        run = SeelieRun(self, names=names, verbose=verbose)
+        # dict of watched directories to their paths
+        roots = {}
+        for item in run.collect():
+            root = item.key
+            if(not os.path.isdir(root)):
+                if verbose:
+                    unknown_print("not watching %s, it isn't a directory"
+                            % (item.path), file=sys.stderr)
+                continue
+            roots[root] = item
+        if watcher is None:
+            watcher = make_watcher(interval=interval)
+            try:
+                for root in roots:
+                    watcher.add(root)
+            except OSError as emsg:
+                # fall back to polling, e.g. when out of inotify watches
+                if verbose:
+                    unknown_print("can't watch paths (%s), polling instead"
+                            % (emsg), file=sys.stderr)
+                watcher.close()
+                watcher = PollingWatcher(interval=interval)
+                for root in roots:
+                    watcher.add(root)
+        else:
+            for root in roots:
+                watcher.add(root)
+        if verbose:
+            project_print("watching %d paths with %s" % (len(roots),
+                type(watcher).__name__))
+        try:
+            changed = set()
+            first = None
+            while True:
+                found = watcher.wait(delay if changed else None)
+                now = time.time()
+                if(found):
+                    if(not changed):
+                        first = now
+                    changed |= found
+                    # keep waiting for the burst to end, but not forever
+                    if(now - first < delay * 10):
+                        continue
+                if(not changed):
+                    continue
+                # push the paths that changed
+                items = [roots[root] for root in sorted(changed)
+                        if root in roots]
+                changed = set()
+                self.push_paths(items, verbose=verbose, jobs=jobs)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+            self.close()
+
+    def push_paths(self, items, verbose=False, jobs=1):
+        """
+        Pushes the given paths and prints their status.
+
+        Keyword arguments:
+        items -- a list of SeeliePath objects
+        verbose -- printing level
+        jobs -- number of paths to push concurrently (default 1)
+        """
+        run = SeelieRun(self, names=[], verbose=verbose)
+        self.begin('push', jobs=jobs)
+        # hosts with a jobs limit push that many of their paths at once
+        slots = dict((name, threading.BoundedSemaphore(host.jobs))
+                for name, host in self.hosts.items() if host.jobs is not None)
+
+        def push(item):
+            slot = slots.get(self.path_host(item))
+            if slot is None:
+                return self.sync_path(item, 'push', verbose)
+            with slot:
+                return self.sync_path(item, 'push', verbose)
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max(jobs or 1, 1)) as pool:
+                futures = dict((pool.submit(push, item), item)
+                        for item in items)
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        error = future.result()
+                    except Exception as emsg:
+                        error = True
+                        self.record_failure([futures[future]], emsg)
+                        if verbose:
+                            error_print(emsg)
+                    run.finish_path(futures[future], error, announce=True)
+        finally:
+            self.close()
+
+
+class SeelieRun(object):
+
+    """
+    Bookkeeping for a single pass of Seelie.apply: which projects and paths
+    were visited and which of them had errors.
+    """
+
+    def __init__(self, seelie, names=None, verbose=False, journal=None,
+            quiet=False, on_result=None):
+        """
+        Initializes the run.
+
+        Keyword arguments:
+        seelie -- the Seelie object being applied
+        names -- a list of project names or indices, or None for all automatic
+            projects (default)
+        verbose -- printing level
+        journal -- a SeelieJournal that finished paths are recorded in, and
+            whose paths without errors are skipped, or None
+        quiet -- doesn't print projects and paths as they're visited if True,
+            only the summary
+        on_result -- function called with a PathResult for each finished
+            path, which then shows the paths instead of the run, or None
+        """
+        self.seelie = seelie
+        self.names = names
+        self.verbose = verbose
+        self.journal = journal
+        self.quiet = quiet
+        self.on_result = on_result
+        seelie.require(names, verbose)
+        # already visited paths and projects
+        self.visited_paths = set()
+        if journal is not None:
+            self.visited_paths |= journal.done
+        self.visited_projects = [False] * len(seelie.projects)
+        # paths and projects with errors
+        self.error_paths = set()
+        self.error_projects = [False] * len(seelie.projects)
+        self.unknown_projects = set()
+        # list of project indices to deal with
+        if(names is None):
+            self.projects = [seelie.names[n] for n in seelie.auto]
+        else:
+            self.projects = [seelie.names[n] for n in names
+                    if n in seelie.names]
+            self.unknown_projects |= set([n for n in names
+                if(not n in seelie.names)])
+        # every project that's part of the run, including references
+        self.included = seelie.graph.reachable(self.projects)
+
+    def walk(self, sync_path, announce=True):
+        """
+        Walks all projects of the run in order, handing each path to
+        sync_path.
+
+        Keyword arguments:
+        sync_path -- function taking a SeeliePath and returning its error
+        announce -- prints the project names at verbose levels if True
+        """
+        for i in self.projects:
+            self.apply_project(i, sync_path, announce)
+
+    def apply_project(self, i, sync_path, announce=True):
+        """
+        Iterates over all paths and references in a single project. Each path
+        is handed to sync_path, which returns True if the path had an error,
+        and the error and visited project information is updated accordingly.
+
+        Keyword arguments:
+        i -- index of the project
+        sync_path -- function taking a SeeliePath and returning its error
+        announce -- prints the project name at verbose levels if True
+        """
+        seelie = self.seelie
+        # check that it hasn't already been dealt with
+        if(self.visited_projects[i]):
+            return self.error_projects[i]
+        self.visited_projects[i] = True
+        # the projects this one has to wait for go first
+        for j in seelie.graph.after[i]:
+            if(j in self.included):
+                self.apply_project(j, sync_path, announce)
+        # handle all items in the project
+        any_error = False
+        if(self.verbose and announce and not self.quiet):
+            name = seelie.projects[i].name or ('project #%d' % (i+1))
+            project_print(name)
+        # iterate over paths/references in the project
+        for item in seelie.projects[i]:
+            error = False
+            if(isinstance(item, SeeliePath)):
+                error = sync_path(item)
+            elif(isinstance(item, SeelieRef)):
+                if(item.name in seelie.names):
+                    error = self.apply_project(seelie.names[item.name],
+                            sync_path, announce)
+                else:
+                    self.unknown_projects.add(item.name)
+                    error = True
+            else:
+                TypeError("Unknown project type '%s'" % type(item).__name__)
+            any_error = any_error or error
+        self.error_projects[i] = any_error
+        return any_error
+
+    def collect(self):
+        """
+        Walks the projects without synchronizing anything and returns the list
+        of unique paths in the order they would be visited.
+        """
+        pending = []
+        seen = set(self.visited_paths)
+        def collect_path(item):
+            if(not item.key in seen):
+                seen.add(item.key)
+                pending.append(item)
+            return False
+        self.walk(collect_path, announce=False)
+        self.visited_projects[:] = [False] * len(self.seelie.projects)
+        return pending
+
+    def settle(self):
+        """
+        Walks the projects again after their paths have been synchronized out
+        of order, to find the projects with errors.
+        """
+        self.visited_projects[:] = [False] * len(self.seelie.projects)
+        self.walk(lambda item: item.key in self.error_paths, announce=False)
+
+    def shows_paths(self):
+        """
+        Returns True if the run prints the paths as they finish.
+        """
+        return(bool(self.verbose) and not self.quiet and
+                self.on_result is None)
+
+    def finish_path(self, item, error, announce=False):
+        """
+        Records the result of synchronizing a path, and prints it or hands it
+        to on_result.
+
+        Keyword arguments:
+        item -- the SeeliePath that was synchronized
+        error -- True if there was an error
+        announce -- prints the path name before the status if True
+        """
+        if(error):
+            self.error_paths.add(item.key)
+        if self.journal is not None:
+            self.journal.add(item.key, error)
+        result = self.seelie.result(item, error)
+        if self.on_result is not None:
+            self.on_result(result)
+        elif self.shows_paths():
+            result.show(announce)
+
+    def summary(self):
+        """
+        Prints the unknown projects and the projects and paths with errors.
+        """
+        if(not self.verbose):
+            return
+        seelie = self.seelie
+        # paths skipped because they finished in the run being resumed
+        if(self.journal is not None and self.journal.resumed):
+            project_print("resumed, skipped %d paths that already finished" % (
+                len(self.journal.done)))
+        # list the unknown projects and references
+        if(self.unknown_projects):
+            unknown_print("unknown projects or references:")
+            for name in sorted(self.unknown_projects):
+                unknown_print("\t%s" % (name), file=sys.stderr)
+        # projects with errors
+        if(self.names is None):
+            errors = [(seelie.projects[i].name or
+                ('seelie project #%d' % (i+1)))
+                    for i in self.projects if self.error_projects[i]]
+        else:
+            errors = []
+            for n in self.names:
+                if (n in seelie.names) and self.error_projects[seelie.names[n]]:
+                    errors.append(n)
+        if(errors):
+            error_print("projects with errors:", file=sys.stderr)
+            for name in errors:
+                error_print("\t%s" % (name), file=sys.stderr)
+        # paths that timed out or were tried again
+        report = seelie.last_report
+        if report is not None:
+            timeouts = sorted(m.path for m in report.paths if m.timed_out)
+            retried = sorted((m.path, m.retries) for m in report.paths
+                    if m.retries)
+            if(timeouts):
+                error_print("paths that timed out:", file=sys.stderr)
+                for path in timeouts:
+                    error_print("\t%s" % (path), file=sys.stderr)
+            if(retried):
+                unknown_print("paths that were retried:", file=sys.stderr)
+                for path, retries in retried:
+                    unknown_print("\t%s (%d %s)" % (path, retries,
+                        'retry' if retries == 1 else 'retries'),
+                        file=sys.stderr)
+        # time and space of the paths that were maintained
+        if(report is not None and report.mode == 'maintain'):
+            maintained = [m for m in report.paths
+                    if m.maintenance is not None]
+            if(maintained):
+                project_print("maintained paths:")
+            for m in sorted(maintained, key=lambda m: m.path):
+                loose, packs = m.maintenance['loose'], m.maintenance['packs']
+                project_print("\t%s: %.1fs, %s %s, %d -> %d loose objects, "
+                        "%d -> %d packs" % (m.path, m.wall_time,
+                            size_text(abs(m.disk_saved)), 'saved' if
+                            m.disk_saved >= 0 else 'added', loose[0],
+                            loose[1], packs[0], packs[1]))
+        # paths with errors
+        if(self.error_paths):
+            error_print("repositories with errors:", file=sys.stderr)
+            for path in sorted(self.error_paths):
+                error_print("\t%s" % (path), file=sys.stderr)
+
+
+class Sync(object):
+
+    """
+    Abstract base class for synchronizers.
+    """
+
+    # seconds each path may take, or None for no limit
+    timeout = None
+    # times a path is tried again after a failure that might not happen again
+    retries = 2
+    # messages of network failures that might not happen again
+    transient_re = re.compile(r'Could not resolve host|Connection (timed out|'
+            r'refused|reset|closed)|Operation timed out|Network is unreachable'
+            r'|No route to host|early EOF|remote end hung up unexpectedly|'
+            r'ssh: connect to host|Temporary failure in name resolution|'
+            r'kex_exchange_identification|Broken pipe|RPC failed')
+    # names of the further settings of a path passed to each mode
+    path_settings = {}
+    # names of the methods doing the local work of each mode, which Seelie
+    # runs ahead of the rest of the mode on a pool of their own, and which
+    # take the same arguments as the mode
+    local_stages = {}
+
+    def __init__(self, ssh=None, state=None, timeout=None, retries=None):
+        """
+        Initializes the synchronizer.
+
+        Keyword arguments:
+        ssh -- an SSHPool whose master connections are reused for remote
+            hosts, or None to let every command open its own connection
+        state -- a SeelieState kept between runs, or None to keep nothing
+        timeout -- seconds each path may take unless it sets its own timeout,
+            or None for the class default
+        retries -- times a path is tried again after a transient failure
+            unless it sets its own retries, or None for the class default
+        """
+        self.ssh = ssh
+        self.state = state
+        if timeout is not None:
+            self.timeout = timeout
+        if retries is not None:
+            self.retries = retries
+
+    @classmethod
+    def transient(cls, status, output):
+        """
+        Returns True if a command that failed with the given exit status and
+        end of its output might work when it's tried again.
+        """
+        return cls.transient_re.search(output) is not None
+
+    def settled(self, path, mode, **kwargs):
+        """
+        Returns True if the path certainly has nothing to synchronize in the
+        given mode, which has to be found out without running any commands.
+        Further arguments are those the mode would be called with.
+        """
+        return False
+
+    def update(self, path, merge=False, verbose=False):
+        raise NotImplementedError("abstract class")
+
+    def push(self, path, verbose=False):
+        raise NotImplementedError("abstract class")
+
+    def resolve(self, path):
+        raise NotImplementedError("abstract class")
+
+    def status(self, path, verbose=False):
+        raise NotImplementedError("abstract class")
+
+    def maintain(self, path, verbose=False, force=False):
+        """
+        Tidies up a path so that synchronizing it stays fast. Returns False
+        if no errors. Paths of tools with nothing to tidy are skipped.
+        """
+        note_metrics(skipped=True)
+        return False
+
+    def close(self):
+        """
+        Forgets anything remembered during a run.
+        """
+        pass
+
+    def host(self, path, remote=None):
+        """
+        Returns the name of the host a path is synchronized with, or None if
+        it's local, for the limits of the host.
+
+        Keyword arguments:
+        path -- the path to synchronize
+        remote -- its remote origin, or None for the default
+        """
+        return location_host(remote)
+
+    def host_env(self, location):
+        """
+        Returns the environment for commands that connect to the host of the
+        given remote location, or None for the default environment.
+
+        Keyword arguments:
+        location -- a remote URL or scp-like "host:path" location
+        """
+        host = remote_host(location)
+        if(self.ssh is None or host is None):
+            return None
+        return self.ssh.env(host)
+
+
+class GitSync(Sync):
+
+    """
+    Synchronizes paths using git.
+    """
+
+    # finished progress lines of objects that were sent or received
+    progress_re = re.compile(r'(?:Receiving|Unpacking|Writing) objects: +'
+            r'100% \((\d+)/\d+\)(?:, ([\d.]+) (bytes|KiB|MiB|GiB))?')
+    # summary line of the objects in a pack
+    total_re = re.compile(r'Total (\d+) \(delta')
+    units = {'bytes': 1, 'KiB': 1 << 10, 'MiB': 1 << 20, 'GiB': 1 << 30}
+    # branch pulled and pushed for paths that don't set their own
+    branch = 'master'
+    # names of the further settings of a path passed to each mode
+    path_settings = {
+            'update': ('branch', 'depth', 'filter', 'single_branch'),
+            'push': ('branch',),
+            'status': ('branch',),
+            }
+    # names of the methods doing the local work of each mode
+    local_stages = {'push': 'commit'}
+    # whether git has a built-in filesystem monitor, or None until checked
+    fsmonitor = None
+    # seconds after maintaining a repository before it's maintained again
+    maintain_interval = 7 * 24 * 3600.0
+
+    def __init__(self, ssh=None, precheck=True, state=None, timeout=None,
+            retries=None, mirror_dir=MIRROR_DIR):
+        """
+        Initializes the synchronizer.
+
+        Keyword arguments:
+        ssh -- an SSHPool whose master connections are reused for remote
+            hosts, or None to let every command open its own connection
+        precheck -- skips pulls when the remote head is already merged if True
+            (default)
+        state -- a SeelieState used to skip pushes of repositories that
+            haven't changed since their last push, or None to always push
+        timeout, retries -- as for Sync
+        mirror_dir -- directory of the bare mirrors of remotes, fetched once
+            per run, that working copies borrow objects from and pull from, or
+            None to pull every working copy from its remote
+        """
+        Sync.__init__(self, ssh=ssh, state=state, timeout=timeout,
+                retries=retries)
+        self.heads = RemoteHeads() if precheck else None
+        self.mirrors = ObjectMirrors(mirror_dir) if mirror_dir else None
+        # dict of paths committed during a run to a tuple of whether there
+        # was an error, the fingerprint of their tree, and whether anything
+        # was committed, or None if nothing changed since the last push
+        self.commits = {}
+        self.commits_lock = threading.Lock()
+
+    def close(self):
+        """
+        Forgets the remote heads seen, the mirrors fetched and the commits
+        made during a run.
+        """
+        if self.heads is not None:
+            self.heads.clear()
+        if self.mirrors is not None:
+            self.mirrors.clear()
+        with self.commits_lock:
+            self.commits = {}
+
+    def settled(self, path, mode, force=False, dest=None, branch=None,
+            **kwargs):
+        """
+        Returns True if the path is a repository whose working tree matches
+        its index, with no untracked files, whose index is unchanged since
+        its last push, and whose HEAD is the tracking ref of the branch it
+        pushes, so that pushing it wouldn't commit or push anything, or if it was maintained less than maintain_interval
+        seconds ago. Updates can't be settled without asking the remote.
+
+        Keyword arguments:
+        path -- the path to synchronize
+        mode -- a string, one of "update", "push", "resolve", or "maintain"
+        force -- never settles pushes or maintenance if True
+        dest -- where the path is pushed to, or None for "origin"
+        branch -- the branch pushed, or None for the class default
+        """
+        if(mode == 'maintain' and not force and self.state is not None):
+            maintained = self.state.get(path, 'maintained')
+            return(maintained is not None and
+                    time.time() - maintained < self.maintain_interval)
+        if(mode != 'push' or force):
+            return False
+        cwd = os.path.expanduser(path)
+        if(INSPECTOR.clean(cwd) is not True):
+            return False
+        # the index only certainly matches HEAD if it's the index the last
+        # push left, after committing everything, since staged changes
+        # don't show in the working tree
+        pushed = None if self.state is None else self.state.get(path, 'push')
+        current = git_fingerprint(cwd)
+        if(not pushed or not pushed.get('git') or current is None or
+                current[3] is None or pushed['git'][3] != current[3]):
+            return False
+        # commits left by a failed push still have to be pushed
+        dest = dest or 'origin'
+        if(GitSync.url_args(dest) is None):
+            return False
+        head = INSPECTOR.resolve(cwd)
+        return(head is not None and head == INSPECTOR.resolve(cwd,
+            'refs/remotes/%s/%s' % (dest, branch or self.branch)))
+
+    @staticmethod
+    def unpushed(cwd, dest, branch):
+        """
+        Returns True if HEAD of the repository in cwd has commits that the
+        tracking ref of the branch pushed to dest doesn't have, as after a
+        failed push. Pushes to URLs have no tracking ref, so they always
+        count as unpushed.
+
+        Keyword arguments:
+        cwd -- the repository path
+        dest -- the remote name or URL pushed to
+        branch -- the branch pushed
+        """
+        head = INSPECTOR.resolve(cwd) or GitSync.rev_parse(cwd, 'HEAD')
+        if head is None:
+            return False
+        if(GitSync.url_args(dest) is None):
+            return True
+        tracking = 'refs/remotes/%s/%s' % (dest, branch)
+        base = (INSPECTOR.resolve(cwd, tracking) or
+                GitSync.rev_parse(cwd, tracking))
+        if(base is None):
+            return True
+        if(head == base):
+            return False
+        return call(('git', 'merge-base', '--is-ancestor', head, base),
+                cwd=cwd, stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL) != 0
+
+    @staticmethod
+    def pull_args(src, merge=False, branch='master'):
+        """
+        Returns the git command that pulls changes from src.
+
+        Keyword arguments:
+        src -- where to pull from
+        merge -- attempts to merge branches if true, rebases otherwise (default)
+        branch -- the branch to pull
+        """
+        if merge:
+            return ('git', 'pull', '--progress', src, branch)
+        return ('git', 'pull', '--progress', '--rebase', src, branch)
+
+    @staticmethod
+    def clone_args(src, path, branch='master', depth=None, filter=None,
+            single_branch=False, reference=None):
+        """
+        Returns the git command that clones src into path.
+
+        Keyword arguments:
+        src -- the URL or path to clone
+        path -- the directory to create
+        branch -- the branch to check out
+        depth -- number of commits of history to fetch, or None for all
+        filter -- a partial clone filter such as "blob:none", or None to fetch
+            all objects
+        single_branch -- fetches only the history of branch if True
+        reference -- a repository the clone borrows objects from, or None
+        """
+        args = ('git', 'clone', '--progress', '--branch', branch)
+        if reference is not None:
+            args += ('--reference', reference)
+        if depth is not None:
+            args += ('--depth', str(depth))
+        if filter is not None:
+            args += ('--filter=%s' % (filter),)
+        if single_branch:
+            args += ('--single-branch',)
+        return args + (src, path)
+
+    @staticmethod
+    def mirror_args(mirror, url):
+        """
+        Returns the start of a git command that reads from a local mirror
+        wherever it would read from url.
+        """
+        return ('git', '-c', 'url.%s.insteadOf=%s' % (mirror, url))
+
+    def mirror(self, cwd, url, env=None, filter=None, stdout=None,
+            stderr=None, depth=None, single_branch=False):
+        """
+        Returns the path of the mirror of a remote, fetched during the run,
+        that the repository in cwd borrows objects from, or None if the
+        repository should fetch from the remote itself. Local remotes aren't
+        mirrored, and neither are partial, shallow or single branch clones,
+        which want less than the whole of a mirror.
+
+        Keyword arguments:
+        cwd -- the repository path, or None if it's about to be cloned with
+            the mirror as a reference
+        url -- the URL of the remote
+        env -- environment for git, or None for the default environment
+        filter -- the partial clone filter of the path, or None
+        stdout, stderr -- where the output of the fetch goes
+        depth -- the depth of a shallow clone, or None
+        single_branch -- True if the path only fetches its branch
+        """
+        if(self.mirrors is None or filter is not None or depth is not None
+                or single_branch or not ObjectMirrors.mirrored(url)):
+            return None
+        mirror = self.mirrors.fetch(url, env=env, stdout=stdout,
+                stderr=stderr)
+        if(mirror is None or
+                (cwd is not None and not ObjectMirrors.borrow(cwd, mirror))):
+            return None
+        return mirror
+
+    @staticmethod
+    def config_values(cwd, key):
+        """
+        Returns the list of values of a git config key in the repository in
+        cwd, which is empty if the key isn't set.
+        """
+        try:
+            return check_output(('git', 'config', '--get-all', key), cwd=cwd,
+                    stderr=subprocess.DEVNULL).decode().splitlines()
+        except (OSError, subprocess.CalledProcessError):
+            return []
+
+    @staticmethod
+    def settings_args(cwd, src, branch='master', filter=None,
+            single_branch=False):
+        """
+        Returns the git commands that make the configuration of a remote in
+        the repository in cwd match the settings of its path, so that pulls
+        from it only fetch what the path needs. Remotes given as URLs have no
+        configuration and get no commands.
+
+        Keyword arguments:
+        cwd -- the repository path
+        src -- the remote name or URL being pulled from
+        branch -- the branch being pulled
+        filter -- a partial clone filter for the objects fetched from now on,
+            or None to leave the remote as it is
+        single_branch -- makes the remote fetch only branch if True
+        """
+        args = []
+        if(GitSync.url_args(src) is None):
+            return args
+        if(filter is not None and GitSync.config_values(cwd,
+                'remote.%s.partialclonefilter' % (src)) != [filter]):
+            args.append(('git', 'config', 'remote.%s.promisor' % (src),
+                'true'))
+            args.append(('git', 'config', 'remote.%s.partialclonefilter'
+                % (src), filter))
+        if(single_branch and GitSync.config_values(cwd,
+                'remote.%s.fetch' % (src)) != ['+refs/heads/%s:refs/remotes/'
+                    '%s/%s' % (branch, src, branch)]):
+            args.append(('git', 'remote', 'set-branches', src, branch))
+        return args
+
+    @staticmethod
+    def transfer_counts(output):
+        """
+        Returns the number of objects and bytes that a git pull or push
+        transferred, from the progress in its output.
+        """
+        objects = 0
+        size = 0
+        for match in GitSync.progress_re.finditer(output):
+            objects = max(objects, int(match.group(1)))
+            if match.group(2):
+                size = max(size, int(float(match.group(2)) *
+                    GitSync.units[match.group(3)]))
+        for match in GitSync.total_re.finditer(output):
+            objects = max(objects, int(match.group(1)))
+        return objects, size
+
+    @staticmethod
+    def commit_args():
+        """
+        Returns the git command that commits all staged changes.
+        """
+        return ('git', 'commit', '-m', 'seelie commit from %s at %s' % (
+            socket.gethostname(), time.strftime('%F %T %Z')))
+
+    @staticmethod
+    def url_args(remote, push=False):
+        """
+        Returns the git command that prints the URL of a remote, or None if
+        the remote is already a URL.
+
+        Keyword arguments:
+        remote -- a remote name or URL
+        push -- returns the push URL if True
+        """
+        if(':' in remote or '/' in remote):
+            return None
+        if push:
+            return ('git', 'remote', 'get-url', '--push', remote)
+        return ('git', 'remote', 'get-url', remote)
+
+    def host(self, path, remote=None):
+        """
+        Returns the name of the host of the remote a repository pulls from,
+        looking up the URL of named remotes, or None if it's local.
+
+        Keyword arguments:
+        path -- the repository path
+        remote -- a remote name or URL, or None for "origin"
+        """
+        if remote is None:
+            remote = "origin"
+        return location_host(GitSync.remote_url(os.path.expanduser(path),
+            remote))
+
+    @staticmethod
+    def remote_url(cwd, remote, push=False):
+        """
+        Returns the URL of the given remote of the repository in cwd, or None
+        if it can't be found.
+
+        Keyword arguments:
+        cwd -- the repository path
+        remote -- a remote name or URL
+        push -- looks up the push URL if True
+        """
+        args = GitSync.url_args(remote, push)
+        if args is None:
+            return remote
+        url = INSPECTOR.remote_url(cwd, remote, push)
+        if url is not None:
+            return url
+        try:
+            return check_output(args, cwd=cwd,
+                    stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def remote_env(self, cwd, remote, push=False):
+        """
+        Returns the environment for commands that talk to the given remote of
+        the repository in cwd, or None for the default environment.
+
+        Keyword arguments:
+        cwd -- the repository path
+        remote -- a remote name or URL
+        push -- looks up the push URL if True
+        """
+        if self.ssh is None:
+            return None
+        url = GitSync.remote_url(cwd, remote, push)
+        if url is not None:
+            note_metrics(host=remote_host(url))
+        return self.host_env(url)
+
+    def update(self, path, src=None, merge=False, verbose=False,
+            branch=None, depth=None, filter=None, single_branch=False):
+        """
+        Update a path, pulling any changes. Returns False if no errors.
+        A missing path is cloned if src is a URL, with the history and
+        objects limited by depth, filter and single_branch. Pulls into an
+        existing repository keep the filter and single branch, and keep a
+        shallow repository shallow, but never make a full repository shallow.
+
+        Keyword arguments:
+        path -- the path to update
+        src -- where to pull from, set to "origin" if src is None
+        merge -- attempts to merge branches if true, rebases otherwise (default)
+        verbose -- printing level
+        branch -- the branch to pull, or None for the class default
+        depth -- number of commits of history in a clone, or None for all
+        filter -- a partial clone filter such as "blob:none", or None to fetch
+            all objects
+        single_branch -- fetches only the history of branch if True
+        """
+        return run_steps(self.update_steps(path, src, merge, verbose, branch,
+            depth, filter, single_branch))
+
+    def update_steps(self, path, src=None, merge=False, verbose=False,
+            branch=None, depth=None, filter=None, single_branch=False):
+        """
+        Generator of the steps of update, for run_steps or async_run_steps.
+        """
+        if src is None:
+            src = "origin"
+        if branch is None:
+            branch = self.branch
+        # run everything in the repository path
+        cwd = os.path.expanduser(path)
+        error = not os.path.isdir(cwd)
+        # set the pipes and printing color
+        if verbose:
+            out = sys.stdout
+            err = sys.stderr
+        else:
+            out = subprocess.DEVNULL
+            err = subprocess.DEVNULL
+        # update the repository and check the results
+        try:
+            if(error and GitSync.url_args(src) is None and
+                    not os.path.lexists(cwd)):
+                note_metrics(host=remote_host(src))
+                env = yield step(self.host_env, src)
+                mirror = yield step(self.mirror, None, src, env, filter,
+                        out, err, depth, single_branch)
+                error = yield step(call, GitSync.clone_args(src, cwd, branch,
+                    depth, filter, single_branch, mirror), stdout=out,
+                    stderr=err, env=env, count=GitSync.transfer_counts,
+                    transient=self.transient)
+            elif(not error):
+                url = yield step(GitSync.remote_url, cwd, src)
+                if url is not None:
+                    note_metrics(host=remote_host(url))
+                env = yield step(self.host_env, url)
+                # don't pull if the remote head is already merged
+                if(self.heads is not None and (yield step(self.heads.current,
+                        cwd, src, url, env=env, branch=branch))):
+                    note_metrics(skipped=True)
+                    if verbose:
+                        note_output('Remote head unchanged, skipping pull.',
+                                file=out)
+                else:
+                    for args in (yield step(GitSync.settings_args, cwd, src,
+                            branch, filter, single_branch)):
+                        error = error or (yield step(call, args, stdout=out,
+                            stderr=err, cwd=cwd))
+                    # pull from the mirror of the remote if there is one
+                    pull = GitSync.pull_args(src, merge, branch)
+                    mirror = None
+                    if not error:
+                        mirror = yield step(self.mirror, cwd, url, env,
+                                filter, out, err, depth, single_branch)
+                    if mirror is not None:
+                        pull = GitSync.mirror_args(mirror, url) + pull[1:]
+                    error = error or (yield step(call, pull, stdout=out,
+                        stderr=err, cwd=cwd, env=env,
+                        count=GitSync.transfer_counts,
+                        transient=self.transient))
+        except OSError as emsg:
+            error = True
+            if verbose:
+                error_print(emsg)
+        return error
+
+    def commit(self, path, dest="origin", verbose=False, force=False,
+            branch=None):
+        """
+        Adds and commits all changes, which is the local work of a push, and
+        keeps the outcome until push sends the commit. Seelie does this ahead
+        of the pushes on a pool of its own when paths are pushed
+        concurrently. Returns False if no errors.
+
+        Keyword arguments:
+        path -- the path to commit
+        dest -- where the commit is pushed to, set to "origin" if dest is None
+        verbose -- printing level
+        force -- commits even if nothing changed since the last push
+        branch -- the branch pushed, or None for the class default
+        """
+        return run_steps(self.commit_steps(path, dest, verbose, force,
+            branch))
+
+    def commit_steps(self, path, dest="origin", verbose=False, force=False,
+            branch=None):
+        """
+        Generator of the steps of commit, for run_steps or async_run_steps.
+        """
+        if dest is None:
+            dest = "origin"
+        if branch is None:
+            branch = self.branch
+        # run everything in the repository path
+        cwd = os.path.expanduser(path)
+        error = not os.path.isdir(cwd)
+        # skip the repository if nothing changed since the last push
+        tree = None
+        if(not error and self.state is not None):
+            tree = yield step(tree_fingerprint, cwd)
+            if(not force and self.state.get(path, 'push') ==
+                    push_fingerprint(cwd, tree)):
+                with self.commits_lock:
+                    self.commits[path] = (False, tree, None)
+                return False
+        # set the pipes and printing color
+        if verbose:
+            out = sys.stdout
+            err = sys.stderr
+        else:
+            out = subprocess.DEVNULL
+            err = subprocess.DEVNULL
+        status = 'changes?'
+        try:
+            # add all changes to the repository
+            error = error or (yield step(call, ('git', 'add', '--all'),
+                stdout=out, stderr=err, cwd=cwd))
+            # see if there are any changes
+            try:
+                if(not error):
+                    status = yield step(check_output, ('git', 'status',
+                        '--porcelain'), stderr=err, cwd=cwd)
+            except subprocess.CalledProcessError:
+                error = True
+            # only commit if there are changes
+            if(status):
+                error = error or (yield step(call, GitSync.commit_args(),
+                    stdout=out, stderr=err, cwd=cwd))
+            # commits whose push failed earlier are pushed again
+            changed = bool(status) or (not error and
+                    (yield step(GitSync.unpushed, cwd, dest, branch)))
+        except OSError as emsg:
+            error = True
+            changed = True
+            if verbose:
+                error_print(emsg)
+        with self.commits_lock:
+            self.commits[path] = (error, tree, changed)
+        return error
+
+    def push(self, path, dest="origin", verbose=False, force=False,
+            branch=None):
+        """
+        Adds and commits all changes, then pushes the commit. The commit is
+        left to commit, unless it was already made during the run.
+
+        Keyword arguments:
+        path -- the path to push
+        dest -- where to push to, set to "origin" if dest is None
+        verbose -- printing level
+        force -- pushes even if nothing changed since the last push
+        branch -- the branch to push, or None for the class default
+        """
+        return run_steps(self.push_steps(path, dest, verbose, force, branch))
+
+    def push_steps(self, path, dest="origin", verbose=False, force=False,
+            branch=None):
+        """
+        Generator of the steps of push, for run_steps or async_run_steps.
+        """
+        if dest is None:
+            dest = "origin"
+        if branch is None:
+            branch = self.branch
+        cwd = os.path.expanduser(path)
+        # a commit made earlier in the run is kept until its push succeeds,
+        # so that retries push it again
+        with self.commits_lock:
+            staged = self.commits.get(path)
+        if staged is None:
+            yield from self.commit_steps(path, dest, verbose, force, branch)
+            with self.commits_lock:
+                staged = self.commits.get(path)
+        error, tree, changed = staged
+        if(changed is None):
+            # nothing changed since the last push
+            note_metrics(skipped=True)
+            if verbose:
+                note_output('No changes since the last push, skipping.',
+                        file=sys.stdout)
+            return False
+        # set the pipes and printing color
+        if verbose:
+            out = sys.stdout
+            err = sys.stderr
+        else:
+            out = subprocess.DEVNULL
+            err = subprocess.DEVNULL
+        try:
+            # push the changes, if there were any
+            if(not error and changed):
+                env = yield step(self.remote_env, cwd, dest, push=True)
+                error = yield step(call, ('git', 'push', '--progress', dest,
+                    branch), stdout=out, stderr=err, cwd=cwd, env=env,
+                    count=GitSync.transfer_counts, transient=self.transient)
+            elif(not error):
+                note_metrics(skipped=True)
+        except OSError as emsg:
+            error = True
+            if verbose:
+                error_print(emsg)
+        if not error:
+            with self.commits_lock:
+                self.commits.pop(path, None)
+        # remember the state of the working tree from before the push
+        if(self.state is not None):
+            if(not error and tree is not None):
+                self.state.set(path, 'push', push_fingerprint(cwd, tree))
+            else:
+                self.state.discard(path, 'push')
+        return error
+
+    def maintain(self, path, verbose=False, force=False):
+        """
+        Repacks a repository and prunes its loose objects, then writes its
+        commit-graph and multi-pack index, so that pulls have fewer objects
+        and packs to search. Notes how the objects on disk changed on the
+        metrics of the path, and remembers when it was maintained. Returns
+        False if no errors.
+
+        Keyword arguments:
+        path -- the path to maintain
+        verbose -- printing level
+        force -- ignored, recently maintained paths are settled before
+        """
+        cwd = os.path.expanduser(path)
+        if(not os.path.isdir(cwd)):
+            return True
+        if verbose:
+            out = sys.stdout
+            err = sys.stderr
+        else:
+            out = subprocess.DEVNULL
+            err = subprocess.DEVNULL
+        try:
+            before = GitSync.object_counts(cwd)
+            error = False
+            gc, graph, midx = GitSync.maintain_args()
+            for args in (gc, graph):
+                error = error or call(args, stdout=out, stderr=err, cwd=cwd)
+            after = GitSync.object_counts(cwd)
+            # repositories borrowing all their objects from a mirror have
+            # no packs to index
+            if after['packs']:
+                error = error or call(midx, stdout=out, stderr=err, cwd=cwd)
+        except (OSError, subprocess.CalledProcessError) as emsg:
+            if verbose:
+                error_print(emsg)
+            return True
+        note_metrics(disk_saved=before['disk'] - after['disk'],
+                maintenance=dict((k, [before[k], after[k]]) for k in before))
+        if(self.state is not None and not error):
+            self.state.set(path, 'maintained', round(time.time()))
+        return error
+
+    @staticmethod
+    def maintain_args():
+        """
+        Returns the git commands that maintain a repository. gc packs all
+        objects into one pack, prunes unreachable loose objects and packs
+        refs, and the commit-graph is written on its own.
+        """
+        return (('git', '-c', 'gc.writeCommitGraph=false', 'gc', '--quiet'),
+                ('git', 'commit-graph', 'write', '--reachable'),
+                ('git', 'multi-pack-index', 'write'))
+
+    @staticmethod
+    def object_counts(cwd):
+        """
+        Returns a dict with the number of loose objects and packs of the
+        repository in cwd, and the bytes its objects take on disk.
+        """
+        output = check_output(('git', 'count-objects', '-v'), cwd=cwd,
+                stderr=subprocess.DEVNULL).decode()
+        values = {}
+        for line in output.splitlines():
+            key, _, value = line.partition(':')
+            if value.strip().isdigit():
+                values[key] = int(value)
+        return {
+                'loose': values.get('count', 0),
+                'packs': values.get('packs', 0),
+                'disk': 1024 * (values.get('size', 0) +
+                    values.get('size-pack', 0) +
+                    values.get('size-garbage', 0)),
+                }
+
+    def status(self, path, src=None, verbose=False, branch=None):
+        """
+        Reads whether a path has uncommitted changes and how far it is ahead
+        of and behind a branch of src, without changing anything, and notes
+        them on the status of the path. Returns False if no errors.
+
+        Keyword arguments:
+        path -- the path to inspect
+        src -- the remote to compare with, set to "origin" if src is None
+        verbose -- printing level
+        branch -- the branch to compare with, or None for the class default
+        """
+        if src is None:
+            src = "origin"
+        if branch is None:
+            branch = self.branch
+        cwd = os.path.expanduser(path)
+        if(not os.path.isdir(cwd)):
+            return True
+        try:
+            # only run git status if the inspector can't tell
+            clean = INSPECTOR.clean(cwd)
+            if clean is None:
+                clean = not check_output(GitSync.status_args(cwd), cwd=cwd,
+                        stderr=subprocess.DEVNULL)
+            url = GitSync.remote_url(cwd, src)
+            if url is not None:
+                note_metrics(host=remote_host(url))
+            ahead, behind, changed = GitSync.divergence(cwd, src, url, branch,
+                    self.heads, self.host_env(url))
+        except (OSError, subprocess.CalledProcessError) as emsg:
+            if verbose:
+                error_print(emsg)
+            return True
+        note_status(dirty=not clean, ahead=ahead, behind=behind,
+                changed=changed)
+        return False
+
+    @staticmethod
+    def status_args(cwd):
+        """
+        Returns the git command that lists the changes in the repository in
+        cwd. It uses the untracked cache, and the built-in filesystem monitor
+        if git has one, unless the repository configures them itself or its
+        configuration can't be read.
+        """
+        args = ('git',)
+        config = INSPECTOR.config(cwd)
+        if config is not None:
+            if(not ('core', None, 'untrackedcache') in config):
+                args += ('-c', 'core.untrackedCache=true')
+            if(GitSync.has_fsmonitor() and
+                    not ('core', None, 'fsmonitor') in config):
+                args += ('-c', 'core.fsmonitor=true')
+        return args + ('status', '--porcelain')
+
+    @staticmethod
+    def has_fsmonitor():
+        """
+        Returns True if git was built with its filesystem monitor daemon.
+        """
+        if GitSync.fsmonitor is None:
+            try:
+                output = check_output(('git', 'version', '--build-options'),
+                        stderr=subprocess.DEVNULL).decode()
+            except (OSError, subprocess.CalledProcessError):
+                output = ''
+            GitSync.fsmonitor = 'fsmonitor--daemon' in output
+        return GitSync.fsmonitor
+
+    @staticmethod
+    def rev_parse(cwd, rev):
+        """
+        Returns the SHA of a commit in the repository in cwd, or None if it
+        doesn't have the commit.
+        """
+        try:
+            return check_output(('git', 'rev-parse', '--verify', '--quiet',
+                '%s^{commit}' % (rev)), cwd=cwd,
+                stderr=subprocess.DEVNULL).decode().strip() or None
+        except subprocess.CalledProcessError:
+            return None
+
+    @staticmethod
+    def divergence(cwd, src, url, branch, heads=None, env=None):
+        """
+        Returns the number of commits HEAD of the repository in cwd is ahead
+        of and behind a branch of a remote, each None if unknown, and True if
+        the remote has commits that haven't been fetched yet. The remote head
+        is asked for if heads is given, otherwise only the tracking ref of
+        the last fetch is compared with.
+
+        Keyword arguments:
+        cwd -- the repository path
+        src -- the remote name or URL
+        url -- the URL of the remote, or None if unknown
+        branch -- the branch to compare with
+        heads -- RemoteHeads for asking the remote, or None
+        env -- environment for git, or None for the default environment
+        """
+        head = INSPECTOR.resolve(cwd) or GitSync.rev_parse(cwd, 'HEAD')
+        base = None
+        if(GitSync.url_args(src) is not None):
+            tracking = 'refs/remotes/%s/%s' % (src, branch)
+            base = (INSPECTOR.resolve(cwd, tracking) or
+                    GitSync.rev_parse(cwd, tracking))
+        changed = False
+        if(heads is not None and url is not None):
+            remote = heads.get(url, 'refs/heads/%s' % (branch), cwd=cwd,
+                    env=env)
+            if(remote is not None and remote != base):
+                if(GitSync.rev_parse(cwd, remote) is not None):
+                    base = remote
+                else:
+                    changed = True
+        if(head is None or base is None):
+            return None, None, changed
+        if(head == base):
+            return 0, 0, changed
+        counts = check_output(('git', 'rev-list', '--left-right', '--count',
+            '%s...%s' % (head, base)), cwd=cwd,
+            stderr=subprocess.DEVNULL).decode().split()
+        return int(counts[0]), int(counts[1]), changed
+
+    def resolve(self, path, verbose=False):
+        """
+        Resolves changes 
+
+        Keyword arguments:
+        path -- the path to push
+        verbose -- printing level
+
+        TODO: write this
+        """
+        raise NotImplementedError("can't resolve yet...")
+
+
+class RSyncManifest(object):
+
+    """
+    The size, modification time and type of every entry below a directory
+    synchronized by rsync, as of its last transfer, so that a push only has to
+    send the entries that changed since then.
+    """
+
+    # bump this whenever the format of the manifests changes
+    VERSION = 1
+
+    def __init__(self, root, directory=MANIFEST_DIR):
+        """
+        Initializes the manifest of a directory.
+
+        Keyword arguments:
+        root -- the expanded path of the directory, without a trailing slash
+        directory -- directory where the manifests are kept
+        """
+        self.root = root
+        self.directory = os.path.expanduser(directory)
+        name = hashlib.sha1(root.encode(errors='surrogateescape')).hexdigest()
+        self.filename = os.path.join(self.directory, '%s.manifest' % (name))
+
+    @classmethod
+    def open(cls, path, directory=MANIFEST_DIR):
+        """
+        Returns the manifest of a path, or None if directory is None or the
+        path isn't a directory whose contents are synchronized, ending with a
+        slash.
+        """
+        if(directory is None or not path.endswith('/')):
+            return None
+        root = os.path.expanduser(path).rstrip('/') or '/'
+        if not os.path.isdir(root):
+            return None
+        return cls(root, directory)
+
+    def load(self):
+        """
+        Returns the entries of the last transfer, or None if there's no
+        manifest or it can't be read.
+        """
+        try:
+            with open(self.filename, 'rb') as f:
+                version, root, entries = marshal.loads(f.read())
+            if(version != RSyncManifest.VERSION or root != self.root or
+                    not isinstance(entries, dict)):
+                return None
+            return entries
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def save(self, entries):
+        """
+        Replaces the manifest with the given entries in one step. Errors are
+        ignored, since the next push can always send everything.
+        """
+        try:
+            save_marshal(self.filename, (RSyncManifest.VERSION, self.root,
+                entries), prefix='.manifest-')
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def digest(filename):
+        """
+        Returns the SHA-1 of the contents of a file, or None if it can't be
+        read.
+        """
+        sha = hashlib.sha1()
+        try:
+            with open(filename, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(block)
+        except OSError:
+            return None
+        return sha.hexdigest()
+
+    def scan(self, previous=None, checksum=False):
+        """
+        Returns a dict of the path of every entry below the directory,
+        relative to it, to a list of its type ('d', 'f' or 'l'), size,
+        modification time in nanoseconds and the SHA-1 of its contents, or
+        None if the hash isn't known. Returns None if any directory can't be
+        read, since its entries would look deleted.
+
+        Keyword arguments:
+        previous -- the entries of the last transfer, whose hashes are kept
+            for files that haven't changed
+        checksum -- hashes files whose size is the same as in previous but
+            whose modification time isn't, so that files that were only
+            touched aren't sent again
+        """
+        entries = {}
+        previous = previous or {}
+        stack = ['']
+        while stack:
+            prefix = stack.pop()
+            try:
+                with os.scandir(os.path.join(self.root, prefix)) as it:
+                    children = list(it)
+            except OSError:
+                return None
+            for child in children:
+                name = prefix + child.name
+                try:
+                    st = child.stat(follow_symlinks=False)
+                except OSError:
+                    # removed while scanning
+                    continue
+                if child.is_dir(follow_symlinks=False):
+                    entries[name] = ['d', 0, 0, None]
+                    stack.append(name + '/')
+                    continue
+                kind = 'l' if child.is_symlink() else 'f'
+                entry = [kind, st.st_size, st.st_mtime_ns, None]
+                old = previous.get(name)
+                if(old is not None and old[0] == kind == 'f' and
+                        old[1] == st.st_size):
+                    if(old[2] == st.st_mtime_ns):
+                        entry[3] = old[3]
+                    elif checksum:
+                        entry[3] = RSyncManifest.digest(child.path)
+                entries[name] = entry
+        return entries
+
+    @staticmethod
+    def delta(old, new):
+        """
+        Returns a sorted list of the entries of new that were added or changed
+        since old, and a sorted list of those of old that were deleted. Files
+        count as changed if their type, size or modification time differ,
+        unless both have the same hash.
+        """
+        changed = []
+        for name, entry in new.items():
+            before = old.get(name)
+            if(before is None or before[0] != entry[0]):
+                changed.append(name)
+            elif(entry[0] != 'd' and (before[1] != entry[1] or
+                    (before[2] != entry[2] and
+                        (entry[3] is None or entry[3] != before[3])))):
+                changed.append(name)
+        deleted = [name for name in old if not name in new]
+        return sorted(changed), sorted(deleted)
+
+    def changes(self, force=False, checksum=False):
+        """
+        Scans the directory, and returns its entries, or None if they can't
+        be read, and a tuple of the lists of changed and deleted entries since
+        the last transfer, or None if the whole directory has to be
+        transferred because there's no manifest or force is True.
+        """
+        old = None if force else self.load()
+        entries = self.scan(old, checksum)
+        if(old is None or entries is None):
+            return entries, None
+        return entries, RSyncManifest.delta(old, entries)
+
+    def remember(self, pending=()):
+        """
+        Scans the directory again after a transfer into it, and saves the
+        entries, keeping the known hashes of files that didn't change.
+
+        Keyword arguments:
+        pending -- entries that changed before the transfer and haven't been
+            pushed yet, which are left out so that the next push sends them
+        """
+        entries = self.scan(self.load())
+        if entries is None:
+            return
+        for name in pending:
+            entries.pop(name, None)
+        self.save(entries)
+
+    def write_list(self, names):
+        """
+        Writes names to a temporary file, separated by null characters, to be
+        read by rsync --files-from and --from0, and returns its path. The
+        caller removes the file.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.files-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'\0'.join(os.fsencode(x) for x in names))
+        return tmp
+
+
+class RSync(Sync):
+
+    """
+    Synchronizes paths using rsync.
+    """
+
+    # largest number of paths transferred by one rsync
+    batch_size = 64
+    # exit statuses of rsync and ssh for network errors and timeouts
+    transient_status = (10, 12, 30, 35, 255)
+    # lines of --stats with the files and bytes transferred
+    stats_re = re.compile(r'^(Number of regular files transferred|'
+            r'Total bytes sent|Total bytes received): ([\d,]+)', re.M)
+    # names of the further settings of a path passed to each mode
+    path_settings = {'push': ('checksum',)}
+    # transfers keep to the bandwidth budgets of their hosts
+    bandwidth_limited = True
+
+    def __init__(self, ssh=None, state=None, timeout=None, retries=None,
+            manifest_dir=MANIFEST_DIR):
+        """
+        Initializes the synchronizer.
+
+        Keyword arguments:
+        ssh, state, timeout, retries -- as for Sync
+        manifest_dir -- directory where the manifests of the directories last
+            transferred are kept, so that pushes only send what changed, or
+            None to always push everything
+        """
+        Sync.__init__(self, ssh=ssh, state=state, timeout=timeout,
+                retries=retries)
+        self.manifest_dir = manifest_dir
+
+    @staticmethod
+    def rsync_args(src, dest, verbose=False, relative=False):
+        """
+        Returns the rsync command that mirrors src into dest.
+
+        Keyword arguments:
+        src -- the path or remote to copy from, or a list of them
+        dest -- the path or remote to copy to
+        verbose -- printing level
+        relative -- recreates the part of each source after "/./" in dest
+        """
+        flags = "-au"
+        if verbose:
+            flags += "v"
+        if relative:
+            flags += "R"
+        if isinstance(src, str):
+            src = (src,)
+        return (("rsync", flags, "--delete", "--stats") + RSync.bwlimit_args()
+                + tuple(src) + (dest,))
+
+    @staticmethod
+    def files_args(src, dest, listfile, verbose=False):
+        """
+        Returns the rsync command that copies the entries listed in listfile,
+        relative to src, into dest, and deletes those of them that are missing
+        from src.
+
+        Keyword arguments:
+        src -- the local directory to copy from, ending with a slash
+        dest -- the path or remote to copy to
+        listfile -- a file of relative paths separated by null characters
+        verbose -- printing level
+        """
+        flags = "-au"
+        if verbose:
+            flags += "v"
+        return (("rsync", flags, "--stats") + RSync.bwlimit_args() +
+                ("--from0", "--files-from=%s" % (listfile),
+                    "--delete-missing-args", "--force", src, dest))
+
+    @staticmethod
+    def bwlimit_args():
+        """
+        Returns the rsync options that keep a transfer within the share of
+        its host's bandwidth budget that the path being synchronized has, if
+        it has one.
+        """
+        bandwidth = CURRENT_BANDWIDTH.get()
+        if bandwidth is None:
+            return ()
+        # rsync counts in units of 1024 bytes per second
+        return ('--bwlimit=%d' % (max(bandwidth // 1024, 1)),)
+
+    @staticmethod
+    def transfer_counts(output):
+        """
+        Returns the number of files and bytes that an rsync transferred, from
+        the statistics in its output.
+        """
+        files = 0
+        size = 0
+        for match in RSync.stats_re.finditer(output):
+            value = int(match.group(2).replace(',', ''))
+            if(match.group(1) == 'Number of regular files transferred'):
+                files += value
+            else:
+                size += value
+        return files, size
+
+    @classmethod
+    def transient(cls, status, output):
+        """
+        Returns True if an rsync that failed with the given exit status and
+        end of its output might work when it's tried again.
+        """
+        return(status in cls.transient_status or
+                super().transient(status, output))
+
+    @staticmethod
+    def split_remote(path, remote):
+        """
+        Splits a directory and the remote directory it mirrors into their
+        parents and their shared name. Returns a tuple of the remote parent,
+        the local parent and the name, or None if they have different names
+        or aren't both directories on an ssh host.
+
+        Keyword arguments:
+        path -- the local directory, ending with a slash
+        remote -- the remote directory, like "host:path/"
+        """
+        if(remote is None or remote_host(remote) is None or '://' in remote
+                or not remote.endswith('/') or not path.endswith('/')):
+            return None
+        host, _, rpath = remote.partition(':')
+        rparent, _, rname = rpath.rstrip('/').rpartition('/')
+        lparent, _, lname = path.rstrip('/').rpartition('/')
+        if(rname != lname or rname in ('', '.', '..', '~')
+                or not rpath.rstrip('/').count('/')):
+            return None
+        return ('%s:%s' % (host, rparent or '/'), lparent or '/', rname)
+
+    @staticmethod
+    def batch_key(path, remote, mode):
+        """
+        Returns a key shared by all paths that can be transferred by the same
+        rsync, or None if the path has to be transferred on its own. Batched
+        directories must have the same name as their remote directory, and
+        share their parents with the rest of the batch.
+
+        Keyword arguments:
+        path -- the path to synchronize
+        remote -- the remote origin of the path
+        mode -- a string, one of "update", "push", or "resolve"
+        """
+        split = RSync.split_remote(path, remote)
+        if split is None:
+            return None
+        return (mode, split[0], split[1])
+
+    def update_batch(self, paths, srcs, merge=False, verbose=False):
+        """
+        Updates several paths with the same batch_key using one rsync. Returns
+        a list with True for each path that had an error.
+
+        Keyword arguments:
+        paths -- the paths to update
+        srcs -- the remote origin of each path
+        merge -- ignored
+        verbose -- printing level
+        """
+        return self.transfer_batch(paths, srcs, False, verbose)
+
+    def push_batch(self, paths, dests, verbose=False, force=False,
+            checksum=False):
+        """
+        Pushes several paths with the same batch_key using one rsync. Returns
+        a list with True for each path that had an error.
+
+        Keyword arguments:
+        paths -- the paths to push
+        dests -- the remote origin of each path
+        verbose -- printing level
+        force, checksum -- as for push
+        """
+        return self.transfer_batch(paths, dests, True, verbose, force,
+                checksum)
+
+    def transfer_batch(self, paths, remotes, push, verbose=False, force=False,
+            checksum=False):
+        """
+        Transfers several paths with the same batch_key using one rsync. If it
+        fails, every path is transferred again on its own to find out which of
+        them had errors. Pushes of paths that all have manifests only send the
+        entries that changed, like push.
+        """
+        splits = [RSync.split_remote(p, r) for p, r in zip(paths, remotes)]
+        rparent, lparent = splits[0][0], splits[0][1]
+        # the manifests are read before the transfer, so that whatever
+        # changes during it is sent by the next push
+        if push:
+            plans = [self.manifest_changes(p, force, checksum) for p in paths]
+            srcs = ['%s/./%s/' % (lparent.rstrip('/'), x[2]) for x in splits]
+            dest = '%s/' % (rparent.rstrip('/'))
+        else:
+            plans = [self.manifest_changes(p) for p in paths]
+            srcs = ['%s/./%s/' % (rparent.rstrip('/'), x[2]) for x in splits]
+            dest = '%s/' % (lparent.rstrip('/'))
+        names = None
+        if(push and all(x[2] is not None for x in plans)):
+            names = []
+            for (_, _, (changed, deleted)), split in zip(plans, splits):
+                names.extend('%s/%s' % (split[2], x)
+                        for x in changed + deleted)
+            if not names:
+                note_metrics(skipped=True)
+                if verbose:
+                    note_output('No changes since the last push, skipping.',
+                            file=sys.stdout)
+                return [False] * len(paths)
+        if names is None:
+            error = run_steps(self.transfer_steps(srcs, dest, remotes[0],
+                verbose, relative=True))
+        else:
+            error = run_steps(self.transfer_steps('%s/' % (
+                lparent.rstrip('/')), dest, remotes[0], verbose, plans[0][0],
+                names))
+        if not error:
+            for plan in plans:
+                RSync.remember(plan, push)
+            return [False] * len(paths)
+        # find the paths with errors one at a time
+        if push:
+            return [self.push(p, r, verbose=verbose, force=force,
+                checksum=checksum) for p, r in zip(paths, remotes)]
+        return [self.update(p, r, verbose=verbose)
+                for p, r in zip(paths, remotes)]
+
+    def manifest_changes(self, path, force=False, checksum=False):
+        """
+        Returns the RSyncManifest of a path, or None if it has none, followed
+        by its entries and changes as returned by RSyncManifest.changes, or
+        None and None.
+        """
+        manifest = RSyncManifest.open(path, self.manifest_dir)
+        if manifest is None:
+            return None, None, None
+        return (manifest,) + manifest.changes(force, checksum)
+
+    @staticmethod
+    def remember(plan, push):
+        """
+        Updates the manifest of a path after a transfer without errors.
+
         Keyword arguments:
-        path -- the path to push
+        plan -- the tuple returned by manifest_changes before the transfer
+        push -- True if the path was pushed, so that the entries read before
+            the transfer were sent, or False if it was updated, so that it's
+            scanned again, leaving out the entries that changed before the
+            update, which still have to be pushed
+        """
+        manifest, entries, delta = plan
+        if manifest is None:
+            return
+        if push:
+            if entries is not None:
+                manifest.save(entries)
+        elif delta is not None:
+            manifest.remember(delta[0])
+
+    def transfer_steps(self, src, dest, remote, verbose=False, manifest=None,
+            names=None, relative=False):
+        """
+        Generator of the steps that mirror src into dest with one rsync, or
+        that only copy the entries in names, relative to src, and delete those
+        of them that are missing from src. Returns False if no errors.
+
+        Keyword arguments:
+        src -- the path or remote to copy from, or a list of them
+        dest -- the path or remote to copy to
+        remote -- whichever of the two is on another host, for the ssh
+            environment
         verbose -- printing level
+        manifest -- an RSyncManifest, whose directory holds the list of names
+        names -- the relative paths of the entries to copy, or None to mirror
+            the whole of src
+        relative -- as for rsync_args
         """
-        cmd = "rsync"
-        flags = "-au"
-        opts = "--delete"
-        if verbose:
-            flags += "v"
         # set the pipes and printing color
         if verbose:
             out = sys.stdout
             err = sys.stderr
-            print('\033[97m', sep='', end='', file=out, flush=True)
         else:
             out = subprocess.DEVNULL
             err = subprocess.DEVNULL
+        listfile = None
         try:
-            # update the path
-            # TODO: log the output using the stdout and stderr arguments
-            error = subprocess.call((cmd, flags, opts, path, dest), stdout=out,
-                    stderr=err)
+            env = yield step(self.host_env, remote)
+            if names is None:
+                args = RSync.rsync_args(src, dest, verbose, relative)
+            else:
+                listfile = yield step(manifest.write_list, names)
+                args = RSync.files_args(src, dest, listfile, verbose)
+            error = yield step(call, args, stdout=out, stderr=err, env=env,
+                    count=RSync.transfer_counts, transient=self.transient)
         except OSError as emsg:
             error = True
             if verbose:
                 error_print(emsg)
+        finally:
+            if listfile is not None:
+                try:
+                    os.remove(listfile)
+                except OSError:
+                    pass
         return error
 
-    @staticmethod
-    def resolve(path, verbose=False):
+    def update(self, path, src, merge=False, verbose=False):
+        """
+        Update a path, pulling any changes. Returns False if no errors.
+
+        Keyword arguments:
+        path -- the path to update
+        merge -- ignored
+        verbose -- printing level
+        """
+        return run_steps(self.update_steps(path, src, merge, verbose))
+
+    def update_steps(self, path, src, merge=False, verbose=False):
+        """
+        Generator of the steps of update, for run_steps or async_run_steps.
+        """
+        plan = yield step(self.manifest_changes, path)
+        # update the path
+        error = yield from self.transfer_steps(src, path, src, verbose)
+        if not error:
+            yield step(RSync.remember, plan, False)
+        return error
+
+    def push(self, path, dest, verbose=False, force=False, checksum=False):
+        """
+        Pushes all changes in the path to dest. A directory with a manifest
+        from its last transfer only sends the entries that changed since, and
+        is skipped if none did. Changes made on the remote side aren't
+        noticed, so force pushes everything again.
+
+        Keyword arguments:
+        path -- the path to push
+        dest -- the remote origin of the path
+        verbose -- printing level
+        force -- pushes the whole path even if it has a manifest
+        checksum -- compares the contents of files whose modification time
+            changed but whose size didn't, so that touched files aren't sent
+        """
+        return run_steps(self.push_steps(path, dest, verbose, force,
+            checksum))
+
+    def push_steps(self, path, dest, verbose=False, force=False,
+            checksum=False):
+        """
+        Generator of the steps of push, for run_steps or async_run_steps.
+        """
+        manifest, entries, delta = plan = yield step(self.manifest_changes,
+                path, force, checksum)
+        if(delta is not None and not any(delta)):
+            note_metrics(skipped=True)
+            if verbose:
+                note_output('No changes since the last push, skipping.',
+                        file=sys.stdout)
+            return False
+        # push the path, or only what changed
+        if delta is None:
+            error = yield from self.transfer_steps(path, dest, dest, verbose)
+        else:
+            error = yield from self.transfer_steps(path, dest, dest, verbose,
+                    manifest, delta[0] + delta[1])
+        if not error:
+            yield step(RSync.remember, plan, True)
+        return error
+
+    def status(self, path, src, verbose=False):
+        """
+        Reads how many files pushing a path would transfer, as how far it's
+        ahead, and how many updating it would, as how far it's behind, from
+        dry runs of rsync, and notes them on the status of the path. Returns
+        False if no errors.
+
+        Keyword arguments:
+        path -- the path to inspect
+        src -- the remote origin of the path
+        verbose -- printing level
+        """
+        env = self.host_env(src)
+        counts = []
+        try:
+            for args in (RSync.rsync_args(path, src), RSync.rsync_args(src,
+                    path)):
+                output = check_output(args[:1] + ('--dry-run',) + args[1:],
+                        env=env, stderr=subprocess.DEVNULL).decode()
+                counts.append(RSync.transfer_counts(output)[0])
+        except (OSError, subprocess.CalledProcessError) as emsg:
+            if verbose:
+                error_print(emsg)
+            return True
+        note_status(ahead=counts[0], behind=counts[1])
+        return False
+
+    def resolve(self, path, verbose=False):
         """
         Resolves changes 
 
@@ -528,18 +5798,685 @@ class RSync(object):
         """
         raise NotImplementedError("can't resolve yet...")
 
+async def async_call(args, stdout=None, stderr=None, cwd=None, env=None,
+        count=None, transient=None):
+    """
+    Runs a command in an asyncio subprocess and returns its exit status, like
+    subprocess.call. The command is added to the metrics of the path being
+    synchronized, without its CPU time, and killed at the deadline of the
+    path like with call, whose count and transient arguments it also takes.
+    """
+    metrics = CURRENT_METRICS.get()
+    output = CURRENT_OUTPUT.get()
+    timeout = time_left()
+    if(metrics is None or count is None) and output is None:
+        proc = await asyncio.create_subprocess_exec(*args, stdout=stdout,
+                stderr=stderr, cwd=cwd, env=env,
+                start_new_session=(timeout is not None))
+        status, = await async_wait(proc, args, timeout)
+        tail = b''
+    else:
+        if output is None:
+            output = PathOutput(None)
+        proc = await asyncio.create_subprocess_exec(*args,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                cwd=cwd, env=env, start_new_session=(timeout is not None))
+        sink = [] if(count is not None and metrics is not None) else None
+        out_tail, err_tail, status = await async_wait(proc, args, timeout,
+                async_read_output(proc.stdout, output, 'stdout', stdout,
+                    sink),
+                async_read_output(proc.stderr, output, 'stderr', stderr,
+                    sink))
+        tail = out_tail + err_tail
+        if sink is not None:
+            objects, size = count(b''.join(sink).decode(errors='replace'))
+            metrics.objects += objects
+            metrics.bytes += size
+    if metrics is not None:
+        metrics.add_command(status, 0.0, 0.0)
+        if(status and transient is not None and
+                transient(status, tail.decode(errors='replace'))):
+            metrics.transient = True
+    return status
+
+async def async_check_output(args, stderr=None, cwd=None, env=None):
+    """
+    Runs a command in an asyncio subprocess and returns its output, like
+    subprocess.check_output.
+    """
+    path_output = CURRENT_OUTPUT.get()
+    timeout = time_left()
+    if(path_output is None or stderr == subprocess.DEVNULL):
+        proc = await asyncio.create_subprocess_exec(*args,
+                stdout=asyncio.subprocess.PIPE, stderr=stderr, cwd=cwd,
+                env=env, start_new_session=(timeout is not None))
+        output, _ = await async_wait(proc, args, timeout, proc.stdout.read())
+    else:
+        proc = await asyncio.create_subprocess_exec(*args,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                cwd=cwd, env=env, start_new_session=(timeout is not None))
+        output, _, _ = await async_wait(proc, args, timeout,
+                proc.stdout.read(), async_read_output(proc.stderr,
+                    path_output, 'stderr', stderr))
+    metrics = CURRENT_METRICS.get()
+    if metrics is not None:
+        metrics.add_command(proc.returncode, 0.0, 0.0)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, args, output)
+    return output
+
+async def async_run_steps(steps):
+    """
+    Coroutine version of run_steps. Commands run with call and check_output
+    are run as asyncio subprocesses with async_call and async_check_output
+    instead, and any other step on the default executor, so that nothing
+    blocks the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    result = None
+    failure = None
+    while True:
+        try:
+            if failure is None:
+                function, args, kwargs = steps.send(result)
+            else:
+                function, args, kwargs = steps.throw(failure)
+        except StopIteration as stop:
+            return stop.value
+        result = None
+        failure = None
+        try:
+            if(function is call):
+                result = await async_call(*args, **kwargs)
+            elif(function is check_output):
+                result = await async_check_output(*args, **kwargs)
+            else:
+                result = await loop.run_in_executor(None,
+                        contextvars.copy_context().run, functools.partial(
+                            function, *args, **kwargs))
+        except Exception as emsg:
+            failure = emsg
+
+async def async_wait(proc, args, timeout, *readers):
+    """
+    Waits for the readers of an asyncio subprocess and then for the process
+    itself, and returns their results followed by its exit status. If that
+    takes longer than timeout seconds, the process group is killed and
+    TimeoutExpired is raised.
+    """
+    async def finish():
+        results = await asyncio.gather(*readers)
+        return list(results) + [await proc.wait()]
+    try:
+        return await asyncio.wait_for(finish(), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError) as emsg:
+        if timeout is not None:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        # reap the process, even when the coroutine was cancelled
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+        if isinstance(emsg, asyncio.CancelledError):
+            raise
+        raise subprocess.TimeoutExpired(args, timeout)
+
+async def async_read_output(reader, output, name, show=None, sink=None):
+    """
+    Reads the output of an asyncio subprocess until it ends, passing its
+    lines on to a PathOutput like OutputMux does, and all the data read on to
+    sink if it's a list. Returns the last data read.
+    """
+    stream = OutputStream(None, output, name, show, sink)
+    while True:
+        data = await reader.read(65536)
+        stream.feed(data)
+        if(not data):
+            return stream.tail
+
+
+class AsyncGitSync(GitSync):
+
+    """
+    Synchronizes paths using git from asyncio coroutines. The steps of
+    GitSync are run with async_run_steps, so its commands run as asyncio
+    subprocesses.
+    """
+
+    # commits are made by push itself, since the event loop has no pool for
+    # local work
+    local_stages = {}
+
+    async def update(self, path, src=None, merge=False, verbose=False,
+            branch=None, depth=None, filter=None, single_branch=False):
+        """
+        Coroutine version of GitSync.update.
+        """
+        return await async_run_steps(self.update_steps(path, src, merge,
+            verbose, branch, depth, filter, single_branch))
+
+    async def commit(self, path, dest="origin", verbose=False, force=False,
+            branch=None):
+        """
+        Coroutine version of GitSync.commit.
+        """
+        return await async_run_steps(self.commit_steps(path, dest, verbose,
+            force, branch))
+
+    async def push(self, path, dest="origin", verbose=False, force=False,
+            branch=None):
+        """
+        Coroutine version of GitSync.push.
+        """
+        return await async_run_steps(self.push_steps(path, dest, verbose,
+            force, branch))
+
+    async def status(self, path, src=None, verbose=False, branch=None):
+        """
+        Coroutine version of GitSync.status, which runs on the default
+        executor.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, contextvars.copy_context().run,
+                functools.partial(GitSync.status, self, path, src, verbose,
+                    branch))
+
+
+class AsyncRSync(RSync):
+
+    """
+    Synchronizes paths using rsync from asyncio coroutines. The steps of
+    RSync are run with async_run_steps, so its commands run as asyncio
+    subprocesses.
+    """
+
+    async def update(self, path, src, merge=False, verbose=False):
+        """
+        Coroutine version of RSync.update.
+        """
+        return await async_run_steps(self.update_steps(path, src, merge,
+            verbose))
+
+    async def push(self, path, dest, verbose=False, force=False,
+            checksum=False):
+        """
+        Coroutine version of RSync.push.
+        """
+        return await async_run_steps(self.push_steps(path, dest, verbose,
+            force, checksum))
+
+    async def status(self, path, src, verbose=False):
+        """
+        Coroutine version of RSync.status, which runs on the default executor.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, contextvars.copy_context().run,
+                functools.partial(RSync.status, self, path, src, verbose))
+
+
+def remote_host(location):
+    """
+    Returns the ssh destination of a remote location, or None if the location
+    is local or doesn't use ssh.
+
+    Keyword arguments:
+    location -- a URL such as "ssh://user@host/path" or an scp-like location
+        such as "user@host:path"
+    """
+    if not location:
+        return None
+    if('://' in location):
+        url = urllib.parse.urlsplit(location)
+        if(not url.scheme in ('ssh', 'git+ssh', 'ssh+git') or not url.hostname):
+            return None
+        host = url.hostname
+        if url.username:
+            host = '%s@%s' % (url.username, host)
+        if url.port:
+            return 'ssh://%s:%d' % (host, url.port)
+        return host
+    # scp-like syntax: everything before the first colon, if it has no slash
+    host, colon, rest = location.partition(':')
+    if(not colon or not host or '/' in host or rest.startswith(':')):
+        return None
+    return host
+
+
+def location_host(location):
+    """
+    Returns the name of the host of a remote location, without any user or
+    port, or None if the location is local. Unlike remote_host, hosts reached
+    without ssh, like those of https URLs, have names too.
+
+    Keyword arguments:
+    location -- a URL or scp-like location, or None
+    """
+    if not location:
+        return None
+    if('://' in location):
+        return urllib.parse.urlsplit(location).hostname
+    host = remote_host(location)
+    if host is None:
+        return None
+    return host.rpartition('@')[2]
+
+
+class RemoteHeads(object):
+
+    """
+    A cache of the branch heads advertised by git remotes, so that working
+    copies of the same remote only query it once per run.
+    """
+
+    def __init__(self):
+        # dict of (url, ref) to the advertised SHA, or None if unknown
+        self.heads = {}
+        # dict of (url, ref) to locks, so that each remote is queried once
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def clear(self):
+        """
+        Forgets all remote heads.
+        """
+        with self.lock:
+            self.heads = {}
+            self.locks = {}
+
+    def get(self, url, ref='refs/heads/master', cwd=None, env=None):
+        """
+        Returns the SHA that a remote advertises for a ref, or None if the
+        remote can't be reached or doesn't have the ref.
+
+        Keyword arguments:
+        url -- the URL of the remote
+        ref -- the full name of the ref
+        cwd -- directory to run git in, for relative URLs
+        env -- environment for git, or None for the default environment
+        """
+        key = (url, ref)
+        with self.lock:
+            if(key in self.heads):
+                return self.heads[key]
+            lock = self.locks.setdefault(key, threading.Lock())
+        with lock:
+            with self.lock:
+                if(key in self.heads):
+                    return self.heads[key]
+            sha = None
+            try:
+                output = check_output(('git', 'ls-remote', url, ref),
+                        cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL).decode()
+                for line in output.splitlines():
+                    fields = line.split()
+                    if(len(fields) == 2 and fields[1] == ref):
+                        sha = fields[0]
+            except (OSError, subprocess.CalledProcessError):
+                pass
+            with self.lock:
+                self.heads[key] = sha
+            return sha
+
+    def current(self, cwd, remote, url, env=None, branch='master'):
+        """
+        Returns True if pulling a branch from a remote can't change the
+        repository in cwd, because the remote head is already HEAD, or is the
+        local tracking ref and merged into HEAD.
+
+        Keyword arguments:
+        cwd -- the repository path
+        remote -- the remote name or URL being pulled from
+        url -- the URL of the remote
+        env -- environment for git, or None for the default environment
+        branch -- the branch being pulled
+        """
+        if url is None:
+            return False
+        sha = self.get(url, 'refs/heads/%s' % (branch), cwd=cwd, env=env)
+        if sha is None:
+            return False
+        refs = ('HEAD',)
+        if(GitSync.url_args(remote) is not None):
+            refs += ('refs/remotes/%s/%s' % (remote, branch),)
+        # read the refs without git if possible
+        local = [INSPECTOR.resolve(cwd, ref) for ref in refs]
+        if(None in local):
+            try:
+                local = check_output(('git', 'rev-parse') + refs, cwd=cwd,
+                        stderr=subprocess.DEVNULL).decode().split()
+            except (OSError, subprocess.CalledProcessError):
+                return False
+        if(local[0] == sha):
+            return True
+        if(len(local) < 2 or local[1] != sha):
+            return False
+        return call(('git', 'merge-base', '--is-ancestor', sha, 'HEAD'),
+                cwd=cwd, stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL) == 0
+
+
+class ObjectMirrors(object):
+
+    """
+    Local bare mirrors of git remotes, one per URL, fetched at most once per
+    run. Working copies of the same remote borrow objects from its mirror
+    through their alternates and pull from it, so that the remote is only
+    fetched over the network once however many working copies it has, and
+    objects the working copies share are kept on disk once after they're
+    maintained. Mirrors never prune objects, since working copies may still
+    need them.
+    """
+
+    def __init__(self, directory=MIRROR_DIR):
+        """
+        Initializes the mirrors.
+
+        Keyword arguments:
+        directory -- directory with a bare repository for each remote
+        """
+        self.directory = directory
+        # dict of URLs to their mirror fetched during the run, or None if
+        # the fetch failed
+        self.mirrors = {}
+        # dict of URLs to locks, so that each remote is fetched once
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def clear(self):
+        """
+        Forgets the mirrors fetched during a run.
+        """
+        with self.lock:
+            self.mirrors = {}
+            self.locks = {}
+
+    @staticmethod
+    def mirrored(url):
+        """
+        Returns True if the remote at url is worth mirroring, which local
+        paths aren't, since git already links their objects.
+        """
+        return(url is not None and
+                ('://' in url or remote_host(url) is not None))
+
+    def path(self, url):
+        """
+        Returns the directory of the mirror of url.
+        """
+        name = hashlib.sha1(url.encode()).hexdigest()[:16]
+        return os.path.join(os.path.expanduser(self.directory), name + '.git')
+
+    @staticmethod
+    def init_args(url):
+        """
+        Returns the git commands that set up a new mirror of url in the
+        current directory.
+        """
+        return (('git', 'init', '--bare', '--quiet', '.'),
+                ('git', 'config', 'seelie.url', url),
+                ('git', 'config', 'gc.pruneExpire', 'never'))
+
+    @staticmethod
+    def fetch_args(url):
+        """
+        Returns the git command that brings a mirror of url up to date.
+        """
+        return ('git', 'fetch', '--progress', '--prune', url,
+                '+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*')
+
+    def fetch(self, url, env=None, stdout=None, stderr=None):
+        """
+        Returns the directory of the mirror of url, creating it if needed and
+        fetching it unless it was already fetched during the run, or None if
+        it couldn't be fetched.
+
+        Keyword arguments:
+        url -- the URL of the remote
+        env -- environment for git, or None for the default environment
+        stdout, stderr -- where the output of the fetch goes
+        """
+        with self.lock:
+            if(url in self.mirrors):
+                return self.mirrors[url]
+            lock = self.locks.setdefault(url, threading.Lock())
+        with lock:
+            with self.lock:
+                if(url in self.mirrors):
+                    return self.mirrors[url]
+            mirror = self.path(url)
+            error = False
+            try:
+                if(not os.path.isdir(mirror)):
+                    # set the mirror up aside so it's never half made
+                    parent = os.path.dirname(mirror)
+                    os.makedirs(parent, exist_ok=True)
+                    tmp = tempfile.mkdtemp(dir=parent, prefix='.new-')
+                    for args in ObjectMirrors.init_args(url):
+                        error = error or call(args, stdout=subprocess.DEVNULL,
+                                stderr=stderr, cwd=tmp)
+                    if(not error and not os.path.isdir(mirror)):
+                        os.rename(tmp, mirror)
+                    else:
+                        shutil.rmtree(tmp, ignore_errors=True)
+                error = error or call(ObjectMirrors.fetch_args(url),
+                        stdout=stdout, stderr=stderr, cwd=mirror, env=env,
+                        stdin=subprocess.DEVNULL,
+                        count=GitSync.transfer_counts)
+            except OSError:
+                error = True
+            with self.lock:
+                self.mirrors[url] = None if error else mirror
+                return self.mirrors[url]
+
+    @staticmethod
+    def borrow(cwd, mirror):
+        """
+        Makes the repository in cwd borrow objects from a mirror, if it
+        doesn't already. Returns True if it does.
+        """
+        dirs = git_dirs(cwd)
+        if dirs is None:
+            return False
+        objects = os.path.join(mirror, 'objects')
+        filename = os.path.join(dirs[1], 'objects', 'info', 'alternates')
+        try:
+            try:
+                with open(filename) as f:
+                    text = f.read()
+            except FileNotFoundError:
+                text = ''
+            if(objects in text.splitlines()):
+                return True
+            if(text and not text.endswith('\n')):
+                objects = '\n' + objects
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, 'a') as f:
+                f.write(objects + '\n')
+        except OSError:
+            return False
+        return True
+
+
+class SSHPool(object):
+
+    """
+    A pool of ssh master connections, one per host, so that every command that
+    connects to the same host reuses one authenticated channel. Masters are
+    started on first use and stopped by close().
+    """
+
+    def __init__(self, ssh='ssh', timeout=10, persist=60):
+        """
+        Initializes the pool.
+
+        Keyword arguments:
+        ssh -- the ssh command to use
+        timeout -- seconds to wait when connecting a master
+        persist -- seconds an idle master stays up, so that masters that
+            close() never stopped, because seelie was killed, go away
+        """
+        self.ssh = ssh
+        self.timeout = timeout
+        self.persist = persist
+        # directory with the control sockets, created on first use
+        self.control_dir = None
+        # dict of hosts to control socket paths, or None if no master
+        self.masters = {}
+        # dict of hosts to locks, so that each master is started only once
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def control_path(self, host):
+        """
+        Returns the control socket path for a host.
+        """
+        if self.control_dir is None:
+            self.control_dir = tempfile.mkdtemp(prefix='seelie-ssh-')
+        name = hashlib.sha1(host.encode()).hexdigest()[:16]
+        return os.path.join(self.control_dir, name)
+
+    def master(self, host):
+        """
+        Returns the control socket path of the master connection to a host,
+        starting the master if needed, or None if no master is available.
+        """
+        with self.lock:
+            if(host in self.masters):
+                return self.masters[host]
+            lock = self.locks.setdefault(host, threading.Lock())
+        with lock:
+            with self.lock:
+                if(host in self.masters):
+                    return self.masters[host]
+                path = self.control_path(host)
+            # start the master in the background once it's authenticated
+            try:
+                error = subprocess.call((self.ssh, '-f', '-N',
+                    '-o', 'ControlMaster=yes',
+                    '-o', 'ControlPath=%s' % (path),
+                    '-o', 'ControlPersist=%d' % (self.persist),
+                    '-o', 'BatchMode=yes',
+                    '-o', 'ConnectTimeout=%d' % (self.timeout), host),
+                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL, timeout=self.timeout * 3)
+                error = error or subprocess.call((self.ssh, '-O', 'check',
+                    '-o', 'ControlPath=%s' % (path), host),
+                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL, timeout=self.timeout)
+            except (OSError, subprocess.TimeoutExpired):
+                error = True
+            with self.lock:
+                self.masters[host] = None if error else path
+                return self.masters[host]
+
+    def command(self, host, base='ssh'):
+        """
+        Returns a shell command line for ssh that reuses the master connection
+        to a host, or None if no master is available. If the master goes away
+        ssh falls back to connecting on its own.
+
+        Keyword arguments:
+        host -- the ssh destination
+        base -- the ssh command line to extend
+        """
+        path = self.master(host)
+        if path is None:
+            return None
+        return '%s -o ControlMaster=no -o ControlPath=%s' % (base,
+                shlex.quote(path))
+
+    def env(self, host):
+        """
+        Returns an environment in which git and rsync reuse the master
+        connection to a host, or None if no master is available.
+        """
+        git = self.command(host, os.environ.get('GIT_SSH_COMMAND', self.ssh))
+        if git is None:
+            return None
+        env = dict(os.environ)
+        env['GIT_SSH_COMMAND'] = git
+        env['RSYNC_RSH'] = self.command(host,
+                os.environ.get('RSYNC_RSH', self.ssh))
+        return env
+
+    def close(self):
+        """
+        Stops all master connections and removes their control sockets.
+        """
+        with self.lock:
+            masters = self.masters
+            self.masters = {}
+            self.locks = {}
+            control_dir = self.control_dir
+            self.control_dir = None
+        for host, path in masters.items():
+            if path is None:
+                continue
+            try:
+                subprocess.call((self.ssh, '-O', 'exit',
+                    '-o', 'ControlPath=%s' % (path), host),
+                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL, timeout=self.timeout)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        if control_dir is not None:
+            shutil.rmtree(control_dir, ignore_errors=True)
+
+
 class SeeliePath(object):
 
     """
     Holds information about a path to be synched (folder or repository)
     """
-    
-    def __init__(self, path, tool=None, origin=None):
-        self.path = os.path.normpath(os.path.expanduser(path))
-        if(os.path.isdir(self.path)):
-            self.path = os.path.join(self.path, "")
+
+    __slots__ = ('key', 'tool', 'origin', 'options', 'resolved')
+
+    def __init__(self, path, tool=None, origin=None, options=None):
+        # the normalized path, found without touching the file system
+        self.key = os.path.normpath(os.path.expanduser(path))
         self.tool = tool
         self.origin = origin
+        # dict of further settings from the path's attributes
+        self.options = options or {}
+        # the path with directory state, once it's needed
+        self.resolved = None
+
+    @classmethod
+    def from_key(cls, key, tool=None, origin=None, options=None):
+        """
+        Creates a path from a path that's already normalized.
+        """
+        item = cls.__new__(cls)
+        item.key = key
+        item.tool = tool
+        item.origin = origin
+        item.options = options or {}
+        item.resolved = None
+        return item
+
+    @property
+    def path(self):
+        """
+        The normalized path, ending with a slash if it's a directory. The file
+        system is only checked the first time this is used.
+        """
+        if self.resolved is None:
+            path = self.key
+            if(os.path.isdir(path)):
+                path = os.path.join(path, "")
+            self.resolved = path
+        return self.resolved
 
     def __str__(self):
         return str(self.path)
@@ -550,7 +6487,9 @@ class SeelieRef(object):
     """
     A reference to another project
     """
-    
+
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
@@ -558,6 +6497,91 @@ class SeelieRef(object):
         return str(self.name)
 
 
+def flag(text):
+    """
+    Returns the boolean value of an attribute, like "true" or "0".
+    """
+    if(text.lower() in ('true', 'yes', '1')):
+        return True
+    if(text.lower() in ('false', 'no', '0')):
+        return False
+    raise ValueError("not a boolean: '%s'" % (text))
+
+
+def positive(text):
+    """
+    Returns the value of an attribute that has to be a positive integer.
+    """
+    value = int(text)
+    if(value < 1):
+        raise ValueError("not positive: '%s'" % (text))
+    return value
+
+
+def rate(text):
+    """
+    Returns the value of an attribute that has to be a positive number of
+    bytes per second, with an optional K, M or G suffix for units of 1024,
+    1024^2 or 1024^3 bytes, like "500K" or "2M".
+    """
+    units = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30}
+    number = text.strip()
+    scale = units.get(number[-1:].lower())
+    if scale is not None:
+        number = number[:-1]
+    value = int(float(number) * (scale or 1))
+    if(value < 1):
+        raise ValueError("not positive: '%s'" % (text))
+    return value
+
+
+class SeelieHost(object):
+
+    """
+    Limits for the paths synchronized with a host: how many of them run at
+    once, and the bandwidth their transfers share.
+    """
+
+    __slots__ = ('name', 'jobs', 'bandwidth')
+
+    # attributes of hosts and their types
+    attributes = {
+            'jobs': positive,
+            'bandwidth': rate,
+            }
+
+    def __init__(self, node, verbose=False, i=0):
+        # the host name, as in the remote locations of paths
+        self.name = node.attrib.get('name', None)
+        # most paths of the host synchronized at once, or None for no limit
+        self.jobs = None
+        # bytes per second shared by the transfers of the host, or None
+        self.bandwidth = None
+        for key, kind in SeelieHost.attributes.items():
+            if(not key in node.attrib):
+                continue
+            try:
+                setattr(self, key, kind(node.attrib[key]))
+            except ValueError:
+                if verbose:
+                    print("Ignored %s '%s' of host #%d"
+                            % (key, node.attrib[key], i), file=sys.stderr)
+
+    @classmethod
+    def from_values(cls, name, jobs=None, bandwidth=None):
+        """
+        Creates a host from its name and limits instead of an XML node.
+        """
+        host = cls.__new__(cls)
+        host.name = name
+        host.jobs = jobs
+        host.bandwidth = bandwidth
+        return host
+
+    def __str__(self):
+        return str(self.name)
+
+
 class SeelieProject(object):
 
     """
@@ -565,6 +6589,8 @@ class SeelieProject(object):
     usually with one or more associated paths or references.
     """
 
+    __slots__ = ('name', 'items', 'auto', 'priority', 'after')
+
     def __init__(self, node, verbose=False, i=0):
         self.name = None
         self.items = []
@@ -574,6 +6600,16 @@ class SeelieProject(object):
             self.auto = False
         else:
             self.auto = True
+        # paths of projects with higher priorities start first
+        try:
+            self.priority = int(node.attrib.get("priority", 0))
+        except ValueError:
+            if verbose:
+                print("Ignored priority '%s' of project #%d"
+                        % (node.attrib["priority"], i), file=sys.stderr)
+            self.priority = 0
+        # names of projects whose paths have to be synchronized first
+        self.after = node.attrib.get("after", "").replace(',', ' ').split()
         for child in node:
             # set the name
             if(child.tag.lower() == 'name'):
@@ -587,8 +6623,11 @@ class SeelieProject(object):
                 tool = child.attrib.get('tool', None)
                 # origin
                 origin = child.attrib.get('origin', None)
+                # further settings
+                options = SeelieProject.path_options(child, verbose, i)
                 # add the path to the project
-                self.items.append(SeeliePath(child.text, tool, origin))
+                self.items.append(SeeliePath(child.text, tool, origin,
+                    options))
             elif(child.tag.lower() == 'reference'):
                 # add the reference to the project
                 self.items.append(SeelieRef(child.text))
@@ -598,6 +6637,50 @@ class SeelieProject(object):
         if(verbose and (self.name is None)):
             print("No name set for project #%d" % (i), file=sys.stderr)
 
+    # attributes of paths with further settings, and their types, with
+    # dashes in the attribute names instead of the underscores of the settings
+    path_attributes = {
+            'timeout': float,
+            'retries': int,
+            'branch': str,
+            'depth': positive,
+            'filter': str,
+            'single_branch': flag,
+            'checksum': flag,
+            }
+
+    @staticmethod
+    def path_options(node, verbose=False, i=0):
+        """
+        Returns a dict of the further settings in the attributes of a path
+        node, leaving out those that can't be read.
+        """
+        options = {}
+        for key, kind in SeelieProject.path_attributes.items():
+            name = key.replace('_', '-')
+            if(not name in node.attrib):
+                continue
+            try:
+                options[key] = kind(node.attrib[name])
+            except ValueError:
+                if verbose:
+                    print("Ignored %s '%s' of a path in project #%d"
+                            % (name, node.attrib[name], i), file=sys.stderr)
+        return options
+
+    @classmethod
+    def from_items(cls, name, items, auto=True, priority=0, after=()):
+        """
+        Creates a project from its name and items instead of an XML node.
+        """
+        project = cls.__new__(cls)
+        project.name = name
+        project.items = list(items)
+        project.auto = auto
+        project.priority = priority
+        project.after = list(after)
+        return project
+
     def __getitem__(self, key):
         return self.items[key]
 
@@ -613,6 +6696,9 @@ if __name__ == '__main__':
     merge = 'merge'
     push = 'push'
     resolve = 'resolve'
+    watch = 'watch'
+    status = 'status'
+    maintain = 'maintain'
 
     # default arguments
     projects = None
@@ -620,6 +6706,18 @@ if __name__ == '__main__':
     mode = update
     verbose = 1
     merge = False
+    jobs = None
+    multiplex = True
+    force = False
+    delay = 2.0
+    cache = True
+    report_dir = REPORT_DIR
+    prometheus = None
+    log_dir = LOG_DIR
+    resume = False
+    timeout = None
+    retries = None
+    mirrors = True
 
     # set up argument parsing
     parser = argparse.ArgumentParser(description="Updates the given git "
@@ -639,6 +6737,64 @@ if __name__ == '__main__':
             const=push, help="commit and push changes in projects")
     parser.add_argument("-r", "--resolve", dest="mode", action="store_const",
             const=resolve, help="resolve conflicts in projects")
+    parser.add_argument("-s", "--status", dest="mode", action="store_const",
+            const=status, help="print whether paths in projects have "
+            "uncommitted changes, how far they're ahead of and behind their "
+            "remotes, and when they were last synchronized, without changing "
+            "anything")
+    parser.add_argument("--maintain", dest="mode", action="store_const",
+            const=maintain, help="repack and prune the git repositories in "
+            "projects and write their commit-graphs, unless they were "
+            "maintained in the last %g days" % (GitSync.maintain_interval /
+                86400))
+    parser.add_argument("-w", "--watch", dest="mode", action="store_const",
+            const=watch, help="keep running, and push paths in projects "
+            "shortly after they change")
+    parser.add_argument("--delay", metavar="SECONDS", type=float,
+            default=delay, help="seconds without changes to wait for before "
+            "pushing in watch mode. Defaults to %g." % (delay))
+    parser.add_argument("-j", "--jobs", metavar="N", type=int, default=jobs,
+            help="number of paths to synchronize concurrently. Defaults to 1, "
+            "%d for --status, or %d for --maintain." % (Seelie.status_jobs,
+                Seelie.maintain_jobs))
+    parser.add_argument("--no-multiplex", dest="multiplex",
+            action="store_false", default=multiplex,
+            help="don't share ssh master connections between paths on the "
+            "same host")
+    parser.add_argument("--no-mirrors", dest="mirrors", action="store_false",
+            default=mirrors, help="pull every git working copy from its "
+            "remote instead of from a local mirror of the remote in '%s'"
+            % (MIRROR_DIR))
+    parser.add_argument("--resume", action="store_true", default=resume,
+            help="only synchronize the paths that failed or didn't finish "
+            "in the last run of the same config and mode")
+    parser.add_argument("--timeout", metavar="SECONDS", type=float,
+            default=timeout, help="seconds each path may take before its "
+            "commands are killed, unless the path sets a timeout attribute. "
+            "By default there's no limit.")
+    parser.add_argument("--retries", metavar="N", type=int, default=retries,
+            help="times to try a path again after a network failure or "
+            "timeout, unless the path sets a retries attribute. Defaults to "
+            "%d." % (Sync.retries))
+    parser.add_argument("-f", "--force", action="store_true", default=force,
+            help="push paths even if nothing changed since their last push, "
+            "or maintain them even if they were maintained recently")
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+            default=cache, help="parse the config file even if it's cached")
+    parser.add_argument("--report-dir", metavar="DIR", default=report_dir,
+            help="directory for the JSON reports with the metrics of each "
+            "run. Default is '%s'" % (report_dir))
+    parser.add_argument("--no-report", dest="report_dir",
+            action="store_const", const=None,
+            help="don't write a JSON report of the run")
+    parser.add_argument("--log-dir", metavar="DIR", default=log_dir,
+            help="directory for the logs of the output of each run. Default "
+            "is '%s'" % (log_dir))
+    parser.add_argument("--no-log", dest="log_dir", action="store_const",
+            const=None, help="don't log the output of the run")
+    parser.add_argument("--prometheus", metavar="FILE", default=prometheus,
+            help="also write the metrics of the run to FILE for the "
+            "Prometheus textfile collector")
     parser.add_argument("-v", "--verbose", dest="verbose", action="count",
             default=verbose, help="increments the verbosity level. At level 1,"
             " status messages are printed. At level 2, some shell output is "
@@ -652,23 +6808,47 @@ if __name__ == '__main__':
     config_file = os.path.expanduser(args.config[0])
     mode = args.mode
     verbose = args.verbose
+    jobs = args.jobs
+    if(jobs is None and not mode in (status, maintain)):
+        jobs = 1
+    multiplex = args.multiplex
+    force = args.force
+    delay = args.delay
+    cache = args.cache
+    report_dir = args.report_dir
+    prometheus = args.prometheus
+    log_dir = args.log_dir
+    resume = args.resume
+    timeout = args.timeout
+    retries = args.retries
+    mirrors = args.mirrors
 
     # read the configuration XML file
-    tree = etree.parse(config_file)
-    seelie = Seelie(tree, verbose=verbose)
+    seelie = Seelie.from_file(config_file, verbose=verbose,
+            cache_dir=(CACHE_DIR if cache else None), multiplex=multiplex,
+            report_dir=report_dir, prometheus_file=prometheus,
+            log_dir=log_dir, timeout=timeout, retries=retries,
+            mirror_dir=(MIRROR_DIR if mirrors else None))
 
     # run the action
-    if(mode == update):
-        # update
-        seelie.update(projects, verbose=verbose, merge=False)
-    elif(mode == merge):
-        # update
-        seelie.update(projects, verbose=verbose, merge=True)
-    elif(mode == push):
-        # push
-        seelie.push(projects, verbose=verbose)
-    elif(mode == resolve):
-        # resolve
-        seelie.resolve(projects, verbose=verbose)
+    if(mode == watch):
+        # watch
+        seelie.watch(projects, verbose=verbose, jobs=jobs, delay=delay)
+    elif(mode in (update, merge, push, resolve, status, maintain)):
+        options = {'resume': resume}
+        if(mode in (update, merge)):
+            options['merge'] = (mode == merge)
+            mode = update
+        elif(mode in (push, maintain)):
+            options['force'] = force
+        if(jobs is None):
+            jobs = Seelie.status_jobs if(mode == status) else \
+                    Seelie.maintain_jobs
+        # print each path as it finishes, except in status runs, which
+        # print a table of all paths at the end
+        for result in seelie.results(mode, projects, verbose, jobs,
+                **options):
+            if(verbose and (mode != status or verbose > 1)):
+                result.show()
     else:
         ValueError("unknown mode: '%s'" % (mode))
@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import seelie
+
+
+def git(cwd, *args):
+    """
+    Runs git in cwd and returns its output, without the trailing newline.
+    """
+    return subprocess.run(('git',) + args, cwd=cwd, check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True).stdout.rstrip('\n')
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path, monkeypatch):
+    """
+    Keeps git and the default seelie directories out of the real home.
+    """
+    home = tmp_path / 'home'
+    home.mkdir()
+    monkeypatch.setenv('HOME', str(home))
+    monkeypatch.setenv('GIT_AUTHOR_NAME', 'seelie')
+    monkeypatch.setenv('GIT_AUTHOR_EMAIL', 'seelie@example.com')
+    monkeypatch.setenv('GIT_COMMITTER_NAME', 'seelie')
+    monkeypatch.setenv('GIT_COMMITTER_EMAIL', 'seelie@example.com')
+    (home / '.gitconfig').write_text('[init]\n\tdefaultBranch = master\n')
+    seelie.INSPECTOR.clear()
+    return home
+
+
+@pytest.fixture
+def repos(tmp_path):
+    """
+    Returns a function that makes a bare repository, to stand in for a
+    remote, and a clone of it with one pushed commit, and returns the path
+    of the clone.
+    """
+    def make(name):
+        bare = tmp_path / 'remotes' / ('%s.git' % (name))
+        clone = tmp_path / 'work' / name
+        bare.parent.mkdir(exist_ok=True)
+        clone.parent.mkdir(exist_ok=True)
+        git(tmp_path, 'init', '-q', '--bare', str(bare))
+        git(tmp_path, 'clone', '-q', str(bare), str(clone))
+        (clone / 'file').write_text('%s\n' % (name))
+        git(clone, 'add', 'file')
+        git(clone, 'commit', '-q', '-m', 'initial')
+        git(clone, 'push', '-q', 'origin', 'master')
+        return clone
+    return make
+
+
+@pytest.fixture
+def config(tmp_path):
+    """
+    Returns a function that writes a seelie config with the given projects,
+    each a tuple of its name, its list of paths, and its attributes, and
+    returns the filename.
+    """
+    def write(projects, filename='config.xml'):
+        lines = ['<seelie>']
+        for name, paths, attrib in projects:
+            attrs = ''.join(' %s="%s"' % x for x in sorted(attrib.items()))
+            lines.append('<project%s><name>%s</name>' % (attrs, name))
+            lines.extend('<path tool="git">%s</path>' % (x) for x in paths)
+            lines.append('</project>')
+        lines.append('</seelie>')
+        path = tmp_path / filename
+        path.write_text('\n'.join(lines) + '\n')
+        return str(path)
+    return write
+
+
+@pytest.fixture
+def make_seelie(tmp_path):
+    """
+    Returns a function that loads a config into a Seelie object that keeps
+    its state and journals under tmp_path, and no reports, logs or mirrors.
+    """
+    def make(filename, **kwargs):
+        settings = dict(cache_dir=None, multiplex=False,
+                state_file=str(tmp_path / 'state.json'), report_dir=None,
+                log_dir=None, journal_dir=str(tmp_path / 'journal'),
+                mirror_dir=None)
+        settings.update(kwargs)
+        return seelie.Seelie.from_file(filename, **settings)
+    return make
+
+
+def run(instance, mode, names=None, jobs=1, **kwargs):
+    """
+    Applies a mode and returns a dict of the paths, without their trailing
+    slashes, to the status of their results, and the list of the paths in
+    the order they finished.
+    """
+    results = list(instance.results(mode, names, jobs=jobs, **kwargs))
+    order = [x.path.rstrip('/') for x in results]
+    return dict(zip(order, [x.status for x in results])), order
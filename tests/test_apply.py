@@ -0,0 +1,39 @@
+import os
+
+from conftest import git, run
+
+import seelie
+
+
+def test_concurrent_push(repos, config, make_seelie, tmp_path):
+    clones = [repos(x) for x in 'abcd']
+    filename = config([(x.name, [x], {}) for x in clones])
+    for clone in clones:
+        (clone / 'new').write_text('new\n')
+    cwd = os.getcwd()
+    statuses, _ = run(make_seelie(filename), 'push', jobs=4)
+    assert statuses == dict((str(x), 'ok') for x in clones)
+    # the tools run in the paths without changing the directory of seelie
+    assert os.getcwd() == cwd
+    for clone in clones:
+        remote = tmp_path / 'remotes' / ('%s.git' % (clone.name))
+        assert git(remote, 'rev-parse', 'master') == git(clone, 'rev-parse',
+                'HEAD')
+
+
+def test_raising_path_fails_alone(repos, config, make_seelie, monkeypatch):
+    clones = [repos(x) for x in 'abc']
+    filename = config([(x.name, [x], {}) for x in clones])
+    sync_path = seelie.Seelie.sync_path
+
+    def broken(self, item, *args, **kwargs):
+        if item.key == str(clones[1]):
+            raise ValueError('broken synchronizer')
+        return sync_path(self, item, *args, **kwargs)
+    monkeypatch.setattr(seelie.Seelie, 'sync_path', broken)
+    results = list(make_seelie(filename).results('update', jobs=3))
+    statuses = dict((x.path.rstrip('/'), x.status) for x in results)
+    assert statuses == {str(clones[0]): 'skipped', str(clones[1]): 'error',
+            str(clones[2]): 'skipped'}
+    failed = [x for x in results if x.status == 'error'][0]
+    assert ('stderr', 'ValueError: broken synchronizer') in failed.output
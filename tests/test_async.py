@@ -0,0 +1,107 @@
+import asyncio
+import os
+
+from conftest import git
+
+import seelie
+
+
+def run_async(instance, mode):
+    """
+    Applies a mode with apply_async and returns a dict of the paths, without
+    their trailing slashes, to their results.
+    """
+    async def collect():
+        return [x async for x in instance.results_async(mode)]
+    return dict((x.path.rstrip('/'), x) for x in asyncio.run(collect()))
+
+
+def test_async_push_and_update(repos, config, make_seelie, tmp_path):
+    a, b = repos('a'), repos('b')
+    filename = config([('a', [a], {}), ('b', [b], {})])
+    (a / 'file').write_text('changed\n' * 100)
+    results = run_async(make_seelie(filename), 'push')
+    assert results[str(a)].status == 'ok'
+    assert results[str(a)].metrics.objects > 0
+    assert results[str(b)].status == 'skipped'
+    remote = tmp_path / 'remotes' / 'a.git'
+    assert git(remote, 'rev-parse', 'master') == git(a, 'rev-parse', 'HEAD')
+    # a commit pushed from elsewhere is pulled
+    other = tmp_path / 'other'
+    git(tmp_path, 'clone', '-q', str(remote), str(other))
+    (other / 'file').write_text('from elsewhere\n')
+    git(other, 'commit', '-q', '-a', '-m', 'elsewhere')
+    git(other, 'push', '-q', 'origin', 'master')
+    results = run_async(make_seelie(filename), 'update')
+    assert results[str(a)].status == 'ok'
+    assert (a / 'file').read_text() == 'from elsewhere\n'
+
+
+def test_async_push_again_after_a_failed_push(repos, config, make_seelie,
+        tmp_path):
+    a = repos('a')
+    filename = config([('a', [a], {})])
+    (a / 'new').write_text('new\n')
+    remote = tmp_path / 'remotes' / 'a.git'
+    os.rename(remote, str(remote) + '.away')
+    assert run_async(make_seelie(filename), 'push')[str(a)].status == 'error'
+    os.rename(str(remote) + '.away', remote)
+    assert run_async(make_seelie(filename), 'push')[str(a)].status == 'ok'
+    assert git(remote, 'rev-parse', 'master') == git(a, 'rev-parse', 'HEAD')
+
+
+def test_async_keeps_after_and_priority(repos, config, make_seelie):
+    a, b, c = repos('a'), repos('b'), repos('c')
+    filename = config([('a', [a], {'after': 'b'}), ('b', [b], {}),
+        ('c', [c], {'priority': '10'})])
+    for clone in (a, b, c):
+        (clone / 'new').write_text('new\n')
+    instance = make_seelie(filename)
+
+    async def collect():
+        return [x async for x in instance.results_async('push', jobs=1)]
+    results = asyncio.run(collect())
+    assert [x.path.rstrip('/') for x in results] == [str(c), str(b), str(a)]
+    assert set(x.status for x in results) == {'ok'}
+
+
+def test_async_raising_path_fails_alone(repos, config, make_seelie,
+        monkeypatch):
+    clones = [repos(x) for x in 'abc']
+    filename = config([(x.name, [x], {}) for x in clones])
+    sync_path_async = seelie.Seelie.sync_path_async
+
+    async def broken(self, item, *args, **kwargs):
+        if item.key == str(clones[1]):
+            raise ValueError('broken synchronizer')
+        return await sync_path_async(self, item, *args, **kwargs)
+    monkeypatch.setattr(seelie.Seelie, 'sync_path_async', broken)
+    results = run_async(make_seelie(filename), 'update')
+    assert dict((k, v.status) for k, v in results.items()) == {
+            str(clones[0]): 'skipped', str(clones[1]): 'error',
+            str(clones[2]): 'skipped'}
+    assert ('stderr', 'ValueError: broken synchronizer') in results[
+            str(clones[1])].output
+
+
+def test_async_batches_rsync_paths(tmp_path, make_seelie, monkeypatch):
+    paths = []
+    for name in ('x', 'y'):
+        (tmp_path / 'work' / name).mkdir(parents=True)
+        paths.append('<path tool="rsync" origin="h:dir/%s/">%s/</path>'
+                % (name, tmp_path / 'work' / name))
+    filename = tmp_path / 'config.xml'
+    filename.write_text('<seelie><project><name>p</name>%s</project>'
+            '</seelie>\n' % (''.join(paths)))
+    commands = []
+
+    def call(args, *rest, **kwargs):
+        commands.append(args)
+        return False
+    monkeypatch.setattr(seelie, 'call', call)
+    results = run_async(make_seelie(str(filename)), 'update')
+    assert set(x.status for x in results.values()) == {'ok'}
+    # one rsync for both paths
+    assert len(commands) == 1
+    assert commands[0][-3:] == ('h:dir/./x/', 'h:dir/./y/',
+            '%s/' % (tmp_path / 'work'))
@@ -0,0 +1,98 @@
+import io
+import os
+
+import seelie
+
+
+def write(path, *elements):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('<seelie>%s</seelie>\n' % (''.join(elements)))
+    return str(path)
+
+
+def project(name, path=None, **attrib):
+    attrs = ''.join(' %s="%s"' % x for x in sorted(attrib.items()))
+    inner = '' if path is None else '<path tool="git">%s</path>' % (path)
+    return '<project%s><name>%s</name>%s</project>' % (attrs, name, inner)
+
+
+def include(name):
+    return '<include>%s</include>' % (name)
+
+
+def shards(tmp_path):
+    """
+    Writes a config including a shard, which includes another shard and the
+    config again, and returns the filenames.
+    """
+    root = write(tmp_path / 'root.xml', project('root'),
+            include('shards/one.xml'))
+    one = write(tmp_path / 'shards' / 'one.xml', project('a', auto='false'),
+            include('two.xml'), include('../root.xml'))
+    two = write(tmp_path / 'shards' / 'two.xml', project('b'),
+            project('c', auto='false'))
+    return root, one, two
+
+
+def test_includes_are_followed_once(tmp_path):
+    root, one, two = shards(tmp_path)
+    index = seelie.ConfigIndex(root, cache_dir=None).load()
+    assert [x[0] for x in index.files] == [root, one, two]
+    assert index.shards == {'root': root, 'a': one, 'b': two, 'c': two}
+    assert index.auto == [root, two]
+
+
+def test_index_is_cached_until_a_file_changes(tmp_path):
+    root, one, two = shards(tmp_path)
+    cache_dir = str(tmp_path / 'cache')
+    seelie.ConfigIndex(root, cache_dir).load()
+    assert [x for x in os.listdir(cache_dir) if x.startswith('index-')]
+    # a cached index doesn't read the files
+    reads = []
+    scan = seelie.ConfigIndex.scan
+    seelie.ConfigIndex.scan = lambda self: (reads.append(1), scan(self))
+    try:
+        index = seelie.ConfigIndex(root, cache_dir).load()
+        assert reads == [] and index.shards['c'] == two
+        write(tmp_path / 'shards' / 'two.xml', project('b'),
+                project('d', auto='false'), '<!-- longer -->')
+        index = seelie.ConfigIndex(root, cache_dir).load()
+        assert reads == [1]
+        assert 'd' in index.shards and not 'c' in index.shards
+    finally:
+        seelie.ConfigIndex.scan = scan
+
+
+def test_shards_are_parsed_once_needed(tmp_path, repos):
+    a = repos('a')
+    root = write(tmp_path / 'root.xml', project('root', reference='x'),
+            '<project><name>top</name><reference>a</reference></project>',
+            include('shards/one.xml'))
+    write(tmp_path / 'shards' / 'one.xml', project('a', a, auto='false'),
+            include('two.xml'))
+    write(tmp_path / 'shards' / 'two.xml', project('b'))
+    instance = seelie.Seelie.from_file(root, cache_dir=None,
+            multiplex=False, state_file=None, report_dir=None, log_dir=None,
+            journal_dir=None, mirror_dir=None)
+    assert sorted(instance.names) == ['root', 'top']
+    instance.require(['top'])
+    assert sorted(instance.names) == ['a', 'root', 'top']
+    instance.require()
+    assert sorted(instance.names) == ['a', 'b', 'root', 'top']
+
+
+def test_after_names_of_shards_are_not_unknown(tmp_path, monkeypatch):
+    root = write(tmp_path / 'root.xml', project('root', after='b'),
+            project('other', after='nowhere'), include('one.xml'))
+    write(tmp_path / 'one.xml', project('b'))
+    out = io.StringIO()
+    report = seelie.ProjectGraph.report
+    monkeypatch.setattr(seelie.ProjectGraph, 'report',
+            lambda self, projects, file=None, **kwargs: report(self, projects,
+                out, **kwargs))
+    seelie.Seelie.from_file(root, verbose=True, cache_dir=None,
+            multiplex=False, state_file=None, report_dir=None, log_dir=None,
+            journal_dir=None, mirror_dir=None)
+    err = out.getvalue()
+    assert not "'b'" in err
+    assert "Unknown project 'nowhere'" in err
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import seelie
+
+
+def write_config(tmp_path, host, count):
+    """
+    Writes a config with a host and count rsync paths synchronized with it,
+    and returns the filename.
+    """
+    paths = []
+    for i in range(count):
+        (tmp_path / 'work' / str(i)).mkdir(parents=True)
+        paths.append('<path tool="rsync" origin="h:dir%d/">%s</path>'
+                % (i, tmp_path / 'work' / str(i)))
+    filename = tmp_path / 'config.xml'
+    filename.write_text('<seelie>%s<project><name>p</name>%s</project>'
+            '</seelie>\n' % (host, ''.join(paths)))
+    return str(filename)
+
+
+def transfers(monkeypatch):
+    """
+    Replaces the commands seelie runs with a stand-in that takes a while,
+    and returns the list of the bandwidth limits of the rsyncs it ran and
+    the most of them that ran at once.
+    """
+    lock = threading.Lock()
+    seen = {'limits': [], 'running': 0, 'most': 0}
+
+    def call(args, *rest, **kwargs):
+        with lock:
+            seen['running'] += 1
+            seen['most'] = max(seen['most'], seen['running'])
+            seen['limits'].extend(int(x.split('=')[1]) for x in args
+                    if x.startswith('--bwlimit='))
+        time.sleep(0.05)
+        with lock:
+            seen['running'] -= 1
+        return False
+    monkeypatch.setattr(seelie, 'call', call)
+    return seen
+
+
+def test_host_jobs_and_bandwidth_are_kept(tmp_path, make_seelie,
+        monkeypatch):
+    filename = write_config(tmp_path,
+            '<host name="h" jobs="2" bandwidth="8192"/>', 6)
+    seen = transfers(monkeypatch)
+    statuses = set(x.status for x in
+            make_seelie(filename).results('update', jobs=4))
+    assert statuses == {'ok'}
+    assert seen['most'] == 2
+    # each of the two slots gets half of the 8 KiB per second
+    assert seen['limits'] == [4] * 6
+
+
+def test_bandwidth_is_split_between_the_jobs_of_a_run(tmp_path,
+        make_seelie, monkeypatch):
+    filename = write_config(tmp_path, '<host name="h" bandwidth="8192"/>', 4)
+    seen = transfers(monkeypatch)
+    list(make_seelie(filename).results('update', jobs=4))
+    assert len(seen['limits']) == 4
+    assert seen['most'] * max(seen['limits']) <= 8
+    # one path at a time has the whole budget
+    seen['limits'][:] = []
+    list(make_seelie(filename).results('update', jobs=1))
+    assert seen['limits'] == [8] * 4
+
+
+def test_shares_never_exceed_the_budget(tmp_path, make_seelie):
+    filename = write_config(tmp_path,
+            '<host name="h" jobs="3" bandwidth="3000"/>', 4)
+    instance = make_seelie(filename)
+    sync = instance.sync['rsync']
+    item = instance.projects[0].items[0]
+    for jobs, share in ((1, 3000), (2, 1500), (3, 1000), (8, 1000)):
+        instance.begin('update', jobs=jobs)
+        shares = [instance.start_transfer([item], sync) for _ in range(8)]
+        assert shares == [share] * 8
+        assert share * min(jobs, 3) <= 3000
@@ -0,0 +1,143 @@
+import os
+import time
+
+import pytest
+
+from conftest import git
+
+import seelie
+
+
+@pytest.fixture
+def clone(repos):
+    """
+    A clone whose files were written well before its index, so that none of
+    them are racy.
+    """
+    clone = repos('a')
+    (clone / 'dir').mkdir()
+    (clone / 'dir' / 'nested').write_text('nested\n')
+    git(clone, 'add', '--all')
+    git(clone, 'commit', '-q', '-m', 'nested')
+    settle(clone)
+    return clone
+
+
+def settle(clone):
+    """
+    Moves the files of a clone back in time and refreshes its index.
+    """
+    past = int(time.time()) - 60
+    for name in ('file', 'dir/nested'):
+        if (clone / name).exists():
+            os.utime(clone / name, (past, past))
+    git(clone, 'update-index', '--refresh')
+    seelie.INSPECTOR.clear()
+
+
+def test_clean_tree(clone):
+    assert git(clone, 'status', '--porcelain') == ''
+    assert seelie.INSPECTOR.clean(str(clone)) is True
+
+
+@pytest.mark.parametrize('change', ['modified', 'untracked', 'removed',
+    'untracked_dir'])
+def test_changed_tree_is_never_clean(clone, change):
+    if(change == 'modified'):
+        (clone / 'file').write_text('changed and longer\n')
+    elif(change == 'untracked'):
+        (clone / 'other').write_text('other\n')
+    elif(change == 'removed'):
+        (clone / 'dir' / 'nested').unlink()
+    else:
+        (clone / 'new').mkdir()
+        (clone / 'new' / 'inner').write_text('inner\n')
+    assert git(clone, 'status', '--porcelain') != ''
+    assert seelie.INSPECTOR.clean(str(clone)) is not True
+    if(change == 'removed'):
+        assert seelie.INSPECTOR.clean(str(clone)) is False
+
+
+def test_staged_changes_match_the_index(clone):
+    (clone / 'file').write_text('staged\n')
+    git(clone, 'add', 'file')
+    settle(clone)
+    assert git(clone, 'status', '--porcelain') == 'M  file'
+    # the working tree matches the index, which no longer matches HEAD
+    assert seelie.INSPECTOR.clean(str(clone)) is True
+
+
+def test_staged_changes_are_not_settled(clone, config, make_seelie,
+        tmp_path):
+    filename = config([('a', [clone], {})])
+    path = os.path.join(str(clone), '')
+    instance = make_seelie(filename)
+    assert list(instance.results('push'))[0].status == 'ok'
+    # the index the push left is known to match HEAD
+    assert instance.sync['git'].settled(path, 'push')
+    (clone / 'file').write_text('staged\n')
+    git(clone, 'add', 'file')
+    settle(clone)
+    assert seelie.INSPECTOR.clean(str(clone)) is True
+    instance = make_seelie(filename)
+    assert not instance.sync['git'].settled(path, 'push')
+    assert list(instance.results('push'))[0].status == 'ok'
+    assert git(clone, 'status', '--porcelain') == ''
+    assert git(tmp_path / 'remotes' / 'a.git', 'rev-parse', 'master') == (
+            git(clone, 'rev-parse', 'HEAD'))
+
+
+def test_racy_files_are_uncertain(repos):
+    clone = repos('a')
+    os.utime(clone / 'file')
+    git(clone, 'update-index', '--refresh')
+    seelie.INSPECTOR.clear()
+    assert seelie.INSPECTOR.clean(str(clone)) is None
+
+
+def test_heads_match_rev_parse(clone):
+    for ref, rev in (('HEAD', 'HEAD'), ('refs/heads/master', 'master'),
+            ('refs/remotes/origin/master', 'origin/master')):
+        assert seelie.INSPECTOR.resolve(str(clone), ref) == git(clone,
+                'rev-parse', rev)
+    assert seelie.INSPECTOR.resolve(str(clone), 'refs/heads/none') is None
+
+
+def test_heads_after_commits_and_packing(clone):
+    (clone / 'file').write_text('second\n')
+    git(clone, 'commit', '-q', '-a', '-m', 'second')
+    assert seelie.INSPECTOR.resolve(str(clone)) == git(clone, 'rev-parse',
+            'HEAD')
+    assert seelie.INSPECTOR.resolve(str(clone),
+            'refs/remotes/origin/master') != git(clone, 'rev-parse', 'HEAD')
+    git(clone, 'pack-refs', '--all')
+    assert not (clone / '.git' / 'refs' / 'heads' / 'master').exists()
+    for ref, rev in (('HEAD', 'HEAD'), ('refs/remotes/origin/master',
+            'origin/master')):
+        assert seelie.INSPECTOR.resolve(str(clone), ref) == git(clone,
+                'rev-parse', rev)
+
+
+def test_detached_head_and_worktrees(clone, tmp_path):
+    first = git(clone, 'rev-parse', 'HEAD~1')
+    git(clone, 'checkout', '-q', first)
+    assert seelie.INSPECTOR.resolve(str(clone)) == first
+    git(clone, 'checkout', '-q', 'master')
+    worktree = tmp_path / 'worktree'
+    git(clone, 'worktree', 'add', '-q', '-b', 'side', str(worktree))
+    assert seelie.INSPECTOR.resolve(str(worktree)) == git(worktree,
+            'rev-parse', 'HEAD')
+    assert seelie.INSPECTOR.resolve(str(worktree), 'refs/heads/master') == (
+            git(clone, 'rev-parse', 'master'))
+
+
+def test_remote_url_matches_git(clone, monkeypatch):
+    assert seelie.INSPECTOR.remote_url(str(clone), 'origin') == git(clone,
+            'remote', 'get-url', 'origin')
+    git(clone, 'remote', 'set-url', '--push', 'origin', '/elsewhere')
+    seelie.INSPECTOR.clear()
+    assert seelie.INSPECTOR.remote_url(str(clone), 'origin', push=True) == (
+            '/elsewhere')
+    # configs given in the environment aren't read here
+    monkeypatch.setenv('GIT_CONFIG_GLOBAL', '/elsewhere')
+    assert seelie.INSPECTOR.remote_url(str(clone), 'origin') is None
@@ -0,0 +1,63 @@
+import os
+
+from conftest import run
+
+import seelie
+
+
+def test_resume_skips_paths_that_finished(repos, config, make_seelie,
+        tmp_path):
+    a, b = repos('a'), repos('b')
+    filename = config([('a', [a], {}), ('b', [b], {})])
+    for clone in (a, b):
+        (clone / 'new').write_text('new\n')
+    # the push of b fails while its remote is away
+    remote = tmp_path / 'remotes' / 'b.git'
+    os.rename(remote, str(remote) + '.away')
+    statuses, _ = run(make_seelie(filename), 'push')
+    assert statuses == {str(a): 'ok', str(b): 'error'}
+    os.rename(str(remote) + '.away', remote)
+    statuses, _ = run(make_seelie(filename), 'push', resume=True)
+    assert statuses == {str(b): 'ok'}
+    # a finished run leaves nothing to resume but what finished in it
+    statuses, _ = run(make_seelie(filename), 'push', resume=True)
+    assert statuses == {}
+
+
+def test_new_run_starts_a_new_journal(repos, config, make_seelie):
+    a = repos('a')
+    filename = config([('a', [a], {})])
+    run(make_seelie(filename), 'push')
+    statuses, _ = run(make_seelie(filename), 'push')
+    assert list(statuses) == [str(a)]
+    statuses, _ = run(make_seelie(filename), 'push', resume=True)
+    assert statuses == {}
+
+
+def test_journal_of_another_config_or_mode_is_not_resumed(tmp_path):
+    filename = str(tmp_path / 'journal.jsonl')
+    journal = seelie.SeelieJournal(filename, 'config', 'push')
+    journal.add('/a', False)
+    journal.close()
+    journal = seelie.SeelieJournal(filename, 'other', 'push', resume=True)
+    assert not journal.resumed and journal.done == set()
+    journal.close()
+    journal = seelie.SeelieJournal(filename, 'other', 'update', resume=True)
+    assert not journal.resumed
+    journal.close()
+
+
+def test_journal_cut_short_by_a_crash(tmp_path):
+    filename = str(tmp_path / 'journal.jsonl')
+    journal = seelie.SeelieJournal(filename, 'config', 'push')
+    journal.add('/a', False)
+    journal.add('/b', True)
+    journal.add('/c', False)
+    journal.add('/c', True)
+    journal.close()
+    with open(filename, 'a') as f:
+        f.write('{"path": "/d", "err')
+    journal = seelie.SeelieJournal(filename, 'config', 'push', resume=True)
+    assert journal.resumed
+    assert journal.done == {'/a'}
+    journal.close()
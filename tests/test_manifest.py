@@ -0,0 +1,98 @@
+import os
+
+from conftest import run
+
+import seelie
+
+
+def tree(root):
+    (root / 'dir').mkdir(parents=True)
+    (root / 'keep').write_text('keep\n')
+    (root / 'change').write_text('change\n')
+    (root / 'dir' / 'gone').write_text('gone\n')
+
+
+def touch(path, offset=10):
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + offset * 10 ** 9))
+
+
+def test_changes_since_the_last_transfer(tmp_path):
+    root = tmp_path / 'root'
+    tree(root)
+    manifest = seelie.RSyncManifest.open('%s/' % (root),
+            str(tmp_path / 'manifests'))
+    entries, delta = manifest.changes()
+    assert delta is None
+    assert sorted(entries) == ['change', 'dir', 'dir/gone', 'keep']
+    manifest.save(entries)
+    assert manifest.changes()[1] == ([], [])
+    (root / 'change').write_text('changed\n')
+    (root / 'dir' / 'gone').unlink()
+    (root / 'new').mkdir()
+    assert manifest.changes()[1] == (['change', 'new'], ['dir/gone'])
+    # force sends everything
+    assert manifest.changes(force=True)[1] is None
+
+
+def test_touched_files_are_unchanged_with_checksums(tmp_path):
+    root = tmp_path / 'root'
+    tree(root)
+    manifest = seelie.RSyncManifest.open('%s/' % (root),
+            str(tmp_path / 'manifests'))
+    manifest.save(manifest.changes()[0])
+    touch(root / 'keep')
+    assert manifest.changes()[1] == (['keep'], [])
+    # the contents of a file are only known once it's hashed, after the
+    # first time it's touched
+    entries, delta = manifest.changes(checksum=True)
+    assert delta == (['keep'], [])
+    manifest.save(entries)
+    touch(root / 'keep')
+    assert manifest.changes()[1] == (['keep'], [])
+    assert manifest.changes(checksum=True)[1] == ([], [])
+    (root / 'keep').write_text('KEEP\n')
+    touch(root / 'keep', 20)
+    assert manifest.changes(checksum=True)[1] == (['keep'], [])
+
+
+def test_pushes_send_only_what_changed(tmp_path, make_seelie, monkeypatch):
+    root = tmp_path / 'work' / 'x'
+    tree(root)
+    filename = tmp_path / 'config.xml'
+    filename.write_text('<seelie><project><name>p</name><path tool="rsync" '
+            'origin="h:dir/x/">%s/</path></project></seelie>\n' % (root))
+    commands = []
+
+    def call(args, *rest, **kwargs):
+        # the list of names is removed once rsync is done
+        names = [x.split('=', 1)[1] for x in args
+                if x.startswith('--files-from=')]
+        listed = None
+        if names:
+            with open(names[0], 'rb') as f:
+                listed = f.read().split(b'\0')
+        commands.append((args, listed))
+        return False
+    monkeypatch.setattr(seelie, 'call', call)
+    instance = make_seelie(str(filename),
+            manifest_dir=str(tmp_path / 'manifests'))
+    # without a manifest the whole directory is sent
+    assert run(instance, 'push')[0] == {str(root): 'ok'}
+    assert len(commands) == 1 and commands[0][1] is None
+    assert commands[0][0][-2:] == ('%s/' % (root), 'h:dir/x/')
+    assert run(instance, 'push')[0] == {str(root): 'skipped'}
+    assert len(commands) == 1
+    # changes and deletions are sent by name
+    (root / 'change').write_text('changed\n')
+    (root / 'dir' / 'gone').unlink()
+    assert run(instance, 'push')[0] == {str(root): 'ok'}
+    args, listed = commands[1]
+    assert listed == [b'change', b'dir/gone']
+    assert '--delete-missing-args' in args
+    assert not [x for x in os.listdir(tmp_path / 'manifests')
+            if x.startswith('.')]
+    assert run(instance, 'push')[0] == {str(root): 'skipped'}
+    # force sends everything again
+    assert run(instance, 'push', force=True)[0] == {str(root): 'ok'}
+    assert commands[-1][1] is None
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from conftest import git, run
+
+
+def write_config(tmp_path, paths):
+    """
+    Writes a config with a project of the given paths, each a tuple of its
+    path, its origin and its further attributes, and returns the filename.
+    """
+    lines = []
+    for path, origin, attrib in paths:
+        attrs = ''.join(' %s="%s"' % x for x in sorted(attrib.items()))
+        lines.append('<path tool="git" origin="%s"%s>%s</path>'
+                % (origin, attrs, path))
+    filename = tmp_path / 'config.xml'
+    filename.write_text('<seelie><project><name>p</name>%s</project>'
+            '</seelie>\n' % (''.join(lines)))
+    return str(filename)
+
+
+def alternates(path):
+    filename = path / '.git' / 'objects' / 'info' / 'alternates'
+    return filename.read_text().split() if filename.exists() else []
+
+
+def mirrors(tmp_path):
+    directory = tmp_path / 'mirrors'
+    if not directory.exists():
+        return []
+    return [x for x in os.listdir(directory) if x.endswith('.git')]
+
+
+def remote_commit(tmp_path, name):
+    """
+    Pushes a new commit to the remote of name from another clone.
+    """
+    other = tmp_path / 'other'
+    git(tmp_path, 'clone', '-q', str(tmp_path / 'remotes' / name), str(other))
+    (other / 'file').write_text('from elsewhere\n')
+    git(other, 'commit', '-q', '-a', '-m', 'elsewhere')
+    git(other, 'push', '-q', 'origin', 'master')
+
+
+def test_clones_and_pulls_borrow_from_the_mirror(repos, make_seelie,
+        tmp_path):
+    a = repos('a')
+    url = 'file://%s' % (tmp_path / 'remotes' / 'a.git')
+    git(a, 'remote', 'set-url', 'origin', url)
+    new = tmp_path / 'work' / 'new'
+    filename = write_config(tmp_path, [(a, url, {}), (new, url, {})])
+    remote_commit(tmp_path, 'a.git')
+    instance = make_seelie(filename, mirror_dir=str(tmp_path / 'mirrors'))
+    assert run(instance, 'update')[0] == {str(a): 'ok', str(new): 'ok'}
+    # one mirror for the remote of both working copies
+    names = mirrors(tmp_path)
+    assert len(names) == 1
+    objects = str(tmp_path / 'mirrors' / names[0] / 'objects')
+    assert alternates(a) == [objects]
+    assert alternates(new) == [objects]
+    assert (a / 'file').read_text() == 'from elsewhere\n'
+    assert (new / 'file').read_text() == 'from elsewhere\n'
+
+
+@pytest.mark.parametrize('attrib', [{'depth': '1'},
+    {'single-branch': 'true'}])
+def test_shallow_and_single_branch_paths_skip_the_mirror(repos, make_seelie,
+        tmp_path, attrib):
+    a = repos('a')
+    url = 'file://%s' % (tmp_path / 'remotes' / 'a.git')
+    git(a, 'remote', 'set-url', 'origin', url)
+    new = tmp_path / 'work' / 'new'
+    filename = write_config(tmp_path, [(a, url, attrib), (new, url, attrib)])
+    remote_commit(tmp_path, 'a.git')
+    instance = make_seelie(filename, mirror_dir=str(tmp_path / 'mirrors'))
+    assert run(instance, 'update')[0] == {str(a): 'ok', str(new): 'ok'}
+    assert mirrors(tmp_path) == []
+    assert alternates(a) == [] and alternates(new) == []
+    assert (a / 'file').read_text() == 'from elsewhere\n'
+    assert (new / 'file').read_text() == 'from elsewhere\n'
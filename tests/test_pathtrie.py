@@ -0,0 +1,51 @@
+import os
+
+import seelie
+
+
+def trie(*paths):
+    """
+    Returns a PathTrie of SeeliePath objects for paths, and the objects.
+    """
+    tree = seelie.PathTrie()
+    items = [seelie.SeeliePath(str(x)) for x in paths]
+    for item in items:
+        tree.insert(item)
+    return tree, items
+
+
+def keys(overlaps):
+    return dict((k, [x.key for x in v]) for k, v in overlaps.items())
+
+
+def test_separate_paths_do_not_overlap(tmp_path):
+    tree, _ = trie(tmp_path / 'a', tmp_path / 'b', tmp_path / 'ab')
+    assert tree.overlaps() == {}
+
+
+def test_nested_paths_overlap_in_any_order(tmp_path):
+    inner, outer = tmp_path / 'a' / 'b' / 'c', tmp_path / 'a'
+    middle = tmp_path / 'a' / 'b'
+    tree, _ = trie(inner, outer, middle)
+    assert keys(tree.overlaps()) == {
+            str(middle): [str(outer)],
+            str(inner): [str(outer), str(middle)],
+            }
+
+
+def test_same_path_overlaps_the_paths_added_before(tmp_path):
+    tree, items = trie(tmp_path / 'a', tmp_path / 'a' / '.', tmp_path / 'a')
+    overlaps = tree.overlaps()
+    assert list(overlaps) == [str(tmp_path / 'a')]
+    assert tree.find(items[0]) == items
+
+
+def test_symlinks_are_resolved(tmp_path):
+    (tmp_path / 'real' / 'inner').mkdir(parents=True)
+    os.symlink(tmp_path / 'real', tmp_path / 'link')
+    link = tmp_path / 'link' / 'inner'
+    tree, items = trie(tmp_path / 'real', link)
+    assert keys(tree.overlaps()) == {str(link): [str(tmp_path / 'real')]}
+    inner = seelie.SeeliePath(str(tmp_path / 'real' / 'inner'))
+    assert tree.find(inner) == [items[1]]
+    assert tree.find(seelie.SeeliePath(str(tmp_path / 'missing'))) == []
@@ -0,0 +1,92 @@
+import threading
+
+from conftest import git, run
+
+import seelie
+
+
+def record(monkeypatch):
+    """
+    Records the local work done ahead, the commits, and the ends of the
+    synchronizations of the paths, in the order they happen.
+    """
+    lock = threading.Lock()
+    events = []
+    stage_path = seelie.Seelie.stage_path
+    commit_steps = seelie.GitSync.commit_steps
+    sync_batch = seelie.Seelie.sync_batch
+
+    def note(*event):
+        with lock:
+            events.append(event)
+
+    def staging(self, item, *args, **kwargs):
+        note('stage', item.key)
+        return stage_path(self, item, *args, **kwargs)
+
+    def committing(self, path, *args, **kwargs):
+        note('commit', path.rstrip('/'))
+        return commit_steps(self, path, *args, **kwargs)
+
+    def syncing(self, items, *args, **kwargs):
+        try:
+            return sync_batch(self, items, *args, **kwargs)
+        finally:
+            for item in items:
+                note('synced', item.key)
+    monkeypatch.setattr(seelie.Seelie, 'stage_path', staging)
+    monkeypatch.setattr(seelie.GitSync, 'commit_steps', committing)
+    monkeypatch.setattr(seelie.Seelie, 'sync_batch', syncing)
+    return events
+
+
+def test_local_work_is_done_ahead(repos, config, make_seelie, tmp_path,
+        monkeypatch):
+    clones = [repos(x) for x in 'abc']
+    filename = config([(x.name, [x], {}) for x in clones])
+    for clone in clones:
+        (clone / 'new').write_text('new\n')
+    events = record(monkeypatch)
+    statuses, _ = run(make_seelie(filename), 'push', jobs=2)
+    assert statuses == dict((str(x), 'ok') for x in clones)
+    assert set(x[1] for x in events if x[0] == 'stage') == set(
+            str(x) for x in clones)
+    for clone in clones:
+        remote = tmp_path / 'remotes' / ('%s.git' % (clone.name))
+        assert git(remote, 'show', 'master:new') == 'new'
+
+
+def test_paths_that_wait_commit_in_turn(repos, config, make_seelie,
+        tmp_path, monkeypatch):
+    a, b, c = repos('a'), repos('b'), repos('c')
+    filename = config([('a', [a], {'after': 'b'}), ('b', [b], {}),
+        ('c', [c], {})])
+    for clone in (a, b, c):
+        (clone / 'new').write_text('new\n')
+    events = record(monkeypatch)
+    statuses, order = run(make_seelie(filename), 'push', jobs=3)
+    assert statuses == {str(a): 'ok', str(b): 'ok', str(c): 'ok'}
+    assert order.index(str(b)) < order.index(str(a))
+    # a is only committed once b is done
+    assert not ('stage', str(a)) in events
+    assert events.index(('synced', str(b))) < events.index(('commit',
+        str(a)))
+    assert git(tmp_path / 'remotes' / 'a.git', 'show', 'master:new') == 'new'
+
+
+def test_overlapping_paths_commit_in_turn(repos, config, make_seelie,
+        tmp_path, monkeypatch):
+    outer = repos('outer')
+    repos('inner')
+    inner = outer / 'inner'
+    git(outer, 'clone', '-q', str(tmp_path / 'remotes' / 'inner.git'),
+            str(inner))
+    (outer / '.gitignore').write_text('inner/\n')
+    (inner / 'new').write_text('new\n')
+    filename = config([('outer', [outer], {}), ('inner', [inner], {})])
+    events = record(monkeypatch)
+    statuses, _ = run(make_seelie(filename), 'push', jobs=2)
+    assert statuses == {str(outer): 'ok', str(inner): 'ok'}
+    assert not ('stage', str(inner)) in events
+    assert events.index(('synced', str(outer))) < events.index(('commit',
+        str(inner)))
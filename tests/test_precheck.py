@@ -0,0 +1,70 @@
+from conftest import git, run
+
+import seelie
+
+
+def record(monkeypatch):
+    """
+    Records the commands seelie runs with call and check_output, and runs
+    them.
+    """
+    commands = []
+    call = seelie.call
+    check_output = seelie.check_output
+
+    def calling(args, *rest, **kwargs):
+        commands.append(tuple(args))
+        return call(args, *rest, **kwargs)
+
+    def checking(args, *rest, **kwargs):
+        commands.append(tuple(args))
+        return check_output(args, *rest, **kwargs)
+    monkeypatch.setattr(seelie, 'call', calling)
+    monkeypatch.setattr(seelie, 'check_output', checking)
+    return commands
+
+
+def pulls(commands):
+    return [x for x in commands if 'pull' in x]
+
+
+def test_unchanged_remotes_are_not_pulled(repos, config, make_seelie,
+        tmp_path, monkeypatch):
+    a = repos('a')
+    clone = tmp_path / 'work' / 'same'
+    git(tmp_path, 'clone', '-q', str(tmp_path / 'remotes' / 'a.git'),
+            str(clone))
+    filename = config([('a', [a, clone], {})])
+    commands = record(monkeypatch)
+    assert run(make_seelie(filename), 'update')[0] == {str(a): 'skipped',
+            str(clone): 'skipped'}
+    assert pulls(commands) == []
+    # the remote is asked once for both working copies
+    assert len([x for x in commands if 'ls-remote' in x]) == 1
+
+
+def test_local_commits_ahead_are_not_pulled(repos, config, make_seelie,
+        monkeypatch):
+    a = repos('a')
+    (a / 'file').write_text('local\n')
+    git(a, 'commit', '-q', '-a', '-m', 'local')
+    filename = config([('a', [a], {})])
+    commands = record(monkeypatch)
+    assert run(make_seelie(filename), 'update')[0] == {str(a): 'skipped'}
+    assert pulls(commands) == []
+
+
+def test_new_remote_commits_are_pulled(repos, config, make_seelie, tmp_path,
+        monkeypatch):
+    a = repos('a')
+    other = tmp_path / 'other'
+    git(tmp_path, 'clone', '-q', str(tmp_path / 'remotes' / 'a.git'),
+            str(other))
+    (other / 'file').write_text('from elsewhere\n')
+    git(other, 'commit', '-q', '-a', '-m', 'elsewhere')
+    git(other, 'push', '-q', 'origin', 'master')
+    filename = config([('a', [a], {})])
+    commands = record(monkeypatch)
+    assert run(make_seelie(filename), 'update')[0] == {str(a): 'ok'}
+    assert len(pulls(commands)) == 1
+    assert (a / 'file').read_text() == 'from elsewhere\n'
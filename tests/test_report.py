@@ -0,0 +1,44 @@
+import json
+import os
+
+from conftest import run
+
+import seelie
+
+
+def test_runs_are_reported(repos, config, make_seelie, tmp_path):
+    a, b = repos('a'), repos('b')
+    filename = config([('a', [a], {}), ('b', [b], {})])
+    (a / 'new').write_text('new\n')
+    os.rename(tmp_path / 'remotes' / 'b.git', tmp_path / 'b.away')
+    (b / 'new').write_text('new\n')
+    reports = tmp_path / 'reports'
+    prom = tmp_path / 'metrics' / 'seelie.prom'
+    instance = make_seelie(filename, report_dir=str(reports),
+            prometheus_file=str(prom))
+    assert run(instance, 'push')[0] == {str(a): 'ok', str(b): 'error'}
+    names = os.listdir(reports)
+    assert len(names) == 1 and names[0].endswith('-push.json')
+    report = json.loads((reports / names[0]).read_text())
+    assert report['mode'] == 'push'
+    assert report['errors'] == 1 and report['skipped'] == 0
+    paths = dict((x['path'].rstrip('/'), x) for x in report['paths'])
+    assert sorted(paths) == [str(a), str(b)]
+    assert paths[str(a)]['error'] is False
+    assert paths[str(a)]['objects'] > 0
+    assert paths[str(b)]['error'] is True
+    assert paths[str(b)]['exit_status']
+    # the same numbers for the textfile collector
+    lines = prom.read_text().splitlines()
+    labels = 'path="%s/",tool="git",mode="push",host=""'
+    assert 'seelie_path_error{%s} 0' % (labels % (a)) in lines
+    assert 'seelie_path_error{%s} 1' % (labels % (b)) in lines
+    assert 'seelie_run_paths{mode="push"} 2' in lines
+    assert 'seelie_run_errors{mode="push"} 1' in lines
+    assert '# TYPE seelie_run_errors gauge' in lines
+    assert not [x for x in os.listdir(prom.parent) if x.startswith('.')]
+
+
+def test_labels_are_escaped():
+    assert seelie.RunReport.labels((('path', 'a"b\\c\nd'), ('host', None),
+        ('tool', 'git'))) == 'path="a\\"b\\\\c\\nd",tool="git"'
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+
+import pytest
+
+from conftest import git
+
+import seelie
+
+
+def pushed(tmp_path, clones):
+    """
+    Returns the names of the clones whose remote has their HEAD.
+    """
+    return sorted(x.name for x in clones
+            if git(tmp_path / 'remotes' / ('%s.git' % (x.name)), 'rev-parse',
+                'master') == git(x, 'rev-parse', 'HEAD'))
+
+
+def changed(repos, names):
+    clones = [repos(x) for x in names]
+    for clone in clones:
+        (clone / 'file').write_text('changed\n')
+        git(clone, 'commit', '-q', '-a', '-m', 'changed')
+    return clones
+
+
+def test_results_come_as_paths_finish(repos, config, make_seelie,
+        tmp_path):
+    clones = changed(repos, 'abc')
+    filename = config([(x.name, [x], {}) for x in clones])
+    results = make_seelie(filename).results('push')
+    first = next(results)
+    assert first.path.rstrip('/') == str(clones[0])
+    assert first.status == 'ok' and first.mode == 'push'
+    # the run waits for the caller
+    assert pushed(tmp_path, clones) == ['a']
+    assert [x.status for x in results] == ['ok', 'ok']
+    assert pushed(tmp_path, clones) == ['a', 'b', 'c']
+
+
+def test_stopping_early_starts_no_more_paths(repos, config, make_seelie,
+        tmp_path):
+    clones = changed(repos, 'abcd')
+    filename = config([(x.name, [x], {}) for x in clones])
+    results = make_seelie(filename).results('push', jobs=2)
+    next(results)
+    results.close()
+    # the paths already started finish, but no others
+    assert 1 <= len(pushed(tmp_path, clones)) <= 2
+    assert not [x for x in threading.enumerate()
+            if x.name == 'seelie-results']
+
+
+def test_errors_of_the_run_are_raised(repos, config, make_seelie,
+        monkeypatch):
+    a = repos('a')
+    filename = config([('a', [a], {})])
+
+    def broken(self, *args, **kwargs):
+        raise RuntimeError('broken run')
+    monkeypatch.setattr(seelie.Seelie, 'batches', broken)
+    with pytest.raises(RuntimeError, match='broken run'):
+        list(make_seelie(filename).results('push'))
+
+
+def test_stopping_early_cancels_the_async_run(repos, config, make_seelie,
+        tmp_path):
+    clones = changed(repos, 'abc')
+    filename = config([(x.name, [x], {}) for x in clones])
+    instance = make_seelie(filename)
+
+    async def first():
+        results = instance.results_async('push', jobs=1)
+        try:
+            return await results.__anext__()
+        finally:
+            await results.aclose()
+    result = asyncio.run(first())
+    assert result.path.rstrip('/') == str(clones[0])
+    assert len(pushed(tmp_path, clones)) < 3
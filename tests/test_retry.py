@@ -0,0 +1,119 @@
+import os
+import subprocess
+import time
+
+import pytest
+
+from conftest import git, run
+
+import seelie
+
+
+@pytest.fixture
+def instance(repos, config, make_seelie, monkeypatch):
+    """
+    A Seelie object that waits next to nothing between retries.
+    """
+    monkeypatch.setattr(seelie.Seelie, 'retry_base_delay', 0.01)
+    return make_seelie(config([('a', [repos('a')], {})]))
+
+
+def gone(pid, timeout=5.0):
+    """
+    Returns True once the process pid is gone, or False after timeout
+    seconds.
+    """
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_watchdog_kills_the_process_group(tmp_path):
+    pidfile = tmp_path / 'pid'
+    token = seelie.CURRENT_DEADLINE.set((time.monotonic() + 0.5, 0.5))
+    start = time.monotonic()
+    try:
+        with pytest.raises(subprocess.TimeoutExpired):
+            seelie.call(('sh', '-c', 'sleep 30 & echo $! > %s; wait' % (
+                pidfile)))
+    finally:
+        seelie.CURRENT_DEADLINE.reset(token)
+    assert time.monotonic() - start < 10
+    # what the command started goes with it
+    assert gone(int(pidfile.read_text()))
+
+
+def test_passed_deadline_starts_nothing(tmp_path):
+    token = seelie.CURRENT_DEADLINE.set((time.monotonic() - 1, 1))
+    try:
+        with pytest.raises(subprocess.TimeoutExpired):
+            seelie.call(('touch', str(tmp_path / 'ran')))
+    finally:
+        seelie.CURRENT_DEADLINE.reset(token)
+    assert not (tmp_path / 'ran').exists()
+
+
+def test_timed_out_attempts_are_retried(instance):
+    metrics = seelie.PathMetrics('/a')
+    tries = []
+
+    def attempt():
+        tries.append(1)
+        return seelie.call(('sleep', '30'))
+    start = time.monotonic()
+    assert instance.retry(metrics, (0.3, 2), attempt) is True
+    assert time.monotonic() - start < 10
+    assert len(tries) == 3
+    assert metrics.timeouts == 3 and metrics.retries == 2
+
+
+def test_transient_failures_are_retried(instance, tmp_path):
+    marker = tmp_path / 'failed'
+    script = ('if [ ! -e %s ]; then touch %s; '
+            'echo "ssh: connect to host x: Connection refused" >&2; '
+            'exit 255; fi' % (marker, marker))
+    metrics = seelie.PathMetrics('/a')
+    token = seelie.CURRENT_METRICS.set(metrics)
+    output = seelie.CURRENT_OUTPUT.set(seelie.PathOutput(None))
+    try:
+        error = instance.retry(metrics, (None, 2), lambda: seelie.call(
+            ('sh', '-c', script), transient=seelie.Sync.transient))
+    finally:
+        seelie.CURRENT_METRICS.reset(token)
+        seelie.CURRENT_OUTPUT.reset(output)
+    assert error == 0
+    assert metrics.retries == 1 and metrics.timeouts == 0
+
+
+def test_lasting_failures_are_not_retried(instance):
+    metrics = seelie.PathMetrics('/a')
+    tries = []
+
+    def attempt():
+        tries.append(1)
+        return seelie.call(('false',))
+    assert instance.retry(metrics, (None, 2), attempt)
+    assert len(tries) == 1
+
+
+def test_failed_push_is_pushed_again(repos, config, make_seelie, tmp_path):
+    a = repos('a')
+    filename = config([('a', [a], {})])
+    (a / 'new').write_text('new\n')
+    remote = tmp_path / 'remotes' / 'a.git'
+    os.rename(remote, str(remote) + '.away')
+    statuses, _ = run(make_seelie(filename), 'push')
+    assert statuses == {str(a): 'error'}
+    os.rename(str(remote) + '.away', remote)
+    # the commit is already made, and the tree is clean
+    assert git(a, 'status', '--porcelain') == ''
+    statuses, _ = run(make_seelie(filename), 'push')
+    assert statuses == {str(a): 'ok'}
+    assert git(a, 'rev-parse', 'HEAD') == git(remote, 'rev-parse', 'master')
+    statuses, _ = run(make_seelie(filename), 'push')
+    assert statuses == {str(a): 'skipped'}
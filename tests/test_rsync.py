@@ -0,0 +1,93 @@
+from conftest import run
+
+import seelie
+
+
+def write_config(tmp_path, names, origins=None):
+    """
+    Writes a config with an rsync path in tmp_path/work for each name, whose
+    origins are the directories of the same names on a host unless given,
+    and returns the filename.
+    """
+    origins = origins or ['h:dir/%s/' % (x) for x in names]
+    paths = []
+    for name, origin in zip(names, origins):
+        (tmp_path / 'work' / name).mkdir(parents=True)
+        paths.append('<path tool="rsync" origin="%s">%s/</path>'
+                % (origin, tmp_path / 'work' / name))
+    filename = tmp_path / 'config.xml'
+    filename.write_text('<seelie><project><name>p</name>%s</project>'
+            '</seelie>\n' % (''.join(paths)))
+    return str(filename)
+
+
+def record(monkeypatch, failing=()):
+    """
+    Replaces the commands seelie runs with a stand-in that records them, and
+    fails for those with more than one source or whose source is one of
+    the remote directories in failing.
+    """
+    commands = []
+
+    def call(args, *rest, **kwargs):
+        commands.append(args)
+        srcs = [x for x in args if x.startswith('h:')]
+        return len(srcs) > 1 or srcs[0] in failing
+    monkeypatch.setattr(seelie, 'call', call)
+    return commands
+
+
+def sources(commands):
+    return [[x for x in args if x.startswith('h:')] for args in commands]
+
+
+def test_paths_are_transferred_together(tmp_path, make_seelie, monkeypatch):
+    filename = write_config(tmp_path, ['x', 'y', 'z'])
+    commands = []
+
+    def call(args, *rest, **kwargs):
+        commands.append(args)
+        return False
+    monkeypatch.setattr(seelie, 'call', call)
+    statuses, _ = run(make_seelie(filename), 'update')
+    assert set(statuses.values()) == {'ok'}
+    assert sources(commands) == [['h:dir/./x/', 'h:dir/./y/', 'h:dir/./z/']]
+    assert commands[0][-1] == '%s/' % (tmp_path / 'work')
+
+
+def test_batches_are_split_by_size(tmp_path, make_seelie, monkeypatch):
+    filename = write_config(tmp_path, ['x', 'y', 'z'])
+    commands = []
+
+    def call(args, *rest, **kwargs):
+        commands.append(args)
+        return False
+    monkeypatch.setattr(seelie, 'call', call)
+    monkeypatch.setattr(seelie.RSync, 'batch_size', 2)
+    run(make_seelie(filename), 'update')
+    # the path left over is transferred on its own
+    assert sources(commands) == [['h:dir/./x/', 'h:dir/./y/'],
+            ['h:dir/z/']]
+
+
+def test_paths_named_differently_are_transferred_alone(tmp_path,
+        make_seelie, monkeypatch):
+    filename = write_config(tmp_path, ['x', 'y'],
+            ['h:dir/x/', 'h:dir/other/'])
+    commands = record(monkeypatch)
+    statuses, _ = run(make_seelie(filename), 'update')
+    assert set(statuses.values()) == {'ok'}
+    assert sorted(sources(commands)) == [['h:dir/other/'], ['h:dir/x/']]
+
+
+def test_failed_batches_find_the_paths_with_errors(tmp_path, make_seelie,
+        monkeypatch):
+    filename = write_config(tmp_path, ['x', 'y', 'z'])
+    commands = record(monkeypatch, failing=('h:dir/y/',))
+    statuses, _ = run(make_seelie(filename), 'update')
+    work = tmp_path / 'work'
+    assert statuses == {str(work / 'x'): 'ok', str(work / 'y'): 'error',
+            str(work / 'z'): 'ok'}
+    # the batch, then each path on its own
+    assert sources(commands) == [['h:dir/./x/', 'h:dir/./y/', 'h:dir/./z/'],
+            ['h:dir/x/'], ['h:dir/y/'], ['h:dir/z/']]
@@ -0,0 +1,83 @@
+from conftest import run
+
+import seelie
+
+
+def drain(scheduler):
+    """
+    Starts and finishes groups one at a time, and returns their order.
+    """
+    order = []
+    while True:
+        g = scheduler.next()
+        if g is None:
+            return order
+        order.append(g)
+        scheduler.finish(g)
+
+
+def test_lowest_weight_first():
+    scheduler = seelie.Scheduler(3, {}, [(2,), (0,), (1,)])
+    assert drain(scheduler) == [1, 2, 0]
+
+
+def test_dependencies_finish_first():
+    scheduler = seelie.Scheduler(3, {0: {2}, 1: {0}}, [(0,), (1,), (2,)])
+    assert drain(scheduler) == [2, 0, 1]
+
+
+def test_group_waits_while_its_dependency_runs():
+    scheduler = seelie.Scheduler(2, {1: {0}}, [(0,), (1,)])
+    assert scheduler.next() == 0
+    assert scheduler.next() is None
+    scheduler.finish(0)
+    assert scheduler.next() == 1
+
+
+def test_cycle_is_broken_at_its_lightest_group():
+    scheduler = seelie.Scheduler(3, {0: {1}, 1: {0}, 2: {0}},
+            [(1,), (0,), (2,)])
+    assert drain(scheduler) == [1, 0, 2]
+
+
+def test_held_groups_wait_for_their_local_work():
+    scheduler = seelie.Scheduler(2, {}, [(0,), (1,)], held={0: 2})
+    assert scheduler.next() == 1
+    scheduler.finish(1)
+    scheduler.let_go(0)
+    assert scheduler.next() is None
+    scheduler.let_go(0)
+    assert scheduler.next() == 0
+
+
+def test_host_caps_and_spreading():
+    hosts = ['a', 'a', 'a', 'b']
+    scheduler = seelie.Scheduler(4, {}, [(0,), (0, 1), (0, 2), (0, 3)],
+            hosts=hosts, caps={'a': 1})
+    first = scheduler.next()
+    assert first == 0
+    # host a is busy, so b starts next, and then nothing can
+    assert scheduler.next() == 3
+    assert scheduler.next() is None
+    scheduler.finish(first)
+    assert scheduler.next() == 1
+
+
+def test_after_orders_projects(repos, config, make_seelie):
+    a, b = repos('a'), repos('b')
+    filename = config([('a', [a], {'after': 'b'}), ('b', [b], {})])
+    statuses, order = run(make_seelie(filename), 'push', jobs=4)
+    assert order == [str(b), str(a)]
+
+
+def test_after_cycle_runs_every_project(repos, config, make_seelie):
+    a, b, c = repos('a'), repos('b'), repos('c')
+    filename = config([('a', [a], {'after': 'b'}), ('b', [b], {'after': 'a'}),
+        ('c', [c], {'after': 'a'})])
+    instance = make_seelie(filename)
+    cycles = instance.graph.cycles(instance.graph.after)
+    assert [sorted(instance.projects[i].name for i in x[:-1])
+            for x in cycles] == [['a', 'b']]
+    statuses, order = run(instance, 'push', jobs=4)
+    assert sorted(order) == sorted([str(a), str(b), str(c)])
+    assert order[-1] == str(c)
@@ -0,0 +1,20 @@
+import seelie
+
+
+def test_masters_stop_once_idle(monkeypatch):
+    commands = []
+
+    def call(args, **kwargs):
+        commands.append(args)
+        return 0
+    monkeypatch.setattr(seelie.subprocess, 'call', call)
+    pool = seelie.SSHPool(ssh='ssh', timeout=5)
+    try:
+        path = pool.master('host')
+        assert path is not None and pool.master('host') == path
+        # one master, checked once
+        assert len(commands) == 2
+        assert 'ControlPersist=60' in commands[0]
+        assert not 'ControlPersist=yes' in commands[0]
+    finally:
+        pool.close()
@@ -0,0 +1,106 @@
+import json
+import os
+
+import pytest
+
+from conftest import git, run
+
+import seelie
+
+
+def test_state_round_trip(tmp_path):
+    filename = str(tmp_path / 'state' / 'state.json')
+    state = seelie.SeelieState(filename)
+    state.set('/a', 'push', {'tree': [1, 2, 3]})
+    state.set('/b', 'maintained', 5.0)
+    state.discard('/b', 'maintained')
+    state.discard('/c', 'push')
+    state.save()
+    assert [x for x in os.listdir(tmp_path / 'state')] == ['state.json']
+    state = seelie.SeelieState(filename)
+    assert state.get('/a', 'push') == {'tree': [1, 2, 3]}
+    assert state.get('/b', 'maintained') is None
+    assert state.paths == {'/a': {'push': {'tree': [1, 2, 3]}}}
+
+
+def test_broken_state_is_empty(tmp_path):
+    filename = tmp_path / 'state.json'
+    filename.write_text('{"paths": ')
+    assert seelie.SeelieState(str(filename)).get('/a', 'push', 'none') == (
+            'none')
+
+
+def test_unchanged_repositories_are_skipped(repos, config, make_seelie,
+        tmp_path):
+    a = repos('a')
+    filename = config([('a', [a], {})])
+    remote = tmp_path / 'remotes' / 'a.git'
+    (a / 'file').write_text('changed\n')
+    assert run(make_seelie(filename), 'push')[0] == {str(a): 'ok'}
+    state = json.loads((tmp_path / 'state.json').read_text())
+    # paths are kept as they're synchronized, with a trailing slash
+    assert 'push' in state['paths'][os.path.join(str(a), '')]
+    assert run(make_seelie(filename), 'push')[0] == {str(a): 'skipped'}
+    # force pushes all the same, with nothing new to push
+    assert run(make_seelie(filename), 'push', force=True)[0] == {
+            str(a): 'skipped'}
+    assert git(remote, 'rev-parse', 'master') == git(a, 'rev-parse', 'HEAD')
+
+
+def test_changes_invalidate_the_state(repos, config, make_seelie, tmp_path):
+    a = repos('a')
+    filename = config([('a', [a], {})])
+    remote = tmp_path / 'remotes' / 'a.git'
+    run(make_seelie(filename), 'push')
+    # a changed file
+    (a / 'file').write_text('changed again\n')
+    assert run(make_seelie(filename), 'push')[0] == {str(a): 'ok'}
+    assert git(a, 'status', '--porcelain') == ''
+    # a new file in a new directory
+    (a / 'dir').mkdir()
+    (a / 'dir' / 'new').write_text('new\n')
+    assert run(make_seelie(filename), 'push')[0] == {str(a): 'ok'}
+    assert git(remote, 'show', 'master:dir/new') == 'new'
+    # a commit made outside seelie
+    (a / 'file').write_text('committed by hand\n')
+    git(a, 'commit', '-q', '-a', '-m', 'by hand')
+    assert run(make_seelie(filename), 'push')[0] == {str(a): 'ok'}
+    assert git(remote, 'rev-parse', 'master') == git(a, 'rev-parse', 'HEAD')
+
+
+def test_failed_push_forgets_the_state(repos, config, make_seelie, tmp_path):
+    a = repos('a')
+    filename = config([('a', [a], {})])
+    run(make_seelie(filename), 'push')
+    (a / 'file').write_text('changed\n')
+    remote = tmp_path / 'remotes' / 'a.git'
+    os.rename(remote, str(remote) + '.away')
+    assert run(make_seelie(filename), 'push')[0] == {str(a): 'error'}
+    state = json.loads((tmp_path / 'state.json').read_text())
+    assert not 'push' in state['paths'].get(os.path.join(str(a), ''), {})
+
+
+def test_unsaveable_state_leaves_the_old_file(tmp_path):
+    filename = str(tmp_path / 'state' / 'state.json')
+    state = seelie.SeelieState(filename)
+    state.set('/a', 'push', {'tree': [1]})
+    state.save()
+    state.set('/b', 'push', {'tree': object()})
+    state.save()
+    assert os.listdir(tmp_path / 'state') == ['state.json']
+    state = seelie.SeelieState(filename)
+    assert state.get('/a', 'push') == {'tree': [1]}
+    assert state.get('/b', 'push') is None
+
+
+def test_failed_writes_leave_no_temporary_files(tmp_path):
+    filename = str(tmp_path / 'dir' / 'file')
+    seelie.save_atomic(filename, lambda f: f.write(b'old'))
+
+    def broken(f):
+        f.write(b'half')
+        raise KeyboardInterrupt()
+    with pytest.raises(KeyboardInterrupt):
+        seelie.save_atomic(filename, broken)
+    assert os.listdir(tmp_path / 'dir') == ['file']
+    assert (tmp_path / 'dir' / 'file').read_bytes() == b'old'
@@ -0,0 +1,78 @@
+import time
+
+import seelie
+
+
+class ScriptedWatcher(seelie.Watcher):
+
+    """
+    A watcher that reports the changes it's given, one set for each wait,
+    and interrupts the watch once they run out.
+    """
+
+    def __init__(self, changes, pause=0.0):
+        self.changes = list(changes)
+        self.pause = pause
+        self.roots = []
+        self.timeouts = []
+
+    def add(self, root):
+        self.roots.append(root)
+
+    def wait(self, timeout=None):
+        self.timeouts.append(timeout)
+        if(not self.changes):
+            raise KeyboardInterrupt()
+        time.sleep(self.pause)
+        return self.changes.pop(0)
+
+
+def record(monkeypatch, stop_after=None):
+    """
+    Replaces the pushes of watch with a stand-in that records the paths of
+    each push, and interrupts the watch after stop_after pushes.
+    """
+    pushes = []
+
+    def push_paths(self, items, verbose=False, jobs=1):
+        pushes.append([x.key for x in items])
+        if(len(pushes) == stop_after):
+            raise KeyboardInterrupt()
+    monkeypatch.setattr(seelie.Seelie, 'push_paths', push_paths)
+    return pushes
+
+
+def test_bursts_of_changes_are_pushed_together(repos, config, make_seelie,
+        monkeypatch):
+    a, b = str(repos('a')), str(repos('b'))
+    filename = config([('p', [a, b], {})])
+    pushes = record(monkeypatch)
+    watcher = ScriptedWatcher([{a}, {b}, set(), {a}, set()])
+    make_seelie(filename).watch(delay=2.0, watcher=watcher)
+    assert sorted(watcher.roots) == [a, b]
+    assert pushes == [[a, b], [a]]
+    # waits without changes pending have no end
+    assert watcher.timeouts == [None, 2.0, 2.0, None, 2.0, None]
+
+
+def test_endless_bursts_are_pushed_eventually(repos, config, make_seelie,
+        monkeypatch):
+    a = str(repos('a'))
+    filename = config([('p', [a], {})])
+    pushes = record(monkeypatch, stop_after=1)
+    watcher = ScriptedWatcher([{a}] * 100, pause=0.01)
+    make_seelie(filename).watch(delay=0.01, watcher=watcher)
+    assert pushes == [[a]]
+    # the push comes once the burst has gone on for ten delays
+    assert 10 <= len(watcher.timeouts) < 100
+
+
+def test_polling_finds_changes_outside_git(tmp_path):
+    root = tmp_path / 'root'
+    (root / '.git').mkdir(parents=True)
+    watcher = seelie.PollingWatcher(interval=0.01)
+    watcher.add(str(root))
+    (root / '.git' / 'index').write_text('ignored\n')
+    assert watcher.wait(0.05) == set()
+    (root / 'file').write_text('changed\n')
+    assert watcher.wait(1.0) == {str(root)}